@@ -2,6 +2,10 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import CustomUser
 from allauth.account.forms import SignupForm
+from reviews.forms import imagen_subida
+
+# Los avatares se guardan chicos: se muestran a 128px como mucho
+AVATAR_MAX_LADO = 512
 
 
 # Formulario personalizado para el registro desde el admin
@@ -10,6 +14,9 @@ class CustomUserCreationForm(UserCreationForm):
         model = CustomUser
         fields = ('email', 'username', 'first_name', 'last_name', 'avatar')
 
+    def clean_avatar(self):
+        return imagen_subida(self.cleaned_data.get('avatar'), max_lado=AVATAR_MAX_LADO)
+
 
 # Formulario personalizado para el registro con django-allauth
 class CustomSignupForm(SignupForm):
@@ -28,12 +35,18 @@ class CustomUserChangeForm(forms.ModelForm):
         model = CustomUser
         fields = ['username', 'email', 'first_name', 'last_name', 'avatar']
 
+    def clean_avatar(self):
+        return imagen_subida(self.cleaned_data.get('avatar'), max_lado=AVATAR_MAX_LADO)
+
         # Formulario específico para dueños de café
 class OwnerSignupForm(UserCreationForm):
     class Meta:
         model = CustomUser
         fields = ('email', 'username', 'first_name', 'last_name', 'avatar', 'password1', 'password2')
 
+    def clean_avatar(self):
+        return imagen_subida(self.cleaned_data.get('avatar'), max_lado=AVATAR_MAX_LADO)
+
     def save(self, commit=True):
         user = super().save(commit=False)
         user.is_owner = True  # Marca como dueño automáticamente
@@ -1,6 +1,7 @@
 from pathlib import Path
 from decouple import config
 import dj_database_url
+import logging
 import sys
 
 # ======================================================
@@ -76,6 +77,8 @@ MIDDLEWARE = [
 
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+
+    "core.rate_limit.RateLimitHeadersMiddleware",
 ]
 
 
@@ -145,6 +148,63 @@ EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD", default="")
 
 DEFAULT_FROM_EMAIL = "Gota <no_reply@gogota.ar>"
 
+# ======================================================
+# CACHE
+# ======================================================
+# L1 en memoria de cada worker delante de un L2 compartido por todos
+# (core.cache_backends.TieredCache). El L2 es Redis si hay REDIS_URL, la
+# tabla de la base en producción (`createcachetable`) y memoria local en
+# dev. Sin Redis los contadores (rate limit, vistas) pueden perder cuentas
+# con mucho tráfico: el incr de DatabaseCache lee y escribe por separado
+REDIS_URL = config("REDIS_URL", default="")
+
+if REDIS_URL:
+    CACHE_L2 = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    }
+elif DEBUG:
+    CACHE_L2 = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "gota-shared",
+    }
+else:
+    logging.getLogger(__name__).warning(
+        "Sin REDIS_URL: el cache compartido usa la base; los contadores no son atómicos."
+    )
+    CACHE_L2 = {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "django_cache",
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    }
+
+CACHES = {
+    "default": {
+        "BACKEND": "core.cache_backends.TieredCache",
+        "OPTIONS": {
+            "L2": "shared",
+            "L1_TTL": 5,
+            "L1_MAX_ENTRIES": 1000,
+            "SYNC_INTERVAL": 1,
+            # Contadores (rate limit, vistas): siempre contra el L2
+            "L1_EXCLUDE_PREFIXES": ["rl:", "vistas:"],
+        },
+    },
+    "shared": CACHE_L2,
+}
+
+# ======================================================
+# TAREAS EN SEGUNDO PLANO (core.jobs)
+# ======================================================
+# En eager se ejecutan en el mismo proceso al confirmar la transacción;
+# si no, se guardan en la tabla y las corre `manage.py run_jobs`
+JOBS_EAGER = config("JOBS_EAGER", default=DEBUG, cast=bool)
+
+# Carteles QR (reviews.utils.qr_posters): procesos para renderizar y cache
+# en disco de los PNG ya generados
+QR_POSTER_WORKERS = config("QR_POSTER_WORKERS", default=2, cast=int)
+QR_POSTER_CACHE_DIR = config("QR_POSTER_CACHE_DIR", default="/tmp/gota-qr-posters")
+
 
 
 # ======================================================
@@ -193,6 +253,15 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
+    # Proxies propios delante de la app (en Heroku, 1: el router). Con 0
+    # la IP del cliente es REMOTE_ADDR y se ignora X-Forwarded-For
+    "NUM_PROXIES": config("NUM_PROXIES", default=0, cast=int),
+    # Tasas de core.rate_limit.RateLimitThrottle (por `throttle_scope`)
+    "DEFAULT_THROTTLE_RATES": {
+        "mobile_write": "30/min",
+        "mobile_review": "10/hour",
+        "mobile_report": "10/hour",
+    },
 }
 
 LOGGING = {
@@ -232,11 +301,15 @@ CLOUDINARY_STORAGE = {
 
 # STORAGE CONFIG (DJANGO 4+)
 # STORAGE CONFIG (DJANGO 4+)
+# "archivos": descargas generadas (ZIP de QRs), no imágenes
 if "test" in sys.argv:
     STORAGES = {
         "default": {
             "BACKEND": "django.core.files.storage.FileSystemStorage",
         },
+        "archivos": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+        },
         "staticfiles": {
             "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
         },
@@ -246,6 +319,9 @@ else:
         "default": {
             "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage",
         },
+        "archivos": {
+            "BACKEND": "cloudinary_storage.storage.RawMediaCloudinaryStorage",
+        },
         "staticfiles": {
             "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
         },
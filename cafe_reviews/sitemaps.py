@@ -1,6 +1,36 @@
+"""
+Sitemap del sitio (páginas estáticas + cafés), generado una sola vez y
+servido desde el cache.
+
+- El `lastmod` de cada café sale de la misma consulta que lista los
+  cafés (última reseña agrupada por café), sin una consulta por café.
+- Si los cafés no entran en una sola página (`LIMITE_POR_PAGINA`),
+  /sitemap.xml pasa a ser un índice que apunta a /sitemap-<sección>.xml.
+- Lo generado se guarda comprimido en gzip con una key que incluye la
+  versión "sitemap"; las señales de `Cafe` y `Review` la suben. Se sirve
+  con ETag y Last-Modified, así los buscadores reciben 304 si nada cambió.
+"""
+
+import gzip
+import hashlib
+import re
+
 from django.contrib.sitemaps import Sitemap
-from django.urls import reverse
+from django.contrib.sitemaps import views as sitemap_views
+from django.core.cache import cache
 from django.db.models import Max
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from reviews.utils.cache import get_version
+
+# Google acepta hasta 50.000; más chico = páginas más livianas de regenerar
+LIMITE_POR_PAGINA = 5000
+CACHE_TTL = 6 * 60 * 60
+
+_ACEPTA_GZIP = re.compile(r"\bgzip\b")
 
 
 class StaticSitemap(Sitemap):
@@ -44,18 +74,25 @@ class CafeSitemap(Sitemap):
 
     changefreq = "monthly"
     priority = 0.7
+    limit = LIMITE_POR_PAGINA
 
     def items(self):
         # ✅ IMPORT DIFERIDO (CLAVE)
         from reviews.models import Cafe
-        return Cafe.objects.only("id", "updated_at")
+
+        # Última reseña de cada café en la misma consulta (GROUP BY)
+        return (
+            Cafe.objects
+            .annotate(last_review_at=Max("reviews__created_at"))
+            .only("id", "updated_at")
+            .order_by("id")
+        )
 
     def location(self, obj):
         return reverse("reviews:cafe_detail", kwargs={"cafe_id": obj.id})
 
     def lastmod(self, obj):
-        last_review = obj.reviews.aggregate(last=Max("created_at")).get("last")
-        return last_review or obj.updated_at
+        return obj.last_review_at or obj.updated_at
 
 
 # ✅ diccionario FINAL (instancias, no clases)
@@ -63,3 +100,73 @@ sitemaps = {
     "static": StaticSitemap(),
     "cafes": CafeSitemap(),
 }
+
+
+# ---------------------------------
+# Generación y cache
+# ---------------------------------
+def ultima_modificacion():
+    """Fecha del último cambio de un café o reseña (None si no hay cafés)."""
+    from reviews.models import Cafe
+
+    fechas = Cafe.objects.aggregate(cafe=Max("updated_at"), review=Max("reviews__created_at"))
+    fechas = [fecha for fecha in fechas.values() if fecha]
+    return max(fechas) if fechas else None
+
+
+def _necesita_indice():
+    return any(site.paginator.num_pages > 1 for site in sitemaps.values())
+
+
+def _generar(request, section):
+    if section is None and _necesita_indice():
+        response = sitemap_views.index(request, sitemaps, sitemap_url_name="sitemap_section")
+    else:
+        response = sitemap_views.sitemap(request, sitemaps, section=section)
+    response.render()
+
+    ultima = ultima_modificacion()
+    return {
+        "gzip": gzip.compress(response.content),
+        "etag": hashlib.md5(response.content).hexdigest(),
+        "last_modified": int(ultima.timestamp()) if ultima else None,
+    }
+
+
+def servir_sitemap(request, section=None):
+    """
+    Respuesta del sitemap (o del índice) para el request, generándolo
+    solo si cambió algo desde la última vez.
+    """
+    pagina = request.GET.get("p", "1")
+    key = (
+        f"sitemap:{get_version('sitemap')}:{request.scheme}:"
+        f"{request.get_host()}:{section or '-'}:{pagina}"
+    )
+    datos = cache.get(key)
+    if datos is None:
+        # Sección o página inexistente: el 404 de Django sale de acá
+        datos = _generar(request, section)
+        cache.set(key, datos, CACHE_TTL)
+
+    comprimido = bool(_ACEPTA_GZIP.search(request.headers.get("Accept-Encoding", "")))
+    etag = f'"{datos["etag"]}{"-gz" if comprimido else ""}"'
+
+    response = HttpResponse(
+        datos["gzip"] if comprimido else gzip.decompress(datos["gzip"]),
+        content_type="application/xml; charset=utf-8",
+    )
+    if comprimido:
+        response["Content-Encoding"] = "gzip"
+    response["ETag"] = etag
+    if datos["last_modified"] is not None:
+        response["Last-Modified"] = http_date(datos["last_modified"])
+    response["Cache-Control"] = "public, max-age=3600"
+    patch_vary_headers(response, ("Accept-Encoding",))
+
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=datos["last_modified"],
+        response=response,
+    )
@@ -6,9 +6,6 @@ from django.urls import path, include, re_path
 from django.views.static import serve
 from django.views.generic import RedirectView, TemplateView
 
-from django.contrib.sitemaps.views import sitemap
-from cafe_reviews.sitemaps import sitemaps
-
 from rest_framework.routers import DefaultRouter
 from reviews.api import CafeViewSet
 
@@ -45,14 +42,6 @@ urlpatterns = [
         name="robots_txt",
     ),
 
-    # sitemap
-    path(
-        "sitemap.xml",
-        sitemap,
-        {"sitemaps": sitemaps},
-        name="django_sitemap",
-    ),
-
     # favicon
     path(
         "favicon.ico",
@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "attempts", "run_after", "finished_at")
+    list_filter = ("status", "name")
+    search_fields = ("name", "last_error")
+    readonly_fields = ("created_at", "finished_at", "locked_at", "last_error")
@@ -0,0 +1,259 @@
+"""
+Cache en dos niveles: L1 en memoria de cada proceso delante de un L2
+compartido (Redis, tabla de la base, ...).
+
+    CACHES = {
+        "default": {
+            "BACKEND": "core.cache_backends.TieredCache",
+            "OPTIONS": {"L2": "shared", "L1_TTL": 5, "L1_MAX_ENTRIES": 1000},
+        },
+        "shared": {...},
+    }
+
+- L1: LRU chico, cada entrada vive como mucho `L1_TTL` segundos.
+- Cada escritura sube un sello de generación guardado en el L2: uno por
+  grupo de keys (`GENERATION_BUCKETS` grupos, por hash de la key). Cada
+  proceso trae todos los sellos en un solo `get_many` como mucho cada
+  `SYNC_INTERVAL` segundos y saca de su L1 solo las entradas de los
+  grupos que otro proceso escribió. Así una invalidación llega a todos
+  los workers en `SYNC_INTERVAL`, una escritura no vacía el L1 entero y
+  ningún L1 sirve nada más viejo que `L1_TTL`.
+- Las keys con prefijo en `L1_EXCLUDE_PREFIXES` (contadores del rate
+  limit, vistas) van directo al L2 y no suben el sello.
+- `stats()` devuelve hits y misses de cada nivel (por proceso).
+"""
+
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+GENERATION_KEY = "tiered:generation"
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._l2_alias = options.get("L2", "shared")
+        self._l1_ttl = options.get("L1_TTL", 5)
+        self._l1_max_entries = options.get("L1_MAX_ENTRIES", 1000)
+        self._sync_interval = options.get("SYNC_INTERVAL", 1)
+        self._exclude = tuple(options.get("L1_EXCLUDE_PREFIXES", ("rl:",)))
+        self._buckets = options.get("GENERATION_BUCKETS", 64)
+        self._generation_keys = [f"{GENERATION_KEY}:{bucket}" for bucket in range(self._buckets)]
+
+        # L1: (key, version) -> (vence, grupo, valor serializado)
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        # Último sello visto de cada grupo
+        self._generations = {}
+        self._synced_at = 0.0
+        self._stats = {"l1_hits": 0, "l1_misses": 0, "l2_hits": 0, "l2_misses": 0}
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    # ---------------------------------
+    # L1
+    # ---------------------------------
+    def _bucket(self, key):
+        # crc32 y no hash(): tiene que dar lo mismo en todos los procesos
+        return zlib.crc32(str(key).encode()) % self._buckets
+
+    def _drop_buckets(self, buckets):
+        """Saca del L1 las entradas de esos grupos (con el lock tomado)."""
+        for l1_key in [k for k, entry in self._l1.items() if entry[1] in buckets]:
+            del self._l1[l1_key]
+
+    def _sync(self):
+        """Saca del L1 los grupos que otro proceso escribió desde la última consulta."""
+        now = time.monotonic()
+        if now - self._synced_at < self._sync_interval:
+            return
+        sellos = self.l2.get_many(self._generation_keys)
+        with self._lock:
+            cambiados = set()
+            for bucket, generation_key in enumerate(self._generation_keys):
+                generation = sellos.get(generation_key)
+                if generation != self._generations.get(bucket):
+                    cambiados.add(bucket)
+                    self._generations[bucket] = generation
+            if cambiados:
+                self._drop_buckets(cambiados)
+            self._synced_at = now
+
+    def _bump_generation(self, keys):
+        for bucket in {self._bucket(key) for key in keys}:
+            generation_key = self._generation_keys[bucket]
+            try:
+                generation = self.l2.incr(generation_key)
+            except ValueError:
+                self.l2.add(generation_key, 0, None)
+                generation = self.l2.incr(generation_key)
+            with self._lock:
+                # Si la única escritura nueva del grupo es la nuestra, sigue al día
+                anterior = self._generations.get(bucket)
+                if anterior is None or generation != anterior + 1:
+                    self._drop_buckets({bucket})
+                self._generations[bucket] = generation
+
+    def _l1_key(self, key, version):
+        return (key, self.version if version is None else version)
+
+    def _usa_l1(self, key):
+        return not (self._exclude and str(key).startswith(self._exclude))
+
+    def _l1_get(self, l1_key):
+        with self._lock:
+            entry = self._l1.get(l1_key)
+            if entry is None:
+                return _MISSING
+            expires_at, _, data = entry
+            if expires_at <= time.monotonic():
+                del self._l1[l1_key]
+                return _MISSING
+            self._l1.move_to_end(l1_key)
+        return pickle.loads(data)
+
+    def _l1_set(self, l1_key, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self._l1_ttl
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            if timeout <= 0:
+                self._l1_delete(l1_key)
+                return
+            ttl = min(ttl, timeout)
+        # Se guarda serializado, como LocMemCache: nadie comparte el objeto
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1[l1_key] = (time.monotonic() + ttl, self._bucket(l1_key[0]), data)
+            self._l1.move_to_end(l1_key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, l1_key):
+        with self._lock:
+            self._l1.pop(l1_key, None)
+
+    def _count(self, name):
+        self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "l1_entries": len(self._l1)}
+
+    # ---------------------------------
+    # API de cache
+    # ---------------------------------
+    def get(self, key, default=None, version=None):
+        if self._usa_l1(key):
+            self._sync()
+            value = self._l1_get(self._l1_key(key, version))
+            if value is not _MISSING:
+                self._count("l1_hits")
+                return value
+            self._count("l1_misses")
+
+        value = self.l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count("l2_misses")
+            return default
+
+        self._count("l2_hits")
+        if self._usa_l1(key):
+            self._l1_set(self._l1_key(key, version), value)
+        return value
+
+    def get_many(self, keys, version=None):
+        encontrados = {}
+        faltan = []
+        for key in keys:
+            if not self._usa_l1(key):
+                faltan.append(key)
+                continue
+            self._sync()
+            value = self._l1_get(self._l1_key(key, version))
+            if value is _MISSING:
+                self._count("l1_misses")
+                faltan.append(key)
+            else:
+                self._count("l1_hits")
+                encontrados[key] = value
+
+        if faltan:
+            # Lo que no está en el L1 se trae del L2 en un solo viaje
+            del_l2 = self.l2.get_many(faltan, version=version)
+            for key in faltan:
+                if key not in del_l2:
+                    self._count("l2_misses")
+                    continue
+                self._count("l2_hits")
+                encontrados[key] = del_l2[key]
+                if self._usa_l1(key):
+                    self._l1_set(self._l1_key(key, version), del_l2[key])
+        return encontrados
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        if self._usa_l1(key):
+            self._bump_generation([key])
+            self._l1_set(self._l1_key(key, version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added and self._usa_l1(key):
+            # La key no existía: ningún L1 tiene un valor que invalidar
+            self._l1_set(self._l1_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.l2.delete(key, version=version)
+        if self._usa_l1(key):
+            self._l1_delete(self._l1_key(key, version))
+            self._bump_generation([key])
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        if self._usa_l1(key):
+            self._l1_delete(self._l1_key(key, version))
+            self._bump_generation([key])
+        return value
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version)
+        locales = [key for key in data if self._usa_l1(key) and key not in failed]
+        if locales:
+            self._bump_generation(locales)
+            for key in locales:
+                self._l1_set(self._l1_key(key, version), data[key], timeout)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version=version)
+        locales = [key for key in keys if self._usa_l1(key)]
+        if locales:
+            for key in locales:
+                self._l1_delete(self._l1_key(key, version))
+            self._bump_generation(locales)
+
+    def clear(self):
+        self.l2.clear()
+        with self._lock:
+            self._l1.clear()
+            self._generations = {}
+            self._synced_at = 0.0
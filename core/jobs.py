@@ -0,0 +1,168 @@
+"""
+Cola de tareas en segundo plano sobre la base (tabla `core.Job`).
+
+Los efectos secundarios lentos (emails, pings a buscadores) se encolan
+con `enqueue` dentro de la misma transacción que los origina y los
+ejecuta un proceso aparte (`manage.py run_jobs`), que también borra
+las terminadas hace más de `PURGE_AFTER`. Con `JOBS_EAGER` (por defecto
+en DEBUG) se ejecutan en el mismo proceso al confirmar la transacción,
+sin pasar por la tabla; en DEBUG los errores se propagan.
+
+    @job("reviews.ping_sitemap")
+    def ping_sitemap():
+        ...
+
+    enqueue("reviews.ping_sitemap", delay=600, dedupe_key="ping_sitemap")
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30
+# Una tarea "en curso" más vieja que esto quedó de un worker que murió
+STALE_AFTER = timedelta(minutes=10)
+# Las tareas terminadas bien se borran pasado este tiempo (las fallidas
+# quedan para revisarlas)
+PURGE_AFTER = timedelta(days=7)
+
+_registry = {}
+
+
+def job(name):
+    """Registra la función como tarea; recibe el payload como kwargs."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def _is_eager():
+    return getattr(settings, "JOBS_EAGER", False)
+
+
+def _run_eager(name, payload, dedupe_key=""):
+    if dedupe_key:
+        # Como `_claim`: mientras corre se puede volver a encolar
+        cache.delete(f"jobs:dedupe:{dedupe_key}")
+    try:
+        _registry[name](**payload)
+    except Exception:
+        logger.exception("Falló la tarea %s", name)
+        if settings.DEBUG:
+            raise
+
+
+def enqueue(name, payload=None, *, delay=0, dedupe_key=""):
+    """
+    Encola la tarea `name`. Con `dedupe_key`, si ya hay una pendiente con
+    la misma key no se agrega otra: junto con `delay` (segundos) sirve para
+    agrupar muchos avisos en uno solo por ventana de tiempo.
+    """
+    if name not in _registry:
+        raise KeyError(f"Tarea desconocida: {name}")
+    payload = payload or {}
+
+    if _is_eager():
+        # Sin tabla: la ventana de agrupamiento se lleva en el cache
+        if dedupe_key and not cache.add(f"jobs:dedupe:{dedupe_key}", True, max(delay, 1)):
+            return None
+        # Con `delay` la key es una ventana: dura aunque ya haya corrido
+        liberar = "" if delay else dedupe_key
+        transaction.on_commit(lambda: _run_eager(name, payload, liberar))
+        return None
+
+    run_after = timezone.now() + timedelta(seconds=delay)
+    if not dedupe_key:
+        return Job.objects.create(name=name, payload=payload, run_after=run_after)
+
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                name=name, payload=payload, run_after=run_after, dedupe_key=dedupe_key,
+            )
+    except IntegrityError:
+        # Ya hay una pendiente con esa key: se ejecuta esa
+        return None
+
+
+def _claim():
+    """Toma la próxima tarea lista, sin pisarse con otros workers."""
+    now = timezone.now()
+    with transaction.atomic():
+        job_obj = (
+            Job.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status=Job.PENDING, run_after__lte=now) |
+                Q(status=Job.RUNNING, locked_at__lt=now - STALE_AFTER)
+            )
+            .order_by("run_after", "id")
+            .first()
+        )
+        if job_obj is None:
+            return None
+
+        job_obj.status = Job.RUNNING
+        job_obj.locked_at = now
+        job_obj.attempts += 1
+        # Sin key mientras corre: la misma tarea se puede volver a encolar
+        job_obj.dedupe_key = ""
+        job_obj.save(update_fields=["status", "locked_at", "attempts", "dedupe_key"])
+        return job_obj
+
+
+def _run(job_obj):
+    func = _registry.get(job_obj.name)
+    try:
+        if func is None:
+            raise KeyError(f"Tarea desconocida: {job_obj.name}")
+        func(**job_obj.payload)
+    except Exception as exc:
+        logger.exception("Falló la tarea %s (#%s)", job_obj.name, job_obj.pk)
+        job_obj.last_error = repr(exc)
+        if job_obj.attempts < MAX_ATTEMPTS:
+            job_obj.status = Job.PENDING
+            job_obj.run_after = timezone.now() + timedelta(
+                seconds=RETRY_BASE_SECONDS * 2 ** (job_obj.attempts - 1)
+            )
+        else:
+            job_obj.status = Job.FAILED
+            job_obj.finished_at = timezone.now()
+        job_obj.save(update_fields=["status", "run_after", "last_error", "finished_at"])
+        return False
+
+    job_obj.status = Job.DONE
+    job_obj.finished_at = timezone.now()
+    job_obj.save(update_fields=["status", "finished_at"])
+    return True
+
+
+def run_pending(limit=100):
+    """Ejecuta hasta `limit` tareas listas. Devuelve cuántas se corrieron."""
+    ran = 0
+    while ran < limit:
+        job_obj = _claim()
+        if job_obj is None:
+            break
+        _run(job_obj)
+        ran += 1
+    return ran
+
+
+def purge_done(older_than=PURGE_AFTER):
+    """Borra las tareas terminadas bien hace más de `older_than`. Devuelve cuántas."""
+    deleted, _ = Job.objects.filter(
+        status=Job.DONE, finished_at__lt=timezone.now() - older_than,
+    ).delete()
+    return deleted
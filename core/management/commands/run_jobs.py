@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.jobs import purge_done, run_pending
+
+# Cada cuánto el worker borra las tareas terminadas viejas (segundos)
+PURGE_EVERY = 60 * 60
+
+
+class Command(BaseCommand):
+    help = "Ejecuta las tareas en segundo plano pendientes (worker)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Corre lo pendiente y termina (por defecto queda escuchando).",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Segundos de espera cuando no hay tareas.",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=100,
+            help="Máximo de tareas por vuelta.",
+        )
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            total = run_pending(options["batch"])
+            borradas = purge_done()
+            self.stdout.write(self.style.SUCCESS(
+                f"Listo: {total} tareas ejecutadas, {borradas} terminadas borradas."
+            ))
+            return
+
+        self.stdout.write("Worker de tareas iniciado.")
+        proxima_purga = 0.0
+        while True:
+            close_old_connections()
+            if time.monotonic() >= proxima_purga:
+                purge_done()
+                proxima_purga = time.monotonic() + PURGE_EVERY
+            if not run_pending(options["batch"]):
+                time.sleep(options["sleep"])
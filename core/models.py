@@ -1,3 +1,53 @@
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 
-# Create your models here.
+
+class Job(models.Model):
+    """
+    Tarea en segundo plano (outbox). Se guarda en la misma transacción que
+    el cambio que la origina y la ejecuta `manage.py run_jobs`.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (PENDING, "Pendiente"),
+        (RUNNING, "En curso"),
+        (DONE, "Terminada"),
+        (FAILED, "Fallida"),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+
+    # Para agrupar: solo puede haber una pendiente con la misma key
+    dedupe_key = models.CharField(max_length=100, blank=True, default="")
+
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["run_after", "id"]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedupe_key"],
+                condition=Q(status="pending") & ~Q(dedupe_key=""),
+                name="job_pending_dedupe_key_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
@@ -1,33 +1,219 @@
+"""
+Rate limiting sobre el cache, compartido entre workers.
+
+Ventana deslizante aproximada con dos contadores fijos: el de la ventana
+actual y el de la anterior, pesado por lo que queda de ella adentro de
+los últimos `window_seconds`. Cada contador se crea con `cache.add` (el
+TTL se fija una sola vez) y se incrementa con `cache.incr`, que es atómico
+en Redis/Memcached/LocMem: sin carreras entre lectura y escritura.
+
+Se usa de tres formas:
+  - `rate_limit(...)`: chequeo dentro de una vista (devuelve la respuesta
+    de rechazo o None).
+  - `@rate_limited(...)`: decorador para vistas de Django.
+  - `RateLimitThrottle`: throttle de DRF con `throttle_scope` en la vista.
+
+`RateLimitHeadersMiddleware` agrega a la respuesta los headers
+X-RateLimit-Limit / -Remaining / -Reset del límite más ajustado.
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from functools import wraps
+
+from django.contrib import messages
 from django.core.cache import cache
 from django.http import JsonResponse
 from django.shortcuts import redirect
-from django.contrib import messages
-import time
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_MESSAGE = "Demasiadas acciones. Probá más tarde."
+
+_PERIODOS = {"s": 1, "m": 60, "h": 60 * 60, "d": 60 * 60 * 24}
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int  # segundos hasta que se libera cupo
+
+
+def _incr(key, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Expiró entre el add y el incr
+        cache.add(key, 1, timeout)
+        return 1
+
+
+def hit(key, limit, window_seconds, *, request=None):
+    """
+    Registra un intento para `key` y dice si entra en `limit` por cada
+    `window_seconds`. Con `request`, el resultado queda disponible para
+    los headers de la respuesta.
+    """
+    now = time.time()
+    ventana = int(now // window_seconds)
+    transcurrido = (now % window_seconds) / window_seconds
+
+    actual = _incr(f"rl:{key}:{ventana}", window_seconds * 2)
+    anterior = cache.get(f"rl:{key}:{ventana - 1}", 0)
+
+    estimado = anterior * (1 - transcurrido) + actual
+    result = RateLimitResult(
+        allowed=estimado <= limit,
+        limit=limit,
+        remaining=max(0, limit - math.ceil(estimado)),
+        reset=max(1, math.ceil(window_seconds * (1 - transcurrido))),
+    )
+
+    if request is not None:
+        _registrar(request, result)
+    return result
+
+
+def _registrar(request, result):
+    # Si hay más de un límite en el mismo request, manda el más ajustado
+    previo = getattr(request, "_rate_limit", None)
+    if previo is None or result.remaining < previo.remaining or not result.allowed:
+        request._rate_limit = result
+
+
+def _rechazo(request, ajax, message):
+    if ajax:
+        return JsonResponse(
+            {"ok": False, "error": "rate_limited", "message": message},
+            status=429
+        )
+    if request is not None:
+        messages.warning(request, message)
+    return redirect("reviews:cafe_list")
+
 
 def rate_limit(
     key: str,
     limit: int,
     window_seconds: int,
     *,
+    request=None,
     ajax=False,
-    message="Demasiadas acciones. Probá más tarde."
+    message=DEFAULT_MESSAGE
+):
+    """Devuelve la respuesta de rechazo si se pasó del límite, si no None."""
+    if hit(key, limit, window_seconds, request=request).allowed:
+        return None
+    return _rechazo(request, ajax, message)
+
+
+def client_ip(request):
+    """
+    IP del cliente. Con REST_FRAMEWORK["NUM_PROXIES"] proxies propios
+    adelante se toma la entrada de X-Forwarded-For que agregó el primero
+    de ellos (como DRF): las anteriores las manda el cliente. Sin proxies
+    configurados o sin el header, REMOTE_ADDR.
+    """
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    proxies = api_settings.NUM_PROXIES or 0
+    if forwarded and proxies > 0:
+        direcciones = forwarded.split(",")
+        return direcciones[-min(proxies, len(direcciones))].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _ident(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"u{user.pk}"
+    return f"ip{client_ip(request)}"
+
+
+def rate_limited(
+    limit,
+    window_seconds,
+    *,
+    scope=None,
+    key=None,
+    methods=("POST",),
+    message=DEFAULT_MESSAGE
 ):
-    now = int(time.time())
-    data = cache.get(key, {"count": 0, "reset": now + window_seconds})
+    """
+    Decorador para vistas. La key es el usuario (o la IP si es anónimo)
+    dentro de `scope` (por defecto, el nombre de la vista); `key` puede
+    ser una función `request -> str` para otra cosa. Responde JSON 429 a
+    los pedidos AJAX y redirige con un mensaje al resto.
+    """
+    def decorator(view_func):
+        nombre = scope or view_func.__name__
+
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                ident = key(request) if key else _ident(request)
+                ajax = request.headers.get("x-requested-with") == "XMLHttpRequest"
+                rechazo = rate_limit(
+                    f"{nombre}:{ident}", limit, window_seconds,
+                    request=request, ajax=ajax, message=message,
+                )
+                if rechazo is not None:
+                    return rechazo
+            return view_func(request, *args, **kwargs)
+
+        return _wrapped
+    return decorator
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60), con el mismo formato que DRF."""
+    num, periodo = rate.split("/")
+    return int(num), _PERIODOS[periodo[0]]
+
+
+class RateLimitThrottle(BaseThrottle):
+    """
+    Throttle de DRF sobre `hit`. La vista define `throttle_scope` y la
+    tasa sale de REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"][scope]. Por
+    defecto solo cuenta los métodos que modifican datos.
+    """
+
+    methods = ("POST", "PUT", "PATCH", "DELETE")
+
+    def allow_request(self, request, view):
+        self.result = None
+        scope = getattr(view, "throttle_scope", None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None or request.method not in self.methods:
+            return True
+
+        limit, window = parse_rate(rate)
+        self.result = hit(
+            f"api:{scope}:{_ident(request)}", limit, window,
+            request=request._request,
+        )
+        return self.result.allowed
+
+    def wait(self):
+        return self.result.reset if self.result else None
 
-    if now > data["reset"]:
-        data = {"count": 0, "reset": now + window_seconds}
 
-    data["count"] += 1
-    cache.set(key, data, timeout=window_seconds)
+class RateLimitHeadersMiddleware:
+    """Informa el cupo restante del límite aplicado en el request."""
 
-    if data["count"] > limit:
-        if ajax:
-            return JsonResponse(
-                {"ok": False, "error": "rate_limited", "message": message},
-                status=429
-            )
-        messages.warning(None, message)
-        return redirect("reviews:cafe_list")
+    def __init__(self, get_response):
+        self.get_response = get_response
 
-    return None
+    def __call__(self, request):
+        response = self.get_response(request)
+        result = getattr(request, "_rate_limit", None)
+        if result is not None:
+            response["X-RateLimit-Limit"] = str(result.limit)
+            response["X-RateLimit-Remaining"] = str(result.remaining)
+            response["X-RateLimit-Reset"] = str(result.reset)
+            if not result.allowed and not response.has_header("Retry-After"):
+                response["Retry-After"] = str(result.reset)
+        return response
@@ -1,3 +1,482 @@
-from django.test import TestCase
+import gzip
+import struct
+import zlib
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core import mail, serializers
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from rest_framework.test import APIClient
+
+from cafe_reviews.sitemaps import CafeSitemap
+from core import jobs
+from core.cache_backends import TieredCache
+from core.models import Job
+from core.rate_limit import client_ip, hit, rate_limit
+from core.uploads import MAX_LADO, inspeccionar, procesar_subida
+from PIL import Image
+from reviews.forms import ClaimEvidenceForm
+from reviews.models import Cafe, Review
+
+User = get_user_model()
+
+ejecutadas = []
+
+
+@jobs.job("tests.anotar")
+def anotar(valor=None):
+    ejecutadas.append(valor)
+
+
+@jobs.job("tests.falla")
+def falla():
+    raise RuntimeError("boom")
+
+
+@override_settings(JOBS_EAGER=False)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        ejecutadas.clear()
+
+    def test_encola_y_ejecuta(self):
+        job = jobs.enqueue("tests.anotar", {"valor": 7})
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertEqual(ejecutadas, [])
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(ejecutadas, [7])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 1)
+
+    def test_respeta_run_after(self):
+        jobs.enqueue("tests.anotar", delay=600)
+        self.assertEqual(jobs.run_pending(), 0)
+
+        Job.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(jobs.run_pending(), 1)
+
+    def test_dedupe_key_agrupa_pendientes(self):
+        primera = jobs.enqueue("tests.anotar", delay=600, dedupe_key="ping")
+        self.assertIsNotNone(primera)
+        self.assertIsNone(jobs.enqueue("tests.anotar", delay=600, dedupe_key="ping"))
+        self.assertEqual(Job.objects.count(), 1)
+
+        # Una vez ejecutada, se puede volver a encolar
+        Job.objects.update(run_after=timezone.now())
+        jobs.run_pending()
+        self.assertIsNotNone(jobs.enqueue("tests.anotar", delay=600, dedupe_key="ping"))
+
+    def test_reintenta_y_marca_fallida(self):
+        job = jobs.enqueue("tests.falla")
+
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("boom", job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+
+        for _ in range(jobs.MAX_ATTEMPTS - 1):
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, jobs.MAX_ATTEMPTS)
+
+    def test_tarea_desconocida(self):
+        with self.assertRaises(KeyError):
+            jobs.enqueue("tests.no_existe")
+
+    def test_purga_terminadas_viejas(self):
+        vieja, reciente, fallida = (jobs.enqueue("tests.anotar") for _ in range(3))
+        hace_mucho = timezone.now() - jobs.PURGE_AFTER - timedelta(hours=1)
+        Job.objects.filter(pk__in=[vieja.pk, reciente.pk]).update(
+            status=Job.DONE, finished_at=hace_mucho,
+        )
+        Job.objects.filter(pk=reciente.pk).update(finished_at=timezone.now())
+        Job.objects.filter(pk=fallida.pk).update(status=Job.FAILED, finished_at=hace_mucho)
+
+        self.assertEqual(jobs.purge_done(), 1)
+        self.assertEqual(
+            set(Job.objects.values_list("pk", flat=True)), {reciente.pk, fallida.pk},
+        )
+
+    @override_settings(JOBS_EAGER=True, DEBUG=True)
+    def test_modo_eager_propaga_errores_en_debug(self):
+        with self.assertRaises(RuntimeError):
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue("tests.falla")
+
+        with override_settings(DEBUG=False):
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue("tests.falla")
+
+
+class ReviewJobsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(
+            username="owner", email="owner@example.com", password="test1234",
+        )
+        self.cafe = Cafe.objects.create(
+            name="Café Central", address="Calle 1", location="Palermo", owner=self.owner,
+        )
+        self.autor = User.objects.create_user(username="autor", password="test1234")
+
+    @override_settings(JOBS_EAGER=False)
+    def test_resena_encola_email_y_un_solo_ping(self):
+        Review.objects.create(cafe=self.cafe, user=self.autor, rating=5, comment="rico")
+        Review.objects.create(cafe=self.cafe, user=self.owner, rating=4, comment="bien")
+
+        self.assertEqual(Job.objects.filter(name="reviews.notify_owner_new_review").count(), 2)
+        self.assertEqual(Job.objects.filter(name="reviews.ping_sitemap").count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+        jobs.run_pending()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, ["owner@example.com"])
+
+    @override_settings(JOBS_EAGER=False)
+    def test_loaddata_no_encola_ping(self):
+        resena = Review.objects.create(cafe=self.cafe, user=self.autor, rating=5, comment="rico")
+        datos = serializers.serialize("json", [resena])
+        Job.objects.all().delete()
+
+        # Como loaddata: save_base(raw=True)
+        for objeto in serializers.deserialize("json", datos):
+            objeto.save()
+        self.assertFalse(Job.objects.filter(name="reviews.ping_sitemap").exists())
+
+    @override_settings(JOBS_EAGER=True)
+    def test_modo_eager_ejecuta_al_confirmar(self):
+        with mock.patch("urllib.request.urlopen") as urlopen:
+            with self.captureOnCommitCallbacks(execute=True):
+                Review.objects.create(cafe=self.cafe, user=self.autor, rating=5, comment="rico")
+                Review.objects.create(cafe=self.cafe, user=self.owner, rating=4, comment="bien")
+
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(len(mail.outbox), 2)
+        # Un solo ping (Google + Bing) para las dos reseñas
+        self.assertEqual(urlopen.call_count, 2)
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="ana", password="test1234")
+        self.cafe = Cafe.objects.create(
+            name="Café Central", address="Calle 1", location="Palermo", owner=self.user,
+        )
+
+    def test_cuenta_hasta_el_limite(self):
+        with mock.patch("core.rate_limit.time.time", return_value=1000.0):
+            resultados = [hit("prueba", 3, 60) for _ in range(4)]
+
+        self.assertEqual([r.allowed for r in resultados], [True, True, True, False])
+        self.assertEqual([r.remaining for r in resultados], [2, 1, 0, 0])
+
+    def test_ventana_deslizante(self):
+        # 3 intentos al final de una ventana (t=1050 de [1020, 1080))
+        with mock.patch("core.rate_limit.time.time", return_value=1050.0):
+            for _ in range(3):
+                hit("prueba", 3, 60)
+
+        # Recién empezada la siguiente, los de la anterior todavía pesan
+        with mock.patch("core.rate_limit.time.time", return_value=1085.0):
+            self.assertFalse(hit("prueba", 3, 60).allowed)
+
+        # Al final de la siguiente ya casi no cuentan
+        with mock.patch("core.rate_limit.time.time", return_value=1135.0):
+            self.assertTrue(hit("prueba", 3, 60).allowed)
+
+    def test_rechazo_sin_ajax_usa_el_request(self):
+        request = RequestFactory().post("/")
+        request.session = {}
+        request._messages = mock.Mock()
+
+        self.assertIsNone(rate_limit("vista", 1, 60, request=request))
+        response = rate_limit("vista", 1, 60, request=request, message="Pará un poco")
+        self.assertEqual(response.status_code, 302)
+        request._messages.add.assert_called_once()
+
+    def test_decorador_y_headers(self):
+        review = Review.objects.create(cafe=self.cafe, user=self.user, rating=4)
+        self.client.force_login(self.user)
+        url = reverse("reviews:toggle_review_like", args=[review.id])
+
+        response = self.client.post(url, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-RateLimit-Limit"], "60")
+        self.assertEqual(response["X-RateLimit-Remaining"], "59")
+
+        for _ in range(59):
+            self.client.post(url, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        response = self.client.post(url, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["X-RateLimit-Remaining"], "0")
+        self.assertIn("Retry-After", response)
+
+    def test_throttle_de_la_api_mobile(self):
+        rest = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"mobile_report": "2/min"},
+        }
+        review = Review.objects.create(cafe=self.cafe, user=self.user, rating=4)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse("mobile-report-review", args=[review.id])
+
+        with override_settings(REST_FRAMEWORK=rest):
+            codigos = [client.post(url, {"reason": "spam"}).status_code for _ in range(3)]
+            # Las lecturas no cuentan
+            detalle = client.get(reverse("mobile-cafe-detail", args=[self.cafe.id]))
+
+        # Reportar la propia reseña da 400: lo que importa es el tercero
+        self.assertEqual(codigos, [400, 400, 429])
+        self.assertEqual(detalle.status_code, 200)
+
+    def test_ip_del_cliente_segun_proxies(self):
+        request = RequestFactory().get(
+            "/", REMOTE_ADDR="10.0.0.2", HTTP_X_FORWARDED_FOR="6.6.6.6, 1.2.3.4, 10.0.0.1",
+        )
+
+        # Sin proxies configurados el header lo puede inventar el cliente
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "NUM_PROXIES": 0}):
+            self.assertEqual(client_ip(request), "10.0.0.2")
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "NUM_PROXIES": 2}):
+            self.assertEqual(client_ip(request), "1.2.3.4")
+            self.assertEqual(client_ip(RequestFactory().get("/", REMOTE_ADDR="10.0.0.2")), "10.0.0.2")
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "NUM_PROXIES": 5}):
+            self.assertEqual(client_ip(request), "6.6.6.6")
+
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+@override_settings(STORAGES=STORAGES_TEST)
+class SitemapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.autor = User.objects.create_user(username="autor", password="test1234")
+        self.cafes = [self._cafe(i) for i in range(3)]
+
+    def _cafe(self, i):
+        return Cafe.objects.create(
+            name=f"Café {i}", address=f"Calle {i}", location="Palermo", owner=self.owner,
+        )
+
+    def _queries(self, url="/sitemap.xml"):
+        # El Site se cachea en el proceso: se cuenta siempre
+        Site.objects.clear_cache()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_consultas_fijas_y_despues_cache(self):
+        con_tres = self._queries()
+        # Ya generado: sale del cache sin tocar la base
+        self.assertEqual(self._queries(), 0)
+
+        for i in range(3, 8):
+            cafe = self._cafe(i)
+            Review.objects.create(cafe=cafe, user=self.autor, rating=4, comment="rico")
+        self.assertEqual(self._queries(), con_tres)
+
+    def test_lastmod_gzip_y_304(self):
+        review = Review.objects.create(cafe=self.cafes[0], user=self.autor, rating=5, comment="rico")
+        Review.objects.filter(pk=review.pk).update(created_at=timezone.now() + timedelta(days=30))
+
+        response = self.client.get("/sitemap.xml", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        xml = gzip.decompress(response.content).decode()
+        dia = timezone.localdate(timezone.now() + timedelta(days=30)).isoformat()
+        url = reverse("reviews:cafe_detail", args=[self.cafes[0].id])
+        self.assertIn(f"{url}</loc><lastmod>{dia}</lastmod>", xml)
+
+        etag = response["ETag"]
+        response = self.client.get(
+            "/sitemap.xml", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # Un café nuevo regenera el sitemap (otro ETag)
+        nuevo = self._cafe(9)
+        response = self.client.get(
+            "/sitemap.xml", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        url = reverse("reviews:cafe_detail", args=[nuevo.id])
+        self.assertIn(url, gzip.decompress(response.content).decode())
+
+    def test_indice_cuando_no_entra_en_una_pagina(self):
+        with mock.patch.object(CafeSitemap, "limit", 2):
+            indice = self.client.get("/sitemap.xml").content.decode()
+            self.assertIn("<sitemapindex", indice)
+            self.assertIn("/sitemap-cafes.xml?p=2", indice)
+
+            pagina = self.client.get("/sitemap-cafes.xml?p=2").content.decode()
+            self.assertIn(reverse("reviews:cafe_detail", args=[self.cafes[2].id]), pagina)
+            self.assertNotIn(reverse("reviews:cafe_detail", args=[self.cafes[0].id]), pagina)
+
+            self.assertEqual(self.client.get("/sitemap-cafes.xml?p=9").status_code, 404)
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _proceso(self, **options):
+        # Dos instancias con el mismo L2 se comportan como dos workers
+        return TieredCache("", {"OPTIONS": {"L2": "shared", "SYNC_INTERVAL": 0, **options}})
+
+    def test_l1_delante_del_l2(self):
+        a = self._proceso()
+        a.set("clave", {"x": 1})
+
+        self.assertEqual(a.get("clave"), {"x": 1})
+        self.assertEqual(a.get("clave"), {"x": 1})
+        stats = a.stats()
+        self.assertEqual(stats["l1_hits"], 2)
+        self.assertEqual(stats["l2_hits"], 0)
+
+        b = self._proceso()
+        self.assertEqual(b.get("clave"), {"x": 1})
+        self.assertEqual(b.get("falta", "def"), "def")
+        stats = b.stats()
+        self.assertEqual(stats["l2_hits"], 1)
+        self.assertEqual(stats["l2_misses"], 1)
+
+    def test_escritura_de_otro_proceso_invalida_el_l1(self):
+        a, b = self._proceso(), self._proceso()
+        a.set("version", 1)
+        self.assertEqual(b.get("version"), 1)
+
+        a.incr("version")
+        self.assertEqual(b.get("version"), 2)
+
+        a.delete("version")
+        self.assertIsNone(b.get("version"))
+
+    def test_escritura_ajena_no_vacia_el_l1(self):
+        a, b = self._proceso(), self._proceso()
+        self.assertNotEqual(a._bucket("cafe_detail:version:1"), a._bucket("vecinos:datos:2"))
+        a.set("cafe_detail:version:1", 7)
+        self.assertEqual(b.get("cafe_detail:version:1"), 7)
+
+        a.set("vecinos:datos:2", "otra cosa")
+        a.delete("geo_index:version")
+        self.assertEqual(b.get("cafe_detail:version:1"), 7)
+        self.assertEqual(b.stats()["l1_hits"], 1)
+
+    def test_l1_nunca_mas_viejo_que_su_ttl(self):
+        a = self._proceso()
+        b = self._proceso(SYNC_INTERVAL=3600, L1_TTL=5)
+
+        with mock.patch("core.cache_backends.time.monotonic", return_value=10_000.0):
+            a.set("clave", "vieja")
+            self.assertEqual(b.get("clave"), "vieja")
+            a.set("clave", "nueva")
+            # Sin consultar el sello todavía, b sigue con su copia
+            self.assertEqual(b.get("clave"), "vieja")
+
+        with mock.patch("core.cache_backends.time.monotonic", return_value=10_006.0):
+            self.assertEqual(b.get("clave"), "nueva")
+
+    def test_no_comparte_objetos(self):
+        a = self._proceso()
+        a.set("lista", [1])
+        a.get("lista").append(2)
+        self.assertEqual(a.get("lista"), [1])
+
+    def test_prefijos_excluidos_van_al_l2(self):
+        a = self._proceso(L1_EXCLUDE_PREFIXES=["rl:"])
+        a.add("rl:x", 0)
+        a.incr("rl:x")
+        self.assertEqual(a.get("rl:x"), 1)
+        self.assertEqual(a.stats()["l1_entries"], 0)
+        self.assertEqual(caches["shared"].get_many(a._generation_keys), {})
+
+
+def _png_solo_header(ancho, alto):
+    """PNG con medidas enormes pero sin píxeles: solo sirve leerle el header."""
+    def chunk(tipo, datos):
+        return struct.pack(">I", len(datos)) + tipo + datos + struct.pack(">I", zlib.crc32(tipo + datos))
+
+    ihdr = struct.pack(">IIBBBBB", ancho, alto, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IEND", b"")
+
+
+def _jpeg_con_exif(size=(3000, 2000)):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotar 90°
+    exif[0x010F] = "Cámara de prueba"  # Make
+    buffer = BytesIO()
+    Image.new("RGB", size, "brown").save(buffer, format="JPEG", exif=exif)
+    return SimpleUploadedFile("foto.png.jpeg", buffer.getvalue(), content_type="image/jpeg")
+
+
+class UploadsTests(TestCase):
+    def test_rechaza_por_medidas_sin_decodificar(self):
+        archivo = SimpleUploadedFile("grande.png", _png_solo_header(8000, 6000), content_type="image/png")
+        with self.assertRaisesMessage(ValidationError, "8000x6000"):
+            inspeccionar(archivo)
+
+        # Las que Pillow ya frena al abrir también salen como "demasiado grande"
+        bomba = SimpleUploadedFile("bomba.png", _png_solo_header(20000, 20000), content_type="image/png")
+        with self.assertRaisesMessage(ValidationError, "demasiado grande"):
+            inspeccionar(bomba)
+
+        texto = SimpleUploadedFile("foto.jpg", b"no soy una imagen", content_type="image/jpeg")
+        with self.assertRaises(ValidationError):
+            inspeccionar(texto)
+
+    def test_achica_orienta_y_saca_exif(self):
+        procesado = procesar_subida(_jpeg_con_exif())
+
+        self.assertEqual(procesado.name, "foto.png.jpg")
+        img = Image.open(procesado)
+        # Girada según el EXIF y dentro del lado máximo
+        self.assertEqual(img.size, (round(MAX_LADO * 2000 / 3000), MAX_LADO))
+        self.assertEqual(len(img.getexif()), 0)
+
+    def test_evidencias_de_reclamo(self):
+        pdf = SimpleUploadedFile("doc.pdf", b"%PDF-1.4", content_type="application/pdf")
+        form = ClaimEvidenceForm(files=MultiValueDict({"files": [_jpeg_con_exif((800, 600)), pdf]}))
+        form.cleaned_data = {}
+
+        foto, documento = form.clean_files()
+        self.assertEqual(len(Image.open(foto).getexif()), 0)
+        self.assertIs(documento, pdf)
+
+        # Una foto que dice ser PDF igual se decodifica y pierde el EXIF
+        disfrazada = _jpeg_con_exif((800, 600))
+        disfrazada.content_type = "application/pdf"
+        form = ClaimEvidenceForm(files=MultiValueDict({"files": [disfrazada]}))
+        form.cleaned_data = {}
+        (foto,) = form.clean_files()
+        self.assertEqual(len(Image.open(foto).getexif()), 0)
+
+        bomba = SimpleUploadedFile("x.png", _png_solo_header(20000, 20000), content_type="image/png")
+        form = ClaimEvidenceForm(files=MultiValueDict({"files": [bomba]}))
+        form.cleaned_data = {}
+        with self.assertRaises(ValidationError):
+            form.clean_files()
@@ -0,0 +1,94 @@
+"""
+Procesamiento de imágenes subidas con memoria acotada.
+
+Un JPEG de 4 MB puede ser de 12000x9000 y ocupar ~300 MB decodificado.
+Por eso:
+  - `inspeccionar` lee solo el header (Pillow abre lazy) y rechaza
+    formatos raros y lo que pase de `MAX_PIXELES`, sin decodificar nada.
+  - `decodificar` usa `Image.draft` en los JPEG: el decoder baja la
+    escala (1/2, 1/4, 1/8) mientras lee, así nunca se arma el bitmap
+    completo si solo hace falta uno chico.
+  - `procesar_subida` devuelve un JPEG nuevo, ya orientado según el EXIF
+    y sin metadatos (GPS, cámara), de `MAX_LADO` como mucho.
+
+Lo usan los formularios web, la API mobile y las evidencias de reclamos.
+"""
+
+import os
+from io import BytesIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+FORMATOS_PERMITIDOS = {"JPEG", "PNG", "WEBP"}
+# 40 megapíxeles: de sobra para cualquier cámara de celular
+MAX_PIXELES = 40_000_000
+# Lado máximo de lo que se guarda como original
+MAX_LADO = 2048
+CALIDAD_JPEG = 85
+
+_MENSAJE_GRANDE = (
+    "La imagen es demasiado grande ({medidas}). "
+    "Probá con una de menos de 40 megapíxeles."
+)
+
+
+def inspeccionar(archivo):
+    """
+    Valida formato y medidas leyendo solo el header. Devuelve
+    (formato, ancho, alto) y deja el archivo al principio.
+    """
+    archivo.seek(0)
+    try:
+        with Image.open(archivo) as img:
+            formato, (ancho, alto) = img.format, img.size
+    except Image.DecompressionBombError:
+        # Pillow ya la frena al abrir si supera el doble de su propio límite
+        raise ValidationError(_MENSAJE_GRANDE.format(medidas="más de 40 megapíxeles"))
+    except (UnidentifiedImageError, OSError):
+        raise ValidationError("El archivo no es una imagen válida.")
+    finally:
+        archivo.seek(0)
+
+    if formato not in FORMATOS_PERMITIDOS:
+        raise ValidationError("Solo se permiten imágenes JPG, PNG o WEBP.")
+    if ancho * alto > MAX_PIXELES:
+        raise ValidationError(_MENSAJE_GRANDE.format(medidas=f"{ancho}x{alto}"))
+    return formato, ancho, alto
+
+
+def decodificar(archivo, max_lado=MAX_LADO):
+    """
+    Decodifica la imagen (ya inspeccionada) a RGB, orientada según el EXIF
+    y con `max_lado` como mucho, sin pasar por el tamaño completo en los
+    JPEG.
+    """
+    archivo.seek(0)
+    with Image.open(archivo) as img:
+        if img.format == "JPEG":
+            # Escala de decodificación más chica que siga cubriendo max_lado
+            img.draft("RGB", (max_lado, max_lado))
+        # Se achica antes de girar o convertir: esas copias ya son chicas
+        img.thumbnail((max_lado, max_lado), Image.LANCZOS, reducing_gap=None)
+        orientada = ImageOps.exif_transpose(img)
+
+    if orientada.mode != "RGB":
+        orientada = orientada.convert("RGB")
+    return orientada
+
+
+def procesar_subida(archivo, max_lado=MAX_LADO):
+    """
+    Inspecciona, decodifica acotado y recomprime como JPEG sin EXIF.
+    Devuelve un archivo subido nuevo (mismo nombre, extensión .jpg).
+    """
+    inspeccionar(archivo)
+    img = decodificar(archivo, max_lado)
+
+    buffer = BytesIO()
+    # Sin `exif=`: Pillow no copia los metadatos del original
+    img.save(buffer, format="JPEG", quality=CALIDAD_JPEG, optimize=True, progressive=True)
+
+    base = os.path.splitext(os.path.basename(archivo.name or "imagen"))[0]
+    return SimpleUploadedFile(f"{base}.jpg", buffer.getvalue(), content_type="image/jpeg")
@@ -9,7 +9,11 @@ urlpatterns = [
     path("privacidad/",core_views.privacy_policy_view,name="privacy_policy",),
     path("eliminar-cuenta/",core_views.delete_account_request_view,name="delete_account_request",),
 
+    # Interno
+    path("internal/cache-stats/", core_views.cache_stats, name="cache_stats"),
+
     # SEO
     path("sitemap.xml", core_views.sitemap_xml, name="django_sitemap"),
+    path("sitemap-<section>.xml", core_views.sitemap_xml, name="sitemap_section"),
 ]
 
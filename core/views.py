@@ -1,19 +1,18 @@
 # file: core/views.py
 from django.shortcuts import render
-from django.http import HttpResponse
-from django.urls import reverse
-from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
 from django.core.mail import send_mail
 from django.conf import settings
-from django.db.models import Avg, Count
+import os
 import random
 
 
 from reviews.models import Review, Cafe
 from reviews.utils.tags import get_tags_grouped_by_cafe
 from core import messages as core_messages
-
-import json
+from cafe_reviews.sitemaps import servir_sitemap
 
 
 # ✅ Cafés vistos recientemente (desde la sesión)
@@ -33,28 +32,6 @@ def home(request):
         .order_by("-created_at")[:3]
     )
 
-    # Cafés con coordenadas (para mapa)
-    cafes_with_coords = (
-        Cafe.objects
-        .filter(latitude__isnull=False, longitude__isnull=False)
-        .prefetch_related("tags")
-    )
-
-    # Datos para el mapa (ojo con Decimals → JSON encoder)
-    cafes_data = [
-        {
-            "id": cafe.id,
-            "name": cafe.name,
-            "address": cafe.address,
-            "location": cafe.location,
-            "latitude": cafe.latitude,
-            "longitude": cafe.longitude,
-            # 🔧 FIX: usar namespace 'reviews'
-            "url": reverse("reviews:cafe_detail", kwargs={"cafe_id": cafe.id}),
-        }
-        for cafe in cafes_with_coords
-    ]
-
     # 🔥 Cafés destacados inteligentes
     total_reviews = Review.objects.count()
 
@@ -67,13 +44,9 @@ def home(request):
 
     top_cafes_qs = (
         Cafe.objects
-        .annotate(
-            avg_rating=Avg("reviews__rating"),
-            num_reviews=Count("reviews")
-        )
-        .filter(avg_rating__gte=4, num_reviews__gte=min_reviews)
+        .filter(avg_rating__gte=4, review_count__gte=min_reviews)
         .prefetch_related("tags")
-        .order_by("-avg_rating", "-num_reviews")[:20]
+        .order_by("-avg_rating", "-review_count")[:20]
     )
 
     top_cafes = list(top_cafes_qs)
@@ -92,7 +65,6 @@ def home(request):
     context = {
         "latest_reviews": latest_reviews,
         "top_cafes": top_cafes,
-        "cafes_json": json.dumps(cafes_data, cls=DjangoJSONEncoder),
         "recently_viewed_cafes": recently_viewed_cafes,
         "tag_data": tag_data,
         "home_zones": home_zones,
@@ -176,14 +148,14 @@ def delete_account_request_view(request):
         },
     )
 
-# ✅ Sitemap dinámico
-def sitemap_xml(request):
-    cafes = Cafe.objects.only("id").order_by("id")
-    # `render` ya pasa `request` al template → podés usar {{ request.get_host }} ahí
-    return render(
-        request,
-        "core/sitemap.xml",
-        {"cafes": cafes},
-        content_type="application/xml",
-    )
+# ✅ Sitemap (o índice) cacheado; ver cafe_reviews.sitemaps
+def sitemap_xml(request, section=None):
+    return servir_sitemap(request, section)
+
 
+# ✅ Hits / misses del cache por nivel (del worker que atiende)
+@staff_member_required
+def cache_stats(request):
+    backend = caches["default"]
+    stats = backend.stats() if hasattr(backend, "stats") else {}
+    return JsonResponse({"pid": os.getpid(), "backend": type(backend).__name__, **stats})
@@ -3,6 +3,7 @@ from django.contrib import admin
 from .models import Cafe, Review, CafeStat, ReviewLike, ReviewReport, CafeWhisper
 from .claims import ClaimRequest, ClaimEvidence, ClaimStatus, ClaimMethod
 from import_export.admin import ImportExportModelAdmin
+from .signals import invalidar_detalle_cafe
 
 
 @admin.register(Cafe)
@@ -198,7 +199,14 @@ class CafeWhisperAdmin(admin.ModelAdmin):
     @admin.action(description="Ocultar huellas seleccionadas")
     def hide_whispers(self, request, queryset):
         queryset.update(is_hidden=True)
+        self._invalidar_detalles(queryset)
 
     @admin.action(description="Mostrar huellas seleccionadas")
     def show_whispers(self, request, queryset):
-        queryset.update(is_hidden=False)
\ No newline at end of file
+        queryset.update(is_hidden=False)
+        self._invalidar_detalles(queryset)
+
+    def _invalidar_detalles(self, queryset):
+        # update() no dispara señales: invalidamos a mano el detalle cacheado
+        for cafe_id in queryset.values_list("cafe_id", flat=True).distinct():
+            invalidar_detalle_cafe(cafe_id)
\ No newline at end of file
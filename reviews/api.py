@@ -1,8 +1,14 @@
 # reviews/api.py
-from django.db.models import Avg
+import hashlib
+
+from django.db.models import F, prefetch_related_objects
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework.viewsets import ReadOnlyModelViewSet
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import AllowAny
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import SearchFilter
+from rest_framework.response import Response
 try:
     # Si tenés django-filter instalado, habilitamos filtros. Si no, lo ignoramos.
     from django_filters.rest_framework import DjangoFilterBackend
@@ -11,33 +17,116 @@ except Exception:
     HAS_DJANGO_FILTER = False
 
 from reviews.models import Cafe
-from .serializers import CafeSerializer
+from .serializers import CafeSerializer, campos_elegidos
+
+# Columnas que necesita cada campo del serializer que no es del modelo
+COLUMNAS_DE_CAMPO = {
+    "average_rating": ("avg_rating",),
+    "photo1_url": ("photo1", "image_variants"),
+    "photo2_url": ("photo2", "image_variants"),
+    "photo3_url": ("photo3", "image_variants"),
+    "top_tags": (),
+    "tags": (),
+}
+
+
+class CafeCursorPagination(CursorPagination):
+    # `name` es único (tiene índice): el cursor nunca repite ni saltea cafés
+    ordering = "name"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+def respuesta_condicional(request, cafes, construir):
+    """
+    ETag (URL + id y updated_at de cada café) y Last-Modified (el
+    updated_at más nuevo) de una lista de cafés. Si el cliente ya la tiene
+    devuelve 304 sin llamar a `construir`.
+    """
+    huella = hashlib.md5(request.get_full_path().encode())
+    for cafe in cafes:
+        huella.update(f"|{cafe.pk}:{cafe.updated_at.isoformat()}".encode())
+    etag = f'"{huella.hexdigest()}"'
+
+    ultima = max((cafe.updated_at for cafe in cafes), default=None)
+    last_modified = int(ultima.timestamp()) if ultima else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = construir()
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
 
 
 class CafeViewSet(ReadOnlyModelViewSet):
     """
     Endpoints:
-    - GET /api/cafes/       -> lista
+    - GET /api/cafes/       -> lista paginada con cursor (?cursor=, ?page_size=)
     - GET /api/cafes/{id}/  -> detalle
+
+    `?fields=id,name,latitude,longitude` devuelve solo esos campos y
+    ambos responden 304 a un GET condicional si nada cambió.
     """
     permission_classes = [AllowAny]  # Público en desarrollo
     serializer_class = CafeSerializer
+    pagination_class = CafeCursorPagination
 
-    # Anotamos el promedio de rating tomando el related_name 'reviews'
+    # El promedio de rating ya está guardado en el café (avg_rating)
     def get_queryset(self):
-        return (
+        queryset = (
             Cafe.objects
-            .select_related("owner")           # opcional, por si se usa en el serializer
-            .prefetch_related("tags")          # para evitar N+1
-            .annotate(average_rating=Avg("reviews__rating"))
+            .annotate(average_rating=F("avg_rating"))
             .order_by("name")
         )
 
-    # Búsqueda & orden (opcional, ya mismo te suma valor)
-    filter_backends = [SearchFilter, OrderingFilter] + ([DjangoFilterBackend] if HAS_DJANGO_FILTER else [])
+        campos = self._campos()
+        if campos is None:
+            return queryset
+
+        # Solo las columnas de los campos pedidos (+ las del cursor y el ETag)
+        columnas = {"id", "name", "updated_at"}
+        for campo in campos:
+            columnas.update(COLUMNAS_DE_CAMPO.get(campo, (campo,)))
+        return queryset.only(*columnas)
+
+    def _campos(self):
+        return campos_elegidos(self.request, CafeSerializer.Meta.fields)
+
+    def _datos(self, cafes):
+        campos = self._campos()
+        if campos is None or "tags" in campos:
+            # Recién al serializar (para evitar N+1): un 304 no los necesita
+            prefetch_related_objects(cafes, "tags")
+        return self.get_serializer(cafes, many=True).data
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            page = list(queryset)
+
+            def construir():
+                return Response(self._datos(page))
+        else:
+            def construir():
+                return self.get_paginated_response(self._datos(page))
+
+        return respuesta_condicional(request, page, construir)
+
+    def retrieve(self, request, *args, **kwargs):
+        cafe = self.get_object()
+        return respuesta_condicional(
+            request, [cafe], lambda: Response(self.get_serializer(cafe).data),
+        )
+
+    # Búsqueda (opcional, ya mismo te suma valor). Sin OrderingFilter: el
+    # cursor necesita un orden único y estable, y ordenar por promedio o
+    # fecha (con empates) salteaba o repetía cafés entre páginas.
+    filter_backends = [SearchFilter] + ([DjangoFilterBackend] if HAS_DJANGO_FILTER else [])
     search_fields = ["name", "address", "location"]
-    ordering_fields = ["name", "average_rating", "created_at"]
-    ordering = ["name"]
 
     # Si tenés django-filter, podés habilitar filtros booleanos básicos:
     if HAS_DJANGO_FILTER:
@@ -3,8 +3,10 @@ from __future__ import annotations
 import re
 from django import forms
 from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
 from .models import Review, Cafe, Tag, ReviewReport
 from core.messages import MESSAGES
+from core.uploads import procesar_subida
 
 # Formularios de reclamo: dependen de tu archivo reviews/claims.py
 from .claims import (
@@ -26,6 +28,24 @@ def validar_phone(valor):
         raise ValidationError("Número inválido. Usá solo números, con o sin +, de 6 a 15 dígitos.")
 
 
+def imagen_subida(valor, **kwargs):
+    """
+    Si es un archivo recién subido, lo valida y recomprime con memoria
+    acotada (core.uploads). Lo que ya estaba guardado pasa igual.
+    """
+    if isinstance(valor, UploadedFile):
+        return procesar_subida(valor, **kwargs)
+    return valor
+
+
+def es_pdf(archivo):
+    """Por los primeros bytes: el Content-Type lo elige el cliente."""
+    archivo.seek(0)
+    cabecera = archivo.read(5)
+    archivo.seek(0)
+    return cabecera == b"%PDF-"
+
+
 # --------------------------------------------------------------------------------------
 # Reviews
 # --------------------------------------------------------------------------------------
@@ -277,6 +297,15 @@ class CafeForm(forms.ModelForm):
                 )
 
         return cleaned_data
+
+    def clean_photo1(self):
+        return imagen_subida(self.cleaned_data.get('photo1'))
+
+    def clean_photo2(self):
+        return imagen_subida(self.cleaned_data.get('photo2'))
+
+    def clean_photo3(self):
+        return imagen_subida(self.cleaned_data.get('photo3'))
     
     def clean_instagram(self):
         ig = self.cleaned_data.get("instagram", "").strip()
@@ -412,7 +441,9 @@ class ClaimEvidenceForm(forms.Form):
             if size_mb > self.MAX_SIZE_MB:
                 raise ValidationError(f"Cada archivo debe pesar menos de {self.MAX_SIZE_MB} MB.")
 
-        return files
+        # Las fotos se validan por medidas y se guardan sin EXIF (ubicación);
+        # lo que no es un PDF de verdad se procesa como imagen
+        return [f if es_pdf(f) else procesar_subida(f) for f in files]
 
 class ReviewReportForm(forms.ModelForm):
     # Campo “visual” para el template; se guarda en `message`
@@ -0,0 +1,314 @@
+"""
+Tareas en segundo plano de reviews (ver `core.jobs`): las encolan las
+señales y las ejecuta el worker, fuera del request.
+"""
+
+import tempfile
+from datetime import timedelta
+from typing import Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import storages
+from django.core.mail import EmailMultiAlternatives
+from django.template import TemplateDoesNotExist
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from core.jobs import enqueue, job
+
+from .models import Cafe, Review, ReviewReport
+from .utils.cache import bump_version
+from .utils.images import CAMPOS_CON_IMAGEN, procesar_derivados
+from .utils.qr_posters import datos_cafes, zip_en_streaming
+from .utils.ranking import cafes_con_actividad_vencida, refrescar_ranking
+from .utils.relacionados import actualizar_vecinos
+from .utils.view_counter import volcar_vistas
+
+# Como mucho un ping a buscadores por ventana (segundos)
+SITEMAP_PING_WINDOW = 600
+
+# Cada cuánto se bajan los boosts de actividad que vencieron (segundos)
+RANKING_DECAY_INTERVAL = 60 * 60
+
+# Cuánto se recuerda el estado (y el link) de un ZIP de QRs generado
+QR_ARCHIVO_TTL = 24 * 60 * 60
+
+
+# -----------------------------
+# Sitemap ping (compat Django 5)
+# -----------------------------
+@job("reviews.ping_sitemap")
+def ping_sitemap() -> None:
+    """
+    Intenta notificar a buscadores que cambió el contenido.
+    - No explota en dev/CI.
+    - En prod intenta ping a Google/Bing con GET a sus endpoints.
+    """
+    # En dev no hacemos nada
+    if getattr(settings, "DEBUG", False):
+        return
+
+    # Construimos la URL absoluta del sitemap.xml usando Sites
+    try:
+        site = Site.objects.get_current()
+        domain = site.domain.strip()
+        if not domain:
+            return
+        if not domain.startswith("http"):
+            sitemap_url = f"https://{domain}/sitemap.xml"
+        else:
+            sitemap_url = f"{domain.rstrip('/')}/sitemap.xml"
+    except Exception:
+        return
+
+    # Pings “best effort” (si fallan, seguimos)
+    try:
+        import urllib.parse
+        import urllib.request
+
+        encoded = urllib.parse.quote(sitemap_url, safe="")
+        endpoints = [
+            f"https://www.google.com/ping?sitemap={encoded}",
+            f"https://www.bing.com/ping?sitemap={encoded}",
+        ]
+        for url in endpoints:
+            try:
+                urllib.request.urlopen(url, timeout=2)
+            except Exception:
+                pass
+    except Exception:
+        pass
+
+
+# -----------------------------
+# Vistas del detalle (CafeStat)
+# -----------------------------
+@job("reviews.flush_cafe_views")
+def flush_cafe_views() -> None:
+    volcar_vistas()
+
+
+# -----------------------------
+# Derivados de imágenes
+# -----------------------------
+@job("reviews.image_derivatives")
+def image_derivatives(model: str, pk: int, forzar: bool = False) -> None:
+    """Genera los tamaños de las fotos de un café o del avatar de un usuario."""
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is None:
+        return
+
+    procesados = procesar_derivados(instance, CAMPOS_CON_IMAGEN[model], forzar=forzar)
+    if procesados and model == "reviews.cafe":
+        bump_version("cafe_detail", pk)
+    elif procesados:
+        # Avatar nuevo (sin save(), no hay señal): cambia en los cafés que reseñó
+        for cafe_id in Review.objects.filter(user_id=pk).values_list("cafe_id", flat=True).distinct():
+            bump_version("cafe_detail", cafe_id)
+            bump_version("cafe_reviews", cafe_id)
+
+
+# -----------------------------
+# Ranking: score base por café
+# -----------------------------
+@job("reviews.refresh_ranking")
+def refresh_ranking(cafe_id: int) -> None:
+    """Recalcula el snapshot del ranking de un café después de una escritura."""
+    refrescar_ranking([cafe_id])
+
+
+def programar_vencimiento_ranking() -> None:
+    """Agenda la próxima vuelta de `decay_ranking` (una sola pendiente)."""
+    enqueue("reviews.decay_ranking", delay=RANKING_DECAY_INTERVAL, dedupe_key="decay_ranking")
+
+
+@job("reviews.decay_ranking")
+def decay_ranking() -> None:
+    """
+    Tarea periódica: recalcula los cafés cuyo boost de los últimos 14 días
+    venció desde la vuelta anterior y agenda la siguiente. La arranca
+    `refresh_cafe_ranking` en cada release.
+    """
+    # Primero la próxima: si esta falla, la cadena no se corta
+    programar_vencimiento_ranking()
+    cafe_ids = cafes_con_actividad_vencida(timedelta(seconds=RANKING_DECAY_INTERVAL * 2))
+    if cafe_ids:
+        refrescar_ranking(cafe_ids)
+
+
+# -----------------------------
+# Cafés relacionados
+# -----------------------------
+@job("reviews.related_cafes")
+def related_cafes(cafe_id: int) -> None:
+    """Recalcula las listas de vecinos que cambian con un café guardado o borrado."""
+    actualizar_vecinos(cafe_id)
+
+
+# -----------------------------
+# ZIP con los carteles QR
+# -----------------------------
+def estado_qr_archivo(token: str):
+    """{"estado": "pendiente" | "generando" | "listo" | "error", ...} o None."""
+    return cache.get(f"qr_archivo:{token}")
+
+
+def _guardar_estado_qr(token: str, **estado) -> None:
+    cache.set(f"qr_archivo:{token}", estado, QR_ARCHIVO_TTL)
+
+
+@job("reviews.generate_qr_archive")
+def generate_qr_archive(token: str, base_url: str, zona: str = "") -> None:
+    """
+    Arma el ZIP con el cartel de cada café (de la zona, si hay) y lo deja
+    en el storage "archivos". El progreso y el link quedan en el cache.
+    """
+    cafes = Cafe.objects.order_by("id")
+    if zona:
+        cafes = cafes.filter(location__icontains=zona)
+    datos = datos_cafes(cafes, base_url)
+
+    hechos = 0
+    _guardar_estado_qr(token, estado="generando", total=len(datos), hechos=hechos)
+    try:
+        with tempfile.TemporaryFile() as archivo:
+            # Fuera del request: acá sí vale el pool de procesos
+            for parte in zip_en_streaming(datos, workers=settings.QR_POSTER_WORKERS):
+                archivo.write(parte)
+                hechos += 1
+                if hechos % 25 == 0:
+                    _guardar_estado_qr(token, estado="generando", total=len(datos), hechos=hechos)
+            archivo.seek(0)
+
+            storage = storages["archivos"]
+            nombre = storage.save(f"qr/qr_gota_cafes_{token}.zip", File(archivo))
+    except Exception:
+        _guardar_estado_qr(token, estado="error", total=len(datos), hechos=hechos)
+        raise
+
+    _guardar_estado_qr(
+        token, estado="listo", total=len(datos), hechos=len(datos), url=storage.url(nombre),
+    )
+
+
+# ----------------------------------------
+# Emails al dueño: nueva reseña / denuncia
+# ----------------------------------------
+def _render_email(subject_tpl: str, text_tpl: str, html_tpl: str, ctx: dict) -> Tuple[str, str, str]:
+    """
+    Intenta renderizar subject, texto y HTML desde templates.
+    Si falta algún template, usa un fallback simple.
+    """
+    # Subject
+    try:
+        subject = render_to_string(subject_tpl, ctx).strip()
+    except TemplateDoesNotExist:
+        cafe = ctx.get("cafe")
+        subject = f"Novedades en {getattr(cafe, 'name', 'tu cafetería')}"
+
+    # Texto
+    try:
+        text_body = render_to_string(text_tpl, ctx)
+    except TemplateDoesNotExist:
+        # Fallback muy básico
+        review = ctx.get("review")
+        detail_url = ctx.get("detail_url", "#")
+        text_body = (
+            f"Novedades en {ctx.get('cafe')}\n\n"
+            f"Usuario: {getattr(getattr(review, 'user', None), 'username', '(desconocido)')}\n"
+            f"Puntaje: {getattr(review, 'rating', '-')}\n\n"
+            f"Ver: {detail_url}\n"
+        )
+
+    # HTML
+    try:
+        html_body = render_to_string(html_tpl, ctx)
+    except TemplateDoesNotExist:
+        html_body = text_body.replace("\n", "<br>")
+
+    return subject, text_body, html_body
+
+
+def _send_owner_email(subject_tpl: str, text_tpl: str, html_tpl: str, ctx: dict, to_email: str) -> None:
+    subject, text_body, html_body = _render_email(subject_tpl, text_tpl, html_tpl, ctx)
+    msg = EmailMultiAlternatives(
+        subject=subject,
+        body=text_body,
+        from_email=getattr(settings, "DEFAULT_FROM_EMAIL", "no-reply@gota.local"),
+        to=[to_email],
+    )
+    msg.attach_alternative(html_body, "text/html")
+    # Si el envío falla, la tarea se reintenta
+    msg.send()
+
+
+@job("reviews.notify_owner_new_review")
+def notify_owner_new_review(review_id: int) -> None:
+    """Email al dueño cuando se crea una reseña nueva."""
+    review = (
+        Review.objects
+        .select_related("cafe__owner", "user")
+        .filter(pk=review_id)
+        .first()
+    )
+    if review is None:
+        return
+
+    cafe = review.cafe
+    owner = getattr(cafe, "owner", None)
+    if not owner or not owner.email:
+        return
+
+    ctx = {
+        "cafe": cafe,
+        "review": review,
+        # URLs relativas (si querés absolutas, podés anteponer un DOMAIN del settings)
+        "detail_url": reverse("reviews:cafe_detail", kwargs={"cafe_id": cafe.id}),
+        "owner_reply_url": reverse("reviews:owner_reviews"),
+    }
+
+    _send_owner_email(
+        subject_tpl="emails/owner_new_review_subject.txt",
+        text_tpl="emails/owner_new_review.txt",
+        html_tpl="emails/owner_new_review.html",
+        ctx=ctx,
+        to_email=owner.email,
+    )
+
+
+@job("reviews.notify_owner_review_report")
+def notify_owner_review_report(report_id: int) -> None:
+    """Email al dueño cuando alguien denuncia una reseña de su local."""
+    report = (
+        ReviewReport.objects
+        .select_related("review__cafe__owner", "review__user")
+        .filter(pk=report_id)
+        .first()
+    )
+    if report is None:
+        return
+
+    review = report.review
+    cafe = review.cafe
+    owner = getattr(cafe, "owner", None)
+    if not owner or not owner.email:
+        return
+
+    ctx = {
+        "cafe": cafe,
+        "review": review,
+        "report": report,
+        "detail_url": reverse("reviews:cafe_detail", kwargs={"cafe_id": cafe.id}),
+    }
+
+    _send_owner_email(
+        subject_tpl="emails/owner_review_report_subject.txt",
+        text_tpl="emails/owner_review_report.txt",
+        html_tpl="emails/owner_review_report.html",
+        ctx=ctx,
+        to_email=owner.email,
+    )
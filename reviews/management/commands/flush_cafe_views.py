@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from reviews.utils.view_counter import volcar_vistas
+
+
+class Command(BaseCommand):
+    help = "Vuelca a CafeStat las vistas de cafés acumuladas en el cache."
+
+    def handle(self, *args, **options):
+        total = volcar_vistas()
+        self.stdout.write(self.style.SUCCESS(f"Listo: {total} vistas volcadas."))
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q
+
+from reviews.jobs import image_derivatives
+from reviews.utils.images import CAMPOS_CON_IMAGEN
+
+
+def _procesar(model, pk, forzar):
+    try:
+        image_derivatives(model, pk, forzar=forzar)
+    finally:
+        # Cada hilo abre su propia conexión
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera los tamaños (WebP y JPEG) de las fotos de cafés y de los "
+        "avatares que todavía no los tienen."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Imágenes a procesar en paralelo (por defecto, 4).",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenera también los que ya están al día.",
+        )
+
+    def handle(self, *args, **options):
+        tareas = []
+        for model, campos in CAMPOS_CON_IMAGEN.items():
+            con_imagen = Q()
+            for campo in campos:
+                con_imagen |= Q(**{f"{campo}__gt": ""})
+            pks = apps.get_model(model).objects.filter(con_imagen).values_list("pk", flat=True)
+            tareas += [(model, pk) for pk in pks]
+
+        forzar = options["force"]
+        workers = options["workers"]
+        errores = 0
+
+        def fallo(model, pk, exc):
+            nonlocal errores
+            errores += 1
+            self.stderr.write(f"{model} #{pk}: {exc}")
+
+        if workers <= 1:
+            for model, pk in tareas:
+                try:
+                    image_derivatives(model, pk, forzar=forzar)
+                except Exception as exc:
+                    fallo(model, pk, exc)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futuros = {
+                    pool.submit(_procesar, model, pk, forzar): (model, pk)
+                    for model, pk in tareas
+                }
+                for futuro in as_completed(futuros):
+                    try:
+                        futuro.result()
+                    except Exception as exc:
+                        fallo(*futuros[futuro], exc)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {len(tareas) - errores} de {len(tareas)} registros procesados."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from reviews.utils.sync_mapa import purgar_tombstones
+
+
+class Command(BaseCommand):
+    help = "Borra las tombstones de relaciones más viejas que la retención de la sync del mapa."
+
+    def handle(self, *args, **options):
+        total = purgar_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Listo: {total} tombstones borradas."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from reviews.utils.aggregates import recalcular_agregados
+from reviews.utils.rollups import recalcular_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula desde las reseñas los agregados guardados en cada café "
+        "y los rollups diarios de CafeStat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "cafe_ids",
+            nargs="*",
+            type=int,
+            help="IDs de cafés a recalcular (por defecto, todos).",
+        )
+
+    def handle(self, *args, **options):
+        cafe_ids = options["cafe_ids"] or None
+        corregidos = recalcular_agregados(cafe_ids)
+        dias = recalcular_stats(cafe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {corregidos} cafés corregidos, {dias} días de rollups recalculados."
+        ))
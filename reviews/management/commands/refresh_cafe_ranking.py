@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from reviews.jobs import programar_vencimiento_ranking
+from reviews.utils.ranking import refrescar_ranking
+
+
+class Command(BaseCommand):
+    help = "Recalcula el score base guardado del ranking de cafés."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "cafe_ids",
+            nargs="*",
+            type=int,
+            help="IDs de cafés a recalcular (por defecto, todos).",
+        )
+
+    def handle(self, *args, **options):
+        cafe_ids = options["cafe_ids"] or None
+        total = refrescar_ranking(cafe_ids)
+        # El boost de actividad reciente decae solo: una tarea lo baja cada hora
+        programar_vencimiento_ranking()
+        self.stdout.write(self.style.SUCCESS(f"Listo: {total} cafés recalculados."))
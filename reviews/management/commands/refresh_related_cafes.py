@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from reviews.utils.relacionados import recalcular_vecinos
+
+
+class Command(BaseCommand):
+    help = "Recalcula la lista guardada de cafés relacionados (CafeNeighbor)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "cafe_ids",
+            nargs="*",
+            type=int,
+            help="IDs de cafés a recalcular (por defecto, todos).",
+        )
+
+    def handle(self, *args, **options):
+        cafe_ids = options["cafe_ids"] or None
+        total = recalcular_vecinos(cafe_ids)
+        self.stdout.write(self.style.SUCCESS(f"Listo: {total} cafés recalculados."))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0025_alter_cafe_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CafeRankingSnapshot',
+            fields=[
+                ('cafe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='reviews.cafe')),
+                ('base_score', models.FloatField(db_index=True, default=0)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
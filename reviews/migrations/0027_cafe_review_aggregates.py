@@ -0,0 +1,85 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:06
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_agregados(apps, schema_editor):
+    Cafe = apps.get_model('reviews', 'Cafe')
+
+    cafes = Cafe.objects.annotate(
+        _suma=Sum('reviews__rating'),
+        _cantidad=Count('reviews'),
+        _positivas=Count('reviews', filter=Q(reviews__rating__gte=4)),
+        _suma_precios=Sum('reviews__precio_capuccino'),
+        _cantidad_precios=Count('reviews__precio_capuccino'),
+    )
+
+    cambiados = []
+    for cafe in cafes.iterator(chunk_size=500):
+        cafe.rating_sum = cafe._suma or 0
+        cafe.review_count = cafe._cantidad
+        cafe.positive_review_count = cafe._positivas
+        cafe.avg_rating = cafe.rating_sum / cafe.review_count if cafe.review_count else None
+        cafe.capuccino_price_sum = cafe._suma_precios or 0
+        cafe.capuccino_price_count = cafe._cantidad_precios
+        cafe.avg_capuccino_price = (
+            cafe.capuccino_price_sum / cafe.capuccino_price_count
+            if cafe.capuccino_price_count else None
+        )
+        cambiados.append(cafe)
+
+    Cafe.objects.bulk_update(
+        cambiados,
+        [
+            'rating_sum', 'review_count', 'positive_review_count', 'avg_rating',
+            'capuccino_price_sum', 'capuccino_price_count', 'avg_capuccino_price',
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0026_cafe_ranking_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cafe',
+            name='avg_capuccino_price',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cafe',
+            name='avg_rating',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cafe',
+            name='capuccino_price_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cafe',
+            name='capuccino_price_sum',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cafe',
+            name='positive_review_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cafe',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cafe',
+            name='review_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_agregados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:10
+
+from django.db import migrations, models
+
+from reviews.utils.geo import geohash_encode
+
+
+def backfill_geohash(apps, schema_editor):
+    Cafe = apps.get_model('reviews', 'Cafe')
+
+    cafes = list(
+        Cafe.objects
+        .filter(latitude__isnull=False, longitude__isnull=False)
+        .only('id', 'latitude', 'longitude')
+    )
+    for cafe in cafes:
+        cafe.geohash = geohash_encode(cafe.latitude, cafe.longitude)
+
+    Cafe.objects.bulk_update(cafes, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0027_cafe_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cafe',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
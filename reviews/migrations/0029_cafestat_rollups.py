@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-17 23:40
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Review = apps.get_model('reviews', 'Review')
+    CafeRelationship = apps.get_model('reviews', 'CafeRelationship')
+    CafeStat = apps.get_model('reviews', 'CafeStat')
+
+    dias = defaultdict(lambda: {'reviews': 0, 'favorites': 0, 'rating_sum': 0})
+    for fila in (
+        Review.objects.annotate(dia=TruncDate('created_at'))
+        .values('cafe_id', 'dia')
+        .annotate(cantidad=Count('id'), suma=Sum('rating'))
+    ):
+        dia = dias[(fila['cafe_id'], fila['dia'])]
+        dia['reviews'] = fila['cantidad']
+        dia['rating_sum'] = fila['suma'] or 0
+    for fila in (
+        CafeRelationship.objects.annotate(dia=TruncDate('created_at'))
+        .values('cafe_id', 'dia')
+        .annotate(cantidad=Count('id'))
+    ):
+        dias[(fila['cafe_id'], fila['dia'])]['favorites'] = fila['cantidad']
+
+    existentes = []
+    for stat in CafeStat.objects.all():
+        valores = dias.pop((stat.cafe_id, stat.date), None)
+        if valores:
+            for campo, valor in valores.items():
+                setattr(stat, campo, valor)
+            existentes.append(stat)
+    CafeStat.objects.bulk_update(existentes, ['reviews', 'favorites', 'rating_sum'], batch_size=500)
+    CafeStat.objects.bulk_create(
+        [CafeStat(cafe_id=cafe_id, date=fecha, **valores) for (cafe_id, fecha), valores in dias.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0028_cafe_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cafestat',
+            name='favorites',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cafestat',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cafestat',
+            name='reviews',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
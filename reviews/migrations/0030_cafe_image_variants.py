@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0029_cafestat_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cafe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
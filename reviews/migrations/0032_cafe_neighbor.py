@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0031_cafe_relationship_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CafeNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('cafe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='reviews.cafe')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='reviews.cafe')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('cafe', 'neighbor'), name='unique_cafe_neighbor')],
+            },
+        ),
+    ]
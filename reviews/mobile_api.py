@@ -1,5 +1,13 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
-from django.db.models import Avg
+from django.db.models import F
+from django.utils.cache import get_conditional_response
 
 from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
@@ -8,8 +16,17 @@ from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.utils import timezone
 
+from core.rate_limit import RateLimitThrottle
+from core.uploads import procesar_subida
+from reviews.utils.cache import get_version
+from reviews.utils.images import TAMANOS, url_derivado
+from reviews.utils.relacionados import encolar_vecinos, sortear, vecinos_provisorios
+from reviews.utils.sync_mapa import MutacionInvalida, aplicar_mutaciones, cambios_desde, leer_token
+from reviews.utils.view_counter import registrar_vista
+
 from reviews.models import (
     Cafe,
+    CafeNeighbor,
     CafeRelationship,
     CafeWhisper,
     Review,
@@ -31,6 +48,8 @@ class CreateCafeAPIView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "mobile_write"
     parser_classes = [MultiPartParser, FormParser]
 
     def post(self, request):
@@ -184,6 +203,22 @@ class CreateCafeAPIView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
+        # Validación por medidas y recompresión sin EXIF (core.uploads)
+        try:
+            foto, foto2, foto3 = [
+                procesar_subida(imagen) if imagen is not None else None
+                for imagen in [foto, foto2, foto3]
+            ]
+        except ValidationError as error:
+            return Response(
+                {
+                    "success": False,
+                    "error": "invalid_photo",
+                    "message": error.messages[0],
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         instagram = str(
             request.data.get("instagram", "")
         ).strip()
@@ -389,6 +424,8 @@ class CafeWhispersAPIView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "mobile_write"
 
     def get(self, request, cafe_id):
         cafe = get_object_or_404(
@@ -497,6 +534,8 @@ class CreateReviewAPIView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "mobile_review"
 
     def post(self, request, cafe_id):
         cafe = get_object_or_404(
@@ -669,6 +708,8 @@ class UpdateReviewAPIView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "mobile_write"
 
     def put(self, request, review_id):
         review = get_object_or_404(
@@ -834,6 +875,8 @@ class ReportReviewAPIView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "mobile_report"
 
     def post(self, request, review_id):
         review = get_object_or_404(
@@ -916,58 +959,169 @@ class ReportReviewAPIView(APIView):
             status=status.HTTP_201_CREATED,
         )
 
+# Características del café, en el orden en que las espera la app
+FEATURES_DETALLE = (
+    "has_wifi",
+    "has_air_conditioning",
+    "has_power_outlets",
+    "has_outdoor_seating",
+    "has_parking",
+    "is_accessible",
+    "has_baby_changing",
+    "is_pet_friendly",
+    "is_kids_friendly",
+    "has_specialty_coffee",
+    "serves_brunch",
+    "serves_breakfast",
+    "serves_alcohol",
+    "has_artisanal_pastries",
+    "is_vegan_friendly",
+    "has_vegetarian_options",
+    "has_gluten_free_options",
+    "has_healthy_options",
+    "has_sugar_free_options",
+    "has_plant_based_milk",
+    "has_garden",
+    "has_water_view",
+    "has_mountain_view",
+    "surrounded_by_nature",
+    "has_rooftop",
+    "has_large_windows",
+    "is_old_house",
+    "is_historic_building",
+    "inside_bookstore",
+    "inside_cultural_space",
+    "laptop_friendly",
+    "quiet_space",
+    "has_books_or_games",
+)
+
+# Igual que el detalle web: se invalida por versión ("cafe_detail")
+CAFE_DETAIL_API_TIMEOUT = 60 * 10
+
+
+def _nombre_publico(user):
+    full_name = user.get_full_name().strip()
+
+    if full_name:
+        return full_name
+    if user.first_name:
+        return user.first_name
+    if user.email:
+        return user.email.split("@")[0]
+    return "Usuario"
+
+
+def _detalle_publico(request, cafe_id, tamano, compacto):
+    """
+    La parte del detalle que es igual para cualquier usuario, ya
+    codificada en JSON (sin `my_review`). None si el café no existe.
+    """
+    cafe = Cafe.objects.prefetch_related("tags").filter(id=cafe_id).first()
+    if cafe is None:
+        return None
+
+    fotos = []
+    for field_name in ["photo1", "photo2", "photo3"]:
+        url = url_derivado(cafe, field_name, tamano)
+        if url:
+            fotos.append(request.build_absolute_uri(url))
+
+    reviews_data = []
+    for review in cafe.reviews.select_related("user").order_by("-created_at")[:5]:
+        avatar_url = url_derivado(review.user, "avatar", "thumb")
+        reviews_data.append(
+            {
+                "id": review.id,
+                "user": _nombre_publico(review.user),
+                "avatar": request.build_absolute_uri(avatar_url) if avatar_url else None,
+                "rating": review.rating,
+                "comment": review.comment,
+                "created_at": review.created_at.strftime("%d/%m/%Y"),
+                "owner_reply": review.owner_reply,
+            }
+        )
+
+    data = {
+        "id": cafe.id,
+        "name": cafe.name,
+        "location": cafe.location,
+        "province": cafe.province,
+        "address": cafe.address,
+        "description": cafe.description,
+        "phone": cafe.phone,
+        "google_maps_url": cafe.google_maps_url,
+        "instagram": cafe.instagram,
+        # Del promedio guardado en el café, sin agregar reseñas
+        "average_rating": str(cafe.average_rating()),
+        "photos": fotos,
+        "latitude": cafe.latitude,
+        "longitude": cafe.longitude,
+    }
+    if compacto:
+        data["features"] = [campo for campo in FEATURES_DETALLE if getattr(cafe, campo)]
+    else:
+        data.update({campo: getattr(cafe, campo) for campo in FEATURES_DETALLE})
+    data.update(
+        {
+            "tags": [tag.name for tag in cafe.tags.all()],
+            "reviews": reviews_data,
+            "reviews_count": cafe.review_count,
+        }
+    )
+
+    return {
+        "json": json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(",", ":")).encode(),
+        "owner_id": cafe.owner_id,
+    }
+
+
 class CafeDetailAPIView(APIView):
     """
     GET /api/mobile/cafes/<cafe_id>/
 
     Devuelve el detalle completo de una cafetería.
+
+    La parte pública se arma una vez por café y queda en el cache ya
+    codificada en JSON; por request solo se busca la reseña del usuario
+    (`my_review`) y se agrega al final. Manda ETag: con `If-None-Match`
+    responde 304 si nada cambió.
+
+    Parámetros:
+      - image_size: thumb / card / detail (por defecto detail)
+      - features=compact: lista de características activas en vez de
+        un booleano por característica
     """
 
     permission_classes = [IsAuthenticated]
 
     def get(self, request, cafe_id):
-        cafe = get_object_or_404(
-            Cafe,
-            id=cafe_id,
+        tamano = request.GET.get("image_size")
+        if tamano not in TAMANOS:
+            tamano = "detail"
+        compacto = request.GET.get("features") == "compact"
+
+        version = get_version("cafe_detail", cafe_id)
+        cache_key = (
+            f"mobile_cafe_detail:{cafe_id}:{version}:{request.scheme}:"
+            f"{request.get_host()}:{tamano}:{int(compacto)}"
         )
+        publico = cache.get(cache_key)
+        if publico is None:
+            publico = _detalle_publico(request, cafe_id, tamano, compacto)
+            if publico is None:
+                raise Http404
+            cache.set(cache_key, publico, CAFE_DETAIL_API_TIMEOUT)
 
-        fotos = []
-
-        for field_name in [
-            "photo1",
-            "photo2",
-            "photo3",
-        ]:
-            field = getattr(
-                cafe,
-                field_name,
-                None,
-            )
-
-            if field:
-                try:
-                    fotos.append(
-                        request.build_absolute_uri(
-                            field.url,
-                        )
-                    )
-                except ValueError:
-                    pass
-
-        tags = list(
-            cafe.tags.values_list(
-                "name",
-                flat=True,
-            )
-        )
-
-        my_review = Review.objects.filter(
-            cafe=cafe,
-            user=request.user,
-        ).first()
+        registrar_vista(request, Cafe(id=cafe_id, owner_id=publico["owner_id"]))
 
         my_review_data = None
-
+        my_review = (
+            Review.objects
+            .filter(cafe_id=cafe_id, user=request.user)
+            .prefetch_related("tags")
+            .first()
+        )
         if my_review:
             my_review_data = {
                 "id": my_review.id,
@@ -975,209 +1129,66 @@ class CafeDetailAPIView(APIView):
                 "comment": my_review.comment,
                 "best_for_plan": my_review.best_for_plan,
                 "precio_capuccino": my_review.precio_capuccino,
-                "tags": list(
-                    my_review.tags.values_list(
-                        "id",
-                        flat=True,
-                    )
-                ),
+                "tags": [tag.id for tag in my_review.tags.all()],
             }
 
-        reviews = (
-            cafe.reviews
-            .select_related("user")
-            .order_by("-created_at")[:5]
+        # {...público..., "my_review": ...} sin volver a codificar lo público
+        body = b"".join(
+            [
+                publico["json"][:-1],
+                b',"my_review":',
+                json.dumps(my_review_data, cls=DjangoJSONEncoder, ensure_ascii=False).encode(),
+                b"}",
+            ]
         )
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
 
-        reviews_data = []
-
-        for review in reviews:
-            full_name = review.user.get_full_name().strip()
-
-            if full_name:
-                user_name = full_name
-            elif review.user.first_name:
-                user_name = review.user.first_name
-            elif review.user.email:
-                user_name = review.user.email.split("@")[0]
-            else:
-                user_name = "Usuario"
-
-            avatar_url = None
-
-            if review.user.avatar:
-                try:
-                    avatar_url = request.build_absolute_uri(
-                        review.user.avatar.url
-                    )
-                except ValueError:
-                    avatar_url = None
-
-            reviews_data.append(
-                {
-                    "id": review.id,
-                    "user": user_name,
-                    "avatar": avatar_url,
-                    "rating": review.rating,
-                    "comment": review.comment,
-                    "created_at": review.created_at.strftime(
-                        "%d/%m/%Y"
-                    ),
-                    "owner_reply": review.owner_reply,
-                }
-            )
-
-        return Response(
-            {
-                "id": cafe.id,
-                "name": cafe.name,
-                "location": cafe.location,
-                "province": cafe.province,
-                "address": cafe.address,
-                "description": cafe.description,
-                "phone": cafe.phone,
-                "google_maps_url": cafe.google_maps_url,
-                "instagram": cafe.instagram,
-                "average_rating": str(
-                    cafe.average_rating()
-                ),
-                "photos": fotos,
-                "latitude": cafe.latitude,
-                "longitude": cafe.longitude,
-                "has_wifi": cafe.has_wifi,
-                "has_air_conditioning":
-                    cafe.has_air_conditioning,
-                "has_power_outlets":
-                    cafe.has_power_outlets,
-                "has_outdoor_seating":
-                    cafe.has_outdoor_seating,
-                "has_parking": cafe.has_parking,
-                "is_accessible": cafe.is_accessible,
-                "has_baby_changing":
-                    cafe.has_baby_changing,
-                "is_pet_friendly":
-                    cafe.is_pet_friendly,
-                "is_kids_friendly":
-                    cafe.is_kids_friendly,
-                "has_specialty_coffee":
-                    cafe.has_specialty_coffee,
-                "serves_brunch":
-                    cafe.serves_brunch,
-                "serves_breakfast":
-                    cafe.serves_breakfast,
-                "serves_alcohol":
-                    cafe.serves_alcohol,
-                "has_artisanal_pastries":
-                    cafe.has_artisanal_pastries,
-                "is_vegan_friendly":
-                    cafe.is_vegan_friendly,
-                "has_vegetarian_options":
-                    cafe.has_vegetarian_options,
-                "has_gluten_free_options":
-                    cafe.has_gluten_free_options,
-                "has_healthy_options":
-                    cafe.has_healthy_options,
-                "has_sugar_free_options":
-                    cafe.has_sugar_free_options,
-                "has_plant_based_milk":
-                    cafe.has_plant_based_milk,
-
-                "has_garden":
-                    cafe.has_garden,
-                "has_water_view":
-                    cafe.has_water_view,
-                "has_mountain_view":
-                    cafe.has_mountain_view,
-                "surrounded_by_nature":
-                    cafe.surrounded_by_nature,
-                "has_rooftop":
-                    cafe.has_rooftop,
-                "has_large_windows":
-                    cafe.has_large_windows,
-                "is_old_house":
-                    cafe.is_old_house,
-                "is_historic_building":
-                    cafe.is_historic_building,
-                "inside_bookstore":
-                    cafe.inside_bookstore,
-                "inside_cultural_space":
-                    cafe.inside_cultural_space,
-                "laptop_friendly":
-                    cafe.laptop_friendly,
-                "quiet_space":
-                    cafe.quiet_space,
-                "has_books_or_games":
-                    cafe.has_books_or_games,
-                "tags": tags,
-                "reviews": reviews_data,
-                "reviews_count": cafe.reviews.count(),
-                "my_review": my_review_data,
-            },
-            status=status.HTTP_200_OK,
-        )
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        # Depende del usuario: que ningún cache compartido la guarde
+        response["Cache-Control"] = "private, no-cache"
+        return response
 
 class RelatedCafesAPIView(APIView):
     """
     GET /api/mobile/cafes/<cafe_id>/related/
 
-    Devuelve hasta 3 cafeterías relacionadas.
-    Prioriza misma zona y misma provincia.
+    Devuelve hasta 3 cafeterías relacionadas, sorteadas entre los
+    vecinos precalculados del café (misma zona y provincia,
+    características en común, cercanía): los de más score salen más.
     Nunca incluye la cafetería actual.
     """
 
     permission_classes = [IsAuthenticated]
 
     def get(self, request, cafe_id):
-        cafe_actual = get_object_or_404(
-            Cafe,
-            id=cafe_id,
+        vecinos = list(
+            CafeNeighbor.objects
+            .filter(cafe_id=cafe_id)
+            .values_list("neighbor_id", "score")
         )
 
-        cafes_seleccionados = []
-        ids_seleccionados = [cafe_actual.id]
-
-        def agregar_cafes(queryset):
-            lugares_disponibles = 3 - len(cafes_seleccionados)
-
-            if lugares_disponibles <= 0:
-                return
-
-            nuevos_cafes = list(
-                queryset
-                .exclude(id__in=ids_seleccionados)
-                .annotate(
-                    average_rating=Avg("reviews__rating"),
-                )
+        if not vecinos:
+            # Todavía sin calcular: unos candidatos baratos (misma zona o
+            # provincia, con LIMIT) y se encola la lista de verdad
+            vecinos = vecinos_provisorios(cafe_id)
+            if vecinos is None:
+                raise Http404
+            encolar_vecinos(cafe_id)
+
+        elegidos = sortear(vecinos, 3)
+        por_id = {
+            cafe.id: cafe
+            for cafe in (
+                Cafe.objects
+                .filter(id__in=elegidos)
+                .annotate(average_rating=F("avg_rating"))
                 .prefetch_related("tags")
-                .order_by("?")[:lugares_disponibles]
-            )
-
-            cafes_seleccionados.extend(nuevos_cafes)
-            ids_seleccionados.extend(
-                cafe.id
-                for cafe in nuevos_cafes
-            )
-
-        # 1. Misma zona
-        if cafe_actual.location:
-            agregar_cafes(
-                Cafe.objects.filter(
-                    location=cafe_actual.location,
-                )
             )
-
-        # 2. Misma provincia
-        if cafe_actual.province:
-            agregar_cafes(
-                Cafe.objects.filter(
-                    province=cafe_actual.province,
-                )
-            )
-
-        # 3. Completar con otras cafeterías
-        agregar_cafes(
-            Cafe.objects.all()
-        )
+        }
+        cafes_seleccionados = [por_id[vecino] for vecino in elegidos if vecino in por_id]
 
         serializer = CafeSerializer(
             cafes_seleccionados,
@@ -1210,7 +1221,92 @@ class MyMapAPIView(generics.ListAPIView):
             .select_related("cafe")
             .order_by("-updated_at")
         )
-    
+
+
+class MyMapSyncAPIView(APIView):
+    """
+    GET  /api/mobile/my-map/sync/?since=<sync_token>
+    POST /api/mobile/my-map/sync/
+
+    Sincronización incremental del mapa (ver reviews.utils.sync_mapa).
+
+    GET devuelve lo que cambió desde `since`:
+        {"sync_token": "...", "full": false,
+         "changed": [<relación con resumen del café>, ...],
+         "deleted": [cafe_id, ...]}
+    Sin `since` (o si es muy viejo) `full` es true y `changed` trae todo.
+
+    POST aplica varios cambios juntos y devuelve lo mismo que el GET:
+        {"since": "<sync_token>",
+         "mutations": [{"cafe_id": 3, "status": "visited"},
+                       {"cafe_id": 3, "collection": "work", "private_note": "..."},
+                       {"cafe_id": 7, "status": null}]}
+    Si alguno no es válido no se guarda ninguno (400 con su `index`).
+    """
+
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "mobile_write"
+
+    def _token_invalido(self):
+        return Response(
+            {
+                "success": False,
+                "error": "invalid_since",
+                "message": "El token de sincronización no es válido.",
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def _respuesta(self, request, desde, **extra):
+        token, full, relaciones, borrados = cambios_desde(request.user, desde)
+        serializer = CafeRelationshipSerializer(
+            relaciones,
+            many=True,
+            context={"request": request, "image_size": "thumb"},
+        )
+
+        return Response(
+            {
+                **extra,
+                "sync_token": token,
+                "full": full,
+                "changed": serializer.data,
+                "deleted": borrados,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def get(self, request):
+        try:
+            desde = leer_token(request.GET.get("since"))
+        except ValueError:
+            return self._token_invalido()
+
+        return self._respuesta(request, desde)
+
+    def post(self, request):
+        try:
+            desde = leer_token(request.data.get("since"))
+        except ValueError:
+            return self._token_invalido()
+
+        try:
+            aplicados = aplicar_mutaciones(request.user, request.data.get("mutations"))
+        except MutacionInvalida as exc:
+            return Response(
+                {
+                    "success": False,
+                    "error": exc.error,
+                    "message": exc.mensaje,
+                    "index": exc.indice,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return self._respuesta(request, desde, success=True, applied=aplicados)
+
+
 class SetCafeStatusAPIView(APIView):
     """
     POST /api/mobile/cafes/<cafe_id>/set-status/
@@ -1220,6 +1316,8 @@ class SetCafeStatusAPIView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "mobile_write"
 
     def post(self, request, cafe_id):
         cafe = get_object_or_404(
@@ -1293,6 +1391,8 @@ class SetCafeCollectionAPIView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "mobile_write"
 
     def post(self, request, cafe_id):
         cafe = get_object_or_404(
@@ -1340,7 +1440,7 @@ class SetCafeCollectionAPIView(APIView):
 
         relationship.collection = collection
         relationship.save(
-            update_fields=["collection"],
+            update_fields=["collection", "updated_at"],
         )
 
         return Response(
@@ -1374,6 +1474,8 @@ class BecomeOwnerAPIView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "mobile_write"
 
     def post(self, request):
         user = request.user
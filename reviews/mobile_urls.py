@@ -4,6 +4,7 @@ from .mobile_api import (
     RelatedCafesAPIView,
     MeAPIView,
     MyMapAPIView,
+    MyMapSyncAPIView,
     SetCafeStatusAPIView,
     SetCafeCollectionAPIView,
     CreateCafeAPIView,
@@ -30,6 +31,12 @@ urlpatterns = [
         name="mobile-my-map",
     ),
 
+    path(
+        "my-map/sync/",
+        MyMapSyncAPIView.as_view(),
+        name="mobile-my-map-sync",
+    ),
+
     path(
         "me/",
         MeAPIView.as_view(),
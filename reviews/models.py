@@ -1,11 +1,12 @@
 from django.conf import settings
 from django.db import models
-from django.db.models import Avg
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from PIL import Image
 from io import BytesIO
 from django.core.files.base import ContentFile
 import os
+from reviews.utils.geo import geohash_encode
 from reviews.utils.images import resize_and_compress
 from .claims import ClaimStatus
 
@@ -90,6 +91,8 @@ class Cafe(models.Model):
     photo2_title = models.CharField(max_length=200, blank=True, null=True)
     photo3 = models.ImageField(upload_to='cafes/', blank=True, null=True)
     photo3_title = models.CharField(max_length=200, blank=True, null=True)
+    # Derivados de cada foto por tamaño (ver reviews.utils.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     # Características del café (declaradas por el dueño)
 
@@ -208,10 +211,22 @@ class Cafe(models.Model):
     # Ubicación
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
+    # Celda de geohash de (latitude, longitude); se calcula al guardar
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Agregados de reseñas (los mantienen las señales de Review;
+    # `recompute_cafe_aggregates` los recalcula si se desincronizan)
+    rating_sum = models.IntegerField(default=0, editable=False)
+    review_count = models.IntegerField(default=0, editable=False)
+    positive_review_count = models.IntegerField(default=0, editable=False)
+    avg_rating = models.FloatField(blank=True, null=True, editable=False)
+    capuccino_price_sum = models.BigIntegerField(default=0, editable=False)
+    capuccino_price_count = models.IntegerField(default=0, editable=False)
+    avg_capuccino_price = models.FloatField(blank=True, null=True, editable=False)
+
     # Visibilidad
     VISIBILITY_CHOICES = (
         (0, 'Gratis'),
@@ -257,12 +272,43 @@ class Cafe(models.Model):
             models.Index(fields=["owner"]),
         ]
 
+    # Los escriben solo los UPDATE con F() de reviews.utils.aggregates (o
+    # quien los nombre en `update_fields`): un save() común de un café
+    # cargado antes pisaría con valores viejos las reseñas del medio
+    CAMPOS_AGREGADOS = (
+        'rating_sum',
+        'review_count',
+        'positive_review_count',
+        'avg_rating',
+        'capuccino_price_sum',
+        'capuccino_price_count',
+        'avg_capuccino_price',
+    )
+
     def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # Como hace Django con los diferidos: se guarda lo cargado
+            deferidos = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.CAMPOS_AGREGADOS
+                and field.attname not in deferidos
+            ]
+
         super().save(*args, **kwargs)
 
     def average_rating(self):
-        result = self.reviews.aggregate(Avg('rating'))
-        return round(result['rating__avg'], 1) if result['rating__avg'] else 'Sin calificación'
+        return round(self.avg_rating, 1) if self.avg_rating else 'Sin calificación'
 
     def __str__(self):
         return self.name
@@ -308,6 +354,21 @@ class Review(models.Model):
             models.Index(fields=["-created_at"]),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores tal como están en la base, para que las señales apliquen
+        # solo la diferencia sobre los agregados del café
+        instance._agregados_originales = instance.valores_agregados()
+        return instance
+
+    def valores_agregados(self):
+        """(cafe_id, rating, precio_capuccino) o None si falta alguno diferido."""
+        diferidos = self.get_deferred_fields()
+        if diferidos & {'cafe_id', 'rating', 'precio_capuccino'}:
+            return None
+        return (self.cafe_id, self.rating, self.precio_capuccino)
+
     def __str__(self):
         return f'Reseña de {self.user} en {self.cafe}'
     
@@ -396,10 +457,46 @@ class CafeRelationship(models.Model):
     def __str__(self):
         return f"{self.user} → {self.cafe} ({self.status})"
 
+
+class CafeRelationshipTombstone(models.Model):
+    """
+    Marca de una relación borrada, para que la sincronización incremental
+    de la app (`my-map/sync/`) pueda avisar que el café salió del mapa.
+    Guarda el id del café suelto: sobrevive aunque se borre el café.
+    Las viejas se purgan con `purge_relationship_tombstones`.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="cafe_relationship_tombstones",
+    )
+
+    cafe_id = models.PositiveIntegerField()
+
+    deleted_at = models.DateTimeField(
+        default=timezone.now,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "deleted_at"]),
+            models.Index(fields=["deleted_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user} ✕ café {self.cafe_id}"
+
+
 class CafeStat(models.Model):
     cafe = models.ForeignKey('Cafe', on_delete=models.CASCADE, related_name='stats')
     date = models.DateField()
     views = models.PositiveIntegerField(default=0)
+    # Rollup del día (ver reviews.utils.rollups): reseñas y favoritos
+    # creados ese día y la suma de sus ratings
+    reviews = models.IntegerField(default=0)
+    favorites = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
 
     class Meta:
         unique_together = ('cafe', 'date')
@@ -407,6 +504,53 @@ class CafeStat(models.Model):
 
     def __str__(self):
         return f'{self.cafe.name} - {self.date}: {self.views} vistas'
+
+
+class CafeRankingSnapshot(models.Model):
+    """
+    Score base del ranking (la parte que no depende del visitante),
+    guardado para no recalcularlo en cada listado.
+    """
+    cafe = models.OneToOneField(
+        'Cafe',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+    )
+    base_score = models.FloatField(default=0, db_index=True)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.cafe_id}: {self.base_score}'
+
+
+class CafeNeighbor(models.Model):
+    """
+    Cafés relacionados precalculados (ver reviews.utils.relacionados):
+    los mejores vecinos de cada café con su score, para sortear entre
+    ellos sin ordenar la tabla de cafés en cada request.
+    """
+    cafe = models.ForeignKey(
+        'Cafe',
+        on_delete=models.CASCADE,
+        related_name='neighbors',
+    )
+    neighbor = models.ForeignKey(
+        'Cafe',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # También es el índice de la búsqueda por café
+            models.UniqueConstraint(fields=['cafe', 'neighbor'], name='unique_cafe_neighbor'),
+        ]
+
+    def __str__(self):
+        return f'{self.cafe_id} → {self.neighbor_id}: {self.score:.2f}'
+
     
     # --- Likes de reseñas ---
 class ReviewLike(models.Model):
@@ -525,4 +669,4 @@ class CafeWhisper(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.user} → {self.cafe}: {self.text}"
\ No newline at end of file
+        return f"{self.user} → {self.cafe}: {self.text}"
\ No newline at end of file
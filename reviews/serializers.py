@@ -1,8 +1,62 @@
-from django.db.models import Count
 from rest_framework import serializers
 from reviews.models import Cafe, Tag
 from reviews.models import CafeRelationship
 from django.contrib.auth import get_user_model
+from reviews.utils.images import TAMANOS, url_derivado
+from reviews.utils.tags import top_tags_por_cafe
+
+
+class ImageSizeMixin:
+    """
+    URLs de imágenes en el tamaño pedido (thumb / card / detail, ver
+    reviews.utils.images). El cliente lo elige con `?image_size=`; si no,
+    vale el del contexto o `default_image_size` del serializer.
+    """
+
+    default_image_size = "card"
+
+    def image_size(self):
+        request = self.context.get("request")
+        pedido = request.GET.get("image_size") if request else None
+        if pedido in TAMANOS:
+            return pedido
+        return self.context.get("image_size", self.default_image_size)
+
+    def build_image_url(self, obj, campo, size=None):
+        url = url_derivado(obj, campo, size or self.image_size())
+        if url is None:
+            return None
+
+        request = self.context.get("request")
+        if request:
+            return request.build_absolute_uri(url)
+        return url
+
+
+def campos_elegidos(request, disponibles):
+    """
+    Campos pedidos con `?fields=id,name,latitude` que existen en
+    `disponibles`. None si no se pidió nada (o nada válido): van todos.
+    """
+    valor = request.GET.get("fields") if request else None
+    if not valor:
+        return None
+    elegidos = {campo.strip() for campo in valor.split(",")} & set(disponibles)
+    return elegidos or None
+
+
+class CamposDinamicosMixin:
+    """
+    Sparse fieldsets: con `?fields=` el serializer devuelve (y calcula)
+    solo esos campos. Los que no existen se ignoran.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        elegidos = campos_elegidos(self.context.get("request"), self.fields)
+        if elegidos:
+            for campo in set(self.fields) - elegidos:
+                self.fields.pop(campo)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -11,7 +65,21 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "category"]
 
 
-class CafeSerializer(serializers.ModelSerializer):
+class CafeListSerializer(serializers.ListSerializer):
+    """
+    Arma los top tags de todos los cafés de la lista con una sola consulta
+    y los deja en el contexto (`top_tags`: {cafe_id: [nombres]}). Si la
+    vista ya los pasó en el contexto, se usan esos.
+    """
+
+    def to_representation(self, data):
+        cafes = list(data.all() if hasattr(data, "all") else data)
+        if "top_tags" in self.child.fields and "top_tags" not in self.context:
+            self.context["top_tags"] = top_tags_por_cafe([cafe.id for cafe in cafes])
+        return super().to_representation(cafes)
+
+
+class CafeSerializer(CamposDinamicosMixin, ImageSizeMixin, serializers.ModelSerializer):
     average_rating = serializers.FloatField(read_only=True)
 
     tags = TagSerializer(many=True, read_only=True)
@@ -22,37 +90,25 @@ class CafeSerializer(serializers.ModelSerializer):
 
     top_tags = serializers.SerializerMethodField()
 
-    def build_image_url(self, image_field):
-        if image_field:
-            request = self.context.get("request")
-
-            if request:
-                return request.build_absolute_uri(image_field.url)
-
-            return image_field.url
-
-        return None
-
     def get_photo1_url(self, obj):
-        return self.build_image_url(obj.photo1)
+        return self.build_image_url(obj, "photo1")
 
     def get_photo2_url(self, obj):
-        return self.build_image_url(obj.photo2)
+        return self.build_image_url(obj, "photo2")
 
     def get_photo3_url(self, obj):
-        return self.build_image_url(obj.photo3)
+        return self.build_image_url(obj, "photo3")
 
     def get_top_tags(self, obj):
-        return list(
-            Tag.objects
-            .filter(reviews__cafe=obj)
-            .annotate(num=Count("id"))
-            .order_by("-num", "name")
-            .values_list("name", flat=True)[:5]
-        )
+        top_tags = self.context.get("top_tags")
+        if top_tags is None or obj.id not in top_tags:
+            # Un café suelto (detalle): su propia consulta
+            return top_tags_por_cafe([obj.id])[obj.id]
+        return top_tags[obj.id]
 
     class Meta:
         model = Cafe
+        list_serializer_class = CafeListSerializer
 
         fields = [
             "id",
@@ -117,7 +173,7 @@ class CafeSerializer(serializers.ModelSerializer):
             "tags",
         ]
 
-class CafeRelationshipSerializer(serializers.ModelSerializer):
+class CafeRelationshipSerializer(ImageSizeMixin, serializers.ModelSerializer):
     cafe_id = serializers.IntegerField(source="cafe.id")
     cafe_name = serializers.CharField(source="cafe.name")
 
@@ -136,24 +192,10 @@ class CafeRelationshipSerializer(serializers.ModelSerializer):
     average_rating = serializers.SerializerMethodField()
 
     def get_cafe_photo(self, obj):
-        if obj.cafe.photo1:
-            request = self.context.get("request")
-
-            if request:
-                return request.build_absolute_uri(obj.cafe.photo1.url)
-
-            return obj.cafe.photo1.url
-
-        return None
+        return self.build_image_url(obj.cafe, "photo1")
 
     def get_average_rating(self, obj):
-        from django.db.models import Avg
-
-        return (
-            obj.cafe.reviews.aggregate(
-                average=Avg("rating")
-            )["average"]
-        )
+        return obj.cafe.avg_rating
 
     class Meta:
         model = CafeRelationship
@@ -174,7 +216,9 @@ class CafeRelationshipSerializer(serializers.ModelSerializer):
 User = get_user_model()
 
 
-class MobileUserSerializer(serializers.ModelSerializer):
+class MobileUserSerializer(ImageSizeMixin, serializers.ModelSerializer):
+    default_image_size = "thumb"
+
     avatar = serializers.SerializerMethodField()
 
     class Meta:
@@ -189,12 +233,4 @@ class MobileUserSerializer(serializers.ModelSerializer):
         ]
 
     def get_avatar(self, obj):
-        if obj.avatar:
-            request = self.context.get("request")
-
-            if request:
-                return request.build_absolute_uri(obj.avatar.url)
-
-            return obj.avatar.url
-
-        return None
\ No newline at end of file
+        return self.build_image_url(obj, "avatar")
\ No newline at end of file
@@ -1,206 +1,360 @@
-from typing import Iterable, Optional, Tuple
+from typing import Optional
 
-from django.conf import settings
-from django.core.cache import cache
-from django.core.cache.utils import make_template_fragment_key
-from django.core.mail import EmailMultiAlternatives
-from django.db.models.signals import post_delete, post_save
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from django.template.loader import render_to_string
-from django.template import TemplateDoesNotExist
-from django.urls import reverse
-from django.contrib.sites.models import Site
+from django.utils import timezone
 
-from .models import Review, ReviewReport
+from core.jobs import enqueue
+
+from .jobs import SITEMAP_PING_WINDOW
+from .models import (
+    Cafe, CafeRelationship, CafeRelationshipTombstone, CafeWhisper, Review, ReviewLike, ReviewReport,
+)
+from .utils import geo_index
+from .utils.cache import bump_version
+from .utils.images import CAMPOS_CON_IMAGEN, campos_pendientes
+from .utils.mapa import CAMPOS_MAPA
+from .utils.relacionados import CAMPOS_RELACIONADOS, encolar_vecinos, hay_cambios
+from .utils.aggregates import resena_agregada, resena_eliminada, resena_modificada
+from .utils.rollups import favorito
 
 
 # -----------------------------
-# Cache: invalidación fragmento
+# Cache: fragmento de reseñas
 # -----------------------------
-def _invalidate_cafe_reviews_cache(cafe_id: int, extra_user_ids: Optional[Iterable[int]] = None) -> None:
+def invalidar_lista_resenas(cafe_id: Optional[int]) -> None:
     """
-    Invalida el fragment cacheado de la lista de reseñas del detalle del café.
-
-    El template usa:
-        {% cache 600 cafe_reviews_list cafe.id user.id %}
+    Sube la versión de la lista de reseñas del café. El template la usa
+    en la key del fragmento:
+        {% cache 600 cafe_reviews_list cafe.id reviews_version page_obj.number %}
 
-    Eso significa que la key varía por (cafe_id, user_id).
-    No podemos borrar *todas* las combinaciones de usuarios, pero sí:
-      - las variantes anónimas ("", "None")
-      - y opcionalmente algunas ids relevantes (autor de la reseña, dueño)
+    La key es la misma para todos los usuarios, así que una sola subida
+    invalida todas las variantes (reseñas, likes y respuestas del dueño).
     """
-    user_keys = ["", "None"]
-    if extra_user_ids:
-        user_keys.extend([str(uid) for uid in extra_user_ids if uid])
+    if not cafe_id:
+        return
+    bump_version("cafe_reviews", cafe_id)
+    transaction.on_commit(lambda: bump_version("cafe_reviews", cafe_id))
 
-    for u in user_keys:
-        key = make_template_fragment_key("cafe_reviews_list", [cafe_id, u])
-        cache.delete(key)
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def _review_changed_invalidate(sender, instance: Review, raw: bool = False, **kwargs):
+    invalidar_lista_resenas(instance.cafe_id)
+    if raw:
+        # loaddata: no hay contenido nuevo que avisar
+        return
+    # Nuevo contenido público: avisamos a buscadores, agrupado por ventana
+    enqueue("reviews.ping_sitemap", delay=SITEMAP_PING_WINDOW, dedupe_key="ping_sitemap")
 
 
 # -----------------------------
-# Sitemap ping (compat Django 5)
+# Cache: sitemap.xml
 # -----------------------------
-def _safe_ping_sitemap() -> None:
-    """
-    Intenta notificar a buscadores que cambió el contenido.
-    - No explota en dev/CI.
-    - En prod intenta ping a Google/Bing con GET a sus endpoints.
-    """
-    # En dev no hacemos nada
-    if getattr(settings, "DEBUG", False):
+@receiver(post_save, sender=Cafe)
+@receiver(post_delete, sender=Cafe)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def _sitemap_changed(sender, instance, raw: bool = False, **kwargs):
+    # Se regenera en el próximo pedido (lastmod, cafés nuevos o borrados)
+    if raw:
         return
+    bump_version("sitemap")
+    transaction.on_commit(lambda: bump_version("sitemap"))
+
 
-    # Construimos la URL absoluta del sitemap.xml usando Sites
-    try:
-        site = Site.objects.get_current()
-        domain = site.domain.strip()
-        if not domain:
+@receiver(m2m_changed, sender=Review.tags.through)
+def _review_tags_changed(sender, instance, action: str, reverse: bool = False, pk_set=None, **kwargs):
+    # Los tags se guardan después de la reseña y también se ven en el detalle
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            cafe_ids = [instance.cafe_id]
+        else:
             return
-        if not domain.startswith("http"):
-            sitemap_url = f"https://{domain}/sitemap.xml"
+    elif action in ("post_add", "post_remove"):
+        cafe_ids = Review.objects.filter(pk__in=pk_set or ()).values_list("cafe_id", flat=True).distinct()
+    elif action == "pre_clear":
+        cafe_ids = instance.reviews.values_list("cafe_id", flat=True).distinct()
+    else:
+        return
+
+    cafe_ids = list(cafe_ids)
+    for cafe_id in cafe_ids:
+        invalidar_lista_resenas(cafe_id)
+        invalidar_detalle_cafe(cafe_id)
+    # Cambian los top tags que muestra la API
+    tocar_cafes(cafe_ids)
+
+
+@receiver(m2m_changed, sender=Cafe.tags.through)
+def _cafe_tags_changed(sender, instance, action: str, reverse: bool = False, pk_set=None, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            cafe_ids = [instance.pk]
         else:
-            sitemap_url = f"{domain.rstrip('/')}/sitemap.xml"
-    except Exception:
+            return
+    elif action in ("post_add", "post_remove"):
+        cafe_ids = list(pk_set or ())
+    elif action == "pre_clear":
+        cafe_ids = list(instance.cafes.values_list("id", flat=True))
+    else:
         return
 
-    # Pings “best effort” (si fallan, seguimos)
-    try:
-        import urllib.parse
-        import urllib.request
+    # Los tags del café también van en el detalle cacheado de la app
+    for cafe_id in cafe_ids:
+        invalidar_detalle_cafe(cafe_id)
+    tocar_cafes(cafe_ids)
 
-        encoded = urllib.parse.quote(sitemap_url, safe="")
-        endpoints = [
-            f"https://www.google.com/ping?sitemap={encoded}",
-            f"https://www.bing.com/ping?sitemap={encoded}",
-        ]
-        for url in endpoints:
-            try:
-                urllib.request.urlopen(url, timeout=2)  # no bloqueamos el request principal
-            except Exception:
-                pass
-    except Exception:
-        pass
+
+def tocar_cafes(cafe_ids) -> None:
+    """
+    Marca los cafés como modificados (`updated_at`) cuando cambia algo que
+    muestra la API sin pasar por `Cafe.save()`: el ETag y el Last-Modified
+    de /api/cafes/ salen de ahí.
+    """
+    if cafe_ids:
+        Cafe.objects.filter(pk__in=cafe_ids).update(updated_at=timezone.now())
 
 
+# ---------------------------------------------
+# Agregados de reseñas guardados en el café y
+# rollups diarios (CafeStat)
+# ---------------------------------------------
 @receiver(post_save, sender=Review)
-def _review_saved_invalidate(sender, instance: Review, created: bool, **kwargs):
-    # Autor y dueño son buenos candidatos para invalidar su versión cacheada
-    extra = [getattr(instance, "user_id", None), getattr(instance.cafe, "owner_id", None)]
-    _invalidate_cafe_reviews_cache(instance.cafe_id, extra_user_ids=extra)
-    # Nuevo contenido público: avisamos a buscadores (seguro/no bloqueante)
-    _safe_ping_sitemap()
+def _review_saved_aggregates(sender, instance: Review, created: bool, raw: bool = False, **kwargs):
+    if raw:
+        return
+    if created:
+        resena_agregada(instance)
+    else:
+        resena_modificada(instance)
+
+
+@receiver(post_delete, sender=Review)
+def _review_deleted_aggregates(sender, instance: Review, **kwargs):
+    resena_eliminada(instance)
+
+
+@receiver(post_save, sender=CafeRelationship)
+def _relationship_saved_rollup(sender, instance: CafeRelationship, created: bool, raw: bool = False, **kwargs):
+    if created and not raw:
+        favorito(instance, 1)
+
+
+@receiver(post_delete, sender=CafeRelationship)
+def _relationship_deleted_rollup(sender, instance: CafeRelationship, **kwargs):
+    favorito(instance, -1)
 
 
+# ---------------------------------------------
+# Tombstones para la sync del mapa (app mobile)
+# ---------------------------------------------
+def _crear_tombstone(user_id: int, cafe_id: int) -> None:
+    # Al confirmar: si se borró el usuario (cascada) ya no hace falta
+    User = get_user_model()
+    if User.objects.filter(pk=user_id).exists():
+        CafeRelationshipTombstone.objects.create(user_id=user_id, cafe_id=cafe_id)
+
+
+@receiver(post_delete, sender=CafeRelationship)
+def _relationship_deleted_tombstone(sender, instance: CafeRelationship, **kwargs):
+    user_id, cafe_id = instance.user_id, instance.cafe_id
+    transaction.on_commit(lambda: _crear_tombstone(user_id, cafe_id))
+
+
+# ---------------------------------------------
+# Cache del detalle público del café (versión)
+# ---------------------------------------------
+def invalidar_detalle_cafe(cafe_id: Optional[int]) -> None:
+    """
+    Sube la versión del detalle cacheado del café. Se sube ya y otra vez
+    al confirmar, por si otro request lo regeneró con datos sin confirmar.
+    """
+    if not cafe_id:
+        return
+    bump_version("cafe_detail", cafe_id)
+    transaction.on_commit(lambda: bump_version("cafe_detail", cafe_id))
+
+
+@receiver(post_save, sender=Cafe)
+@receiver(post_delete, sender=Cafe)
+def _cafe_changed_detail(sender, instance: Cafe, **kwargs):
+    invalidar_detalle_cafe(instance.pk)
+
+
+@receiver(post_save, sender=Review)
 @receiver(post_delete, sender=Review)
-def _review_deleted_invalidate(sender, instance: Review, **kwargs):
-    extra = [getattr(instance, "user_id", None), getattr(instance.cafe, "owner_id", None)]
-    _invalidate_cafe_reviews_cache(instance.cafe_id, extra_user_ids=extra)
-    _safe_ping_sitemap()
+@receiver(post_save, sender=CafeRelationship)
+@receiver(post_delete, sender=CafeRelationship)
+@receiver(post_save, sender=CafeWhisper)
+@receiver(post_delete, sender=CafeWhisper)
+def _cafe_content_changed_detail(sender, instance, **kwargs):
+    invalidar_detalle_cafe(instance.cafe_id)
+
+
+@receiver(post_save, sender=ReviewLike)
+@receiver(post_delete, sender=ReviewLike)
+def _review_like_changed_detail(sender, instance: ReviewLike, **kwargs):
+    cafe_id = (
+        Review.objects
+        .filter(pk=instance.review_id)
+        .values_list("cafe_id", flat=True)
+        .first()
+    )
+    invalidar_detalle_cafe(cafe_id)
+    invalidar_lista_resenas(cafe_id)
+
+
+# Nombre y avatar de quien reseña: van en el detalle y la lista de reseñas
+CAMPOS_AUTOR = {"first_name", "last_name", "email", "avatar", "image_variants"}
+
+
+def invalidar_cafes_de_autor(user_id: int) -> None:
+    cafe_ids = Review.objects.filter(user_id=user_id).values_list("cafe_id", flat=True).distinct()
+    for cafe_id in cafe_ids:
+        invalidar_detalle_cafe(cafe_id)
+        invalidar_lista_resenas(cafe_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def _autor_guardado(sender, instance, created: bool, raw: bool = False, update_fields=None, **kwargs):
+    if created or raw:
+        return
+    # El login solo toca `last_login`
+    if update_fields is not None and not CAMPOS_AUTOR & set(update_fields):
+        return
+    invalidar_cafes_de_autor(instance.pk)
 
 
 # ----------------------------------------
-# Emails al dueño: nueva reseña / denuncia
+# Índice geográfico en memoria (distancias)
 # ----------------------------------------
-def _render_email(subject_tpl: str, text_tpl: str, html_tpl: str, ctx: dict) -> Tuple[str, str, str]:
+def _invalidar_geo_index() -> None:
+    # Ya mismo (para este proceso) y otra vez al confirmar, por si otro
+    # proceso reconstruyó el índice antes de que el cambio fuera visible
+    geo_index.invalidar()
+    transaction.on_commit(geo_index.invalidar)
+
+
+@receiver(post_save, sender=Cafe)
+def _cafe_saved_geo_index(sender, instance: Cafe, raw: bool = False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {"latitude", "longitude"} & set(update_fields):
+        return
+    _invalidar_geo_index()
+
+
+@receiver(post_delete, sender=Cafe)
+def _cafe_deleted_geo_index(sender, instance: Cafe, **kwargs):
+    _invalidar_geo_index()
+
+
+# ----------------------------------------
+# Tiles del mapa (clusters y cafés por zona)
+# ----------------------------------------
+@receiver(post_save, sender=Cafe)
+def _cafe_saved_mapa(sender, instance: Cafe, raw: bool = False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not CAMPOS_MAPA & set(update_fields):
+        return
+    bump_version("mapa")
+    transaction.on_commit(lambda: bump_version("mapa"))
+
+
+@receiver(post_delete, sender=Cafe)
+def _cafe_deleted_mapa(sender, instance: Cafe, **kwargs):
+    bump_version("mapa")
+    transaction.on_commit(lambda: bump_version("mapa"))
+
+
+# ---------------------------------------------
+# Cafés relacionados precalculados (CafeNeighbor)
+# ---------------------------------------------
+@receiver(post_save, sender=Cafe)
+def _cafe_saved_vecinos(sender, instance: Cafe, raw: bool = False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not CAMPOS_RELACIONADOS & set(update_fields):
+        return
+    if hay_cambios(instance):
+        encolar_vecinos(instance.pk)
+
+
+@receiver(post_delete, sender=Cafe)
+def _cafe_deleted_vecinos(sender, instance: Cafe, **kwargs):
+    encolar_vecinos(instance.pk)
+
+
+# ------------------------------------
+# Ranking: score base guardado por café
+# ------------------------------------
+def encolar_ranking(cafe_id: Optional[int]) -> None:
     """
-    Intenta renderizar subject, texto y HTML desde templates.
-    Si falta algún template, usa un fallback simple.
+    Encola el recálculo del snapshot del café (fuera del request). La
+    tarea se ve recién al confirmar, así nunca lee datos a medio guardar,
+    y varias escrituras seguidas del mismo café comparten una sola.
     """
-    # Subject
-    try:
-        subject = render_to_string(subject_tpl, ctx).strip()
-    except TemplateDoesNotExist:
-        cafe = ctx.get("cafe")
-        subject = f"Novedades en {getattr(cafe, 'name', 'tu cafetería')}"
-
-    # Texto
-    try:
-        text_body = render_to_string(text_tpl, ctx)
-    except TemplateDoesNotExist:
-        # Fallback muy básico
-        review = ctx.get("review")
-        detail_url = ctx.get("detail_url", "#")
-        text_body = (
-            f"Novedades en {ctx.get('cafe')}\n\n"
-            f"Usuario: {getattr(getattr(review, 'user', None), 'username', '(desconocido)')}\n"
-            f"Puntaje: {getattr(review, 'rating', '-')}\n\n"
-            f"Ver: {detail_url}\n"
-        )
-
-    # HTML
-    try:
-        html_body = render_to_string(html_tpl, ctx)
-    except TemplateDoesNotExist:
-        html_body = text_body.replace("\n", "<br>")
-
-    return subject, text_body, html_body
-
-
-def _send_owner_email(subject_tpl: str, text_tpl: str, html_tpl: str, ctx: dict, to_email: str) -> None:
-    subject, text_body, html_body = _render_email(subject_tpl, text_tpl, html_tpl, ctx)
-    msg = EmailMultiAlternatives(
-        subject=subject,
-        body=text_body,
-        from_email=getattr(settings, "DEFAULT_FROM_EMAIL", "no-reply@gota.local"),
-        to=[to_email],
+    if not cafe_id:
+        return
+    enqueue(
+        "reviews.refresh_ranking",
+        {"cafe_id": cafe_id},
+        dedupe_key=f"ranking:{cafe_id}",
     )
-    msg.attach_alternative(html_body, "text/html")
-    # No interrumpimos el flujo si el envío falla
-    msg.send(fail_silently=True)
+
+
+@receiver(post_save, sender=Cafe)
+def _cafe_saved_ranking(sender, instance: Cafe, raw: bool = False, **kwargs):
+    if raw:
+        return
+    encolar_ranking(instance.pk)
 
 
 @receiver(post_save, sender=Review)
-def _notify_owner_new_review(sender, instance: Review, created: bool, **kwargs):
-    """Email al dueño cuando se crea una reseña nueva."""
-    if not created:
-        return
-
-    cafe = instance.cafe
-    owner = getattr(cafe, "owner", None)
-    if not owner or not owner.email:
-        return
-
-    ctx = {
-        "cafe": cafe,
-        "review": instance,
-        # URLs relativas (si querés absolutas, podés anteponer un DOMAIN del settings)
-        "detail_url": reverse("reviews:cafe_detail", kwargs={"cafe_id": cafe.id}),
-        "owner_reply_url": reverse("reviews:owner_reviews"),
-    }
-
-    _send_owner_email(
-        subject_tpl="emails/owner_new_review_subject.txt",
-        text_tpl="emails/owner_new_review.txt",
-        html_tpl="emails/owner_new_review.html",
-        ctx=ctx,
-        to_email=owner.email,
-    )
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=CafeRelationship)
+@receiver(post_delete, sender=CafeRelationship)
+def _actividad_ranking(sender, instance, raw: bool = False, **kwargs):
+    if raw:
+        return
+    encolar_ranking(instance.cafe_id)
+
+
+# ----------------------------------------
+# Emails al dueño: nueva reseña / denuncia
+# ----------------------------------------
+@receiver(post_save, sender=Review)
+def _notify_owner_new_review(sender, instance: Review, created: bool, raw: bool = False, **kwargs):
+    if created and not raw:
+        enqueue("reviews.notify_owner_new_review", {"review_id": instance.pk})
 
 
 @receiver(post_save, sender=ReviewReport)
-def _notify_owner_review_report(sender, instance: ReviewReport, created: bool, **kwargs):
-    """Email al dueño cuando alguien denuncia una reseña de su local."""
-    if not created:
-        return
-
-    review = instance.review
-    cafe = review.cafe
-    owner = getattr(cafe, "owner", None)
-    if not owner or not owner.email:
-        return
-
-    ctx = {
-        "cafe": cafe,
-        "review": review,
-        "report": instance,
-        "detail_url": reverse("reviews:cafe_detail", kwargs={"cafe_id": cafe.id}),
-    }
-
-    _send_owner_email(
-        subject_tpl="emails/owner_review_report_subject.txt",
-        text_tpl="emails/owner_review_report.txt",
-        html_tpl="emails/owner_review_report.html",
-        ctx=ctx,
-        to_email=owner.email,
+def _notify_owner_review_report(sender, instance: ReviewReport, created: bool, raw: bool = False, **kwargs):
+    if created and not raw:
+        enqueue("reviews.notify_owner_review_report", {"report_id": instance.pk})
+
+
+# ---------------------------------------------
+# Derivados de imágenes (fuera del request)
+# ---------------------------------------------
+def encolar_derivados(instance) -> None:
+    label = instance._meta.label_lower
+    if not campos_pendientes(instance, CAMPOS_CON_IMAGEN[label]):
+        return
+    enqueue(
+        "reviews.image_derivatives",
+        {"model": label, "pk": instance.pk},
+        dedupe_key=f"image_derivatives:{label}:{instance.pk}",
     )
+
+
+@receiver(post_save, sender=Cafe)
+@receiver(post_save, sender=get_user_model())
+def _imagenes_guardadas(sender, instance, raw: bool = False, **kwargs):
+    if not raw:
+        encolar_derivados(instance)
@@ -1,6 +1,8 @@
 # reviews/templatetags/custom_filters.py
 from django import template
 
+from reviews.utils import images
+
 register = template.Library()
 
 @register.filter
@@ -203,3 +205,16 @@ def tag_emoji(tag):
     if category in _FALLBACK_BY_CATEGORY:
         return _FALLBACK_BY_CATEGORY[category]
     return "🏷️"
+
+
+# ===== Imágenes en el tamaño pedido (ver reviews.utils.images) =====
+@register.simple_tag
+def imagen(obj, campo, tamano="card", formato="jpeg"):
+    """{% imagen cafe "photo1" "card" %} -> URL del derivado (o de la original)."""
+    return images.url_derivado(obj, campo, tamano, formato) or ""
+
+
+@register.simple_tag
+def srcset(obj, campo, formato="jpeg"):
+    """{% srcset cafe "photo1" "webp" as webp %} -> "url 320w, url 640w, ..." o ""."""
+    return images.srcset(obj, campo, formato)
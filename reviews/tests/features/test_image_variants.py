@@ -0,0 +1,104 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+
+from core.jobs import run_pending
+from core.models import Job
+from reviews.models import Cafe
+from reviews.serializers import CafeSerializer
+from reviews.utils.images import srcset, url_derivado
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+def _foto(nombre="foto.jpg", size=(2000, 1500)):
+    buffer = BytesIO()
+    Image.new("RGB", size, "brown").save(buffer, format="JPEG")
+    return SimpleUploadedFile(nombre, buffer.getvalue(), content_type="image/jpeg")
+
+
+@override_settings(STORAGES=STORAGES_TEST, JOBS_EAGER=False)
+class ImageVariantsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+
+    def _cafe(self):
+        return Cafe.objects.create(
+            name="Café Central", address="Calle 1", location="Palermo",
+            owner=self.owner, photo1=_foto(),
+        )
+
+    def test_derivados_fuera_del_request(self):
+        cafe = self._cafe()
+        self.assertEqual(Job.objects.filter(name="reviews.image_derivatives").count(), 1)
+        # Mientras tanto se usa la original
+        self.assertEqual(url_derivado(cafe, "photo1", "card"), cafe.photo1.url)
+
+        run_pending()
+
+        cafe.refresh_from_db()
+        sizes = cafe.image_variants["photo1"]["sizes"]
+        self.assertEqual(
+            {tamano: (datos["width"], datos["height"]) for tamano, datos in sizes.items()},
+            {"thumb": (320, 240), "card": (640, 480), "detail": (1280, 960)},
+        )
+        self.assertTrue(url_derivado(cafe, "photo1", "thumb", "webp").endswith(".webp"))
+        self.assertIn("640w", srcset(cafe, "photo1"))
+
+        # Guardar sin cambiar la foto no vuelve a encolar
+        cafe.name = "Café Central 2"
+        cafe.save()
+        self.assertFalse(Job.objects.filter(name="reviews.image_derivatives", status=Job.PENDING).exists())
+
+        # Con foto nueva los derivados viejos dejan de valer
+        cafe.photo1 = _foto("otra.jpg", size=(500, 400))
+        cafe.save()
+        self.assertEqual(url_derivado(cafe, "photo1", "card"), cafe.photo1.url)
+        run_pending()
+        cafe.refresh_from_db()
+        self.assertEqual(cafe.image_variants["photo1"]["sizes"]["card"]["width"], 500)
+
+    def test_serializer_elige_tamano(self):
+        cafe = self._cafe()
+        run_pending()
+        cafe.refresh_from_db()
+        # Como viene anotado en los listados de la API
+        cafe.average_rating = 4.0
+
+        request = RequestFactory().get("/", {"image_size": "thumb"})
+        data = CafeSerializer(cafe, context={"request": request}).data
+        self.assertTrue(data["photo1_url"].endswith(url_derivado(cafe, "photo1", "thumb")))
+        self.assertIsNone(data["photo2_url"])
+
+        data = CafeSerializer(cafe).data
+        self.assertEqual(data["photo1_url"], url_derivado(cafe, "photo1", "card"))
+
+    def test_backfill_de_avatares(self):
+        usuario = User.objects.create_user(username="ana", password="test1234")
+        usuario.avatar = _foto("avatar.jpg", size=(800, 800))
+        usuario.save()
+        Job.objects.all().delete()
+
+        call_command("generate_image_variants", "--workers", "1", stdout=StringIO())
+
+        usuario.refresh_from_db()
+        self.assertEqual(usuario.image_variants["avatar"]["sizes"]["detail"]["width"], 800)
@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from reviews.models import Cafe
+from reviews.utils.mapa import BITS, ZOOM_PUNTOS
+
+User = get_user_model()
+
+# Palermo (CABA) y uno en La Plata
+BBOX_CABA = "-58.60,-34.75,-58.25,-34.50"
+
+
+class MapDataTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.palermo = [
+            self._cafe("Palermo 1", -34.5880, -58.4300, has_wifi=True),
+            self._cafe("Palermo 2", -34.5881, -58.4301, is_pet_friendly=True, has_wifi=True),
+            self._cafe("Palermo 3", -34.5882, -58.4302),
+        ]
+        self.la_plata = self._cafe("La Plata", -34.9215, -57.9545)
+        self._cafe("Sin coordenadas", None, None)
+
+    def _cafe(self, name, lat, lon, **features):
+        return Cafe.objects.create(
+            name=name, address=f"{name} 123", location="CABA",
+            latitude=lat, longitude=lon, owner=self.owner, **features,
+        )
+
+    def _get(self, bbox=BBOX_CABA, zoom=11, **params):
+        response = self.client.get(reverse("reviews:mapa_datos"), {"bbox": bbox, "zoom": zoom, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_clusters_con_zoom_bajo(self):
+        data = self._get(bbox="-59,-35.5,-57.5,-34", zoom=9)
+
+        self.assertEqual(len(data["clusters"]), 1)
+        lat, lon, cantidad = data["clusters"][0]
+        self.assertEqual(cantidad, 3)
+        self.assertAlmostEqual(lat, -34.5881, places=3)
+        # Solo en su celda: va como café suelto
+        self.assertEqual([cafe[0] for cafe in data["cafes"]], [self.la_plata.id])
+        self.assertEqual(data["url"].replace("{id}", "7"), reverse("reviews:cafe_detail", args=[7]))
+
+        # Todo el mundo con zoom alto: se usan tiles más grandes, no miles,
+        # y se agrupan con una sola consulta (más la de los cafés solos)
+        with CaptureQueriesContext(connection) as ctx:
+            data = self._get(bbox="-180,-85,180,85", zoom=13)
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+        total = sum(c[2] for c in data["clusters"]) + len(data["cafes"])
+        self.assertEqual(total, 4)
+
+    def test_cafes_sueltos_y_mascara(self):
+        data = self._get(zoom=ZOOM_PUNTOS)
+
+        self.assertEqual(data["clusters"], [])
+        mascaras = {cafe[0]: cafe[5] for cafe in data["cafes"]}
+        self.assertEqual(set(mascaras), {cafe.id for cafe in self.palermo})
+        self.assertEqual(mascaras[self.palermo[1].id], BITS["is_pet_friendly"] | BITS["has_wifi"])
+        self.assertEqual(mascaras[self.palermo[2].id], 0)
+
+        # El filtro usa la misma máscara: tienen que tener todas
+        data = self._get(zoom=ZOOM_PUNTOS, f=BITS["has_wifi"])
+        self.assertEqual({cafe[0] for cafe in data["cafes"]}, {self.palermo[0].id, self.palermo[1].id})
+        data = self._get(zoom=ZOOM_PUNTOS, f=BITS["has_wifi"] | BITS["is_pet_friendly"])
+        self.assertEqual([cafe[0] for cafe in data["cafes"]], [self.palermo[1].id])
+
+    def test_tiles_cacheados_e_invalidados(self):
+        self._get(zoom=ZOOM_PUNTOS)
+        with CaptureQueriesContext(connection) as ctx:
+            self._get(zoom=ZOOM_PUNTOS)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        # Se mueve a La Plata: sale del viewport
+        cafe = self.palermo[0]
+        cafe.latitude, cafe.longitude = -34.92, -57.95
+        cafe.save()
+        data = self._get(zoom=ZOOM_PUNTOS)
+        self.assertNotIn(cafe.id, {c[0] for c in data["cafes"]})
+
+    def test_parametros_invalidos(self):
+        url = reverse("reviews:mapa_datos")
+        self.assertEqual(self.client.get(url, {"bbox": "1,2,3", "zoom": 10}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"bbox": BBOX_CABA, "zoom": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"bbox": "nan,1,2,3", "zoom": 10}).status_code, 400)
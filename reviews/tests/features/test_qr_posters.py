@@ -0,0 +1,89 @@
+import io
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from reviews.models import Cafe
+from reviews.utils import qr_posters
+from reviews.utils.qr_posters import datos_cafes, zip_en_streaming
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "archivos": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+class QrPostersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        override = override_settings(QR_POSTER_CACHE_DIR=self.cache_dir, MEDIA_ROOT=self.cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        for nombre in ("Café Central", "Café Norte", "Café Sur", "Café Este"):
+            Cafe.objects.create(name=nombre, address="Calle 1", location="Palermo", owner=self.owner)
+
+    def _zip(self, partes):
+        return zipfile.ZipFile(io.BytesIO(b"".join(partes)))
+
+    def test_zip_en_streaming_y_cache_en_disco(self):
+        datos = datos_cafes(Cafe.objects.order_by("id"), "https://gota.test/")
+        self.assertTrue(datos[0][2].startswith("https://gota.test/"))
+
+        # Con varios workers se renderiza en el pool
+        archivo = self._zip(zip_en_streaming(datos, workers=2))
+        self.assertEqual(len(archivo.namelist()), 4)
+        self.assertIn(f"café_central-{datos[0][0]}.png", archivo.namelist())
+        self.assertTrue(archivo.read(archivo.namelist()[0]).startswith(b"\x89PNG"))
+
+        # La segunda vez sale todo del cache
+        with mock.patch.object(qr_posters, "render_poster") as render:
+            archivo = self._zip(zip_en_streaming(datos))
+        render.assert_not_called()
+        self.assertEqual(len(archivo.namelist()), 4)
+
+        # Si cambia el nombre se vuelve a generar solo ese
+        datos[0] = (datos[0][0], "Café Renombrado", datos[0][2])
+        with mock.patch.object(qr_posters, "render_poster", return_value=b"png") as render:
+            self._zip(zip_en_streaming(datos))
+        render.assert_called_once_with("Café Renombrado", datos[0][2])
+
+    @override_settings(STORAGES=STORAGES_TEST, QR_POSTER_WORKERS=4)
+    def test_descarga_en_el_request_no_levanta_procesos(self):
+        staff = User.objects.create_user(username="staff", password="test1234", is_staff=True)
+        self.client.force_login(staff)
+
+        with mock.patch.object(qr_posters, "ProcessPoolExecutor") as pool:
+            response = self.client.get(reverse("reviews:descargar_qrs"), {"limit": 4})
+            self.assertEqual(len(self._zip(response.streaming_content).namelist()), 4)
+        pool.assert_not_called()
+
+    @override_settings(STORAGES=STORAGES_TEST, JOBS_EAGER=True)
+    def test_generar_todos_en_segundo_plano(self):
+        staff = User.objects.create_user(username="staff", password="test1234", is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse("reviews:descargar_qrs"), {"limit": 2})
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(self._zip(response.streaming_content).namelist()), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("reviews:generar_qrs"), {"zona": "palermo"})
+        self.assertEqual(response.status_code, 302)
+
+        response = self.client.get(response["Location"])
+        estado = response.context["estado"]
+        self.assertEqual((estado["estado"], estado["total"]), ("listo", 4))
+        self.assertContains(response, "Descargar ZIP")
@@ -0,0 +1,143 @@
+from collections import Counter
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import Job
+from reviews.models import Cafe, CafeNeighbor
+from reviews.utils import relacionados
+from reviews.utils.relacionados import actualizar_vecinos, recalcular_vecinos, sortear
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+def _listas():
+    listas = {}
+    for cafe_id, vecino, score in CafeNeighbor.objects.values_list("cafe_id", "neighbor_id", "score"):
+        listas.setdefault(cafe_id, {})[vecino] = round(score, 6)
+    return listas
+
+
+@override_settings(STORAGES=STORAGES_TEST, JOBS_EAGER=False)
+class RelatedCafesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.palermo = [
+            self._cafe("Palermo 1", "Palermo", "CABA", -34.588, -58.430, has_wifi=True),
+            self._cafe("Palermo 2", "Palermo", "CABA", -34.589, -58.431, has_wifi=True),
+            self._cafe("Palermo 3", "Palermo", "CABA", -34.590, -58.432, is_pet_friendly=True),
+        ]
+        self.recoleta = self._cafe("Recoleta", "Recoleta", "CABA", -34.588, -58.393, has_wifi=True)
+        self.cordoba = self._cafe("Córdoba", "Centro", "Córdoba", -31.417, -64.183, has_wifi=True)
+
+    def _cafe(self, name, location, province, lat, lon, **features):
+        return Cafe.objects.create(
+            name=name, address=f"{name} 123", location=location, province=province,
+            latitude=lat, longitude=lon, owner=self.owner, **features,
+        )
+
+    def test_orden_por_score(self):
+        recalcular_vecinos()
+
+        vecinos = list(
+            CafeNeighbor.objects.filter(cafe=self.palermo[0])
+            .order_by("-score").values_list("neighbor_id", flat=True)
+        )
+        # Misma zona y wifi, misma zona, misma provincia y cerca, lejos
+        self.assertEqual(
+            vecinos,
+            [self.palermo[1].id, self.palermo[2].id, self.recoleta.id, self.cordoba.id],
+        )
+
+    def test_actualizacion_incremental_igual_a_recalcular_todo(self):
+        # Listas más cortas que los cafés del test, para que haya recortes
+        with mock.patch.object(relacionados, "VECINOS_POR_CAFE", 2):
+            recalcular_vecinos()
+            nuevo = self._cafe("Palermo 4", "Palermo", "CABA", -34.5881, -58.4301, has_wifi=True)
+            actualizar_vecinos(nuevo.id)
+            self.cordoba.location, self.cordoba.province = "Palermo", "CABA"
+            self.cordoba.save()
+            actualizar_vecinos(self.cordoba.id)
+            incremental = _listas()
+
+            recalcular_vecinos()
+            self.assertEqual(incremental, _listas())
+
+    def test_borrado_rellena_listas(self):
+        with mock.patch.object(relacionados, "VECINOS_POR_CAFE", 2):
+            recalcular_vecinos()
+            self.palermo[1].delete()
+            actualizar_vecinos(self.palermo[1].id)
+
+            listas = _listas()
+            self.assertEqual({len(vecinos) for vecinos in listas.values()}, {2})
+            self.assertNotIn(self.palermo[1].id, {v for vecinos in listas.values() for v in vecinos})
+
+    def test_sorteo_ponderado_sin_repetir(self):
+        vecinos = [(1, 10.0), (2, 0.0), (3, 0.0), (4, 0.0)]
+        primeros = Counter(sortear(vecinos, 1)[0] for _ in range(500))
+        self.assertGreater(primeros[1], 400)
+
+        self.assertEqual(len(set(sortear(vecinos, 3))), 3)
+        self.assertEqual(sorted(sortear(vecinos, 10)), [1, 2, 3, 4])
+
+    def test_cambios_encolan_la_actualizacion(self):
+        recalcular_vecinos()
+        Job.objects.all().delete()
+
+        # Nada de lo que usa el score cambió
+        self.recoleta.name = "Recoleta 2"
+        self.recoleta.save(update_fields=["name"])
+        self.recoleta.save()
+        self.assertFalse(Job.objects.filter(name="reviews.related_cafes").exists())
+
+        self.recoleta.is_pet_friendly = True
+        self.recoleta.save()
+        self.assertEqual(
+            list(Job.objects.filter(name="reviews.related_cafes").values_list("payload", flat=True)),
+            [{"cafe_id": self.recoleta.id}],
+        )
+
+    def test_endpoint_sin_lista_guardada(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        Job.objects.all().delete()
+        url = reverse("mobile-related-cafes", args=[self.palermo[0].id])
+
+        # Sin lista todavía: candidatos de la misma zona primero, sin
+        # recorrer el catálogo, y se encola el cálculo
+        with mock.patch.object(relacionados, "_cargar") as cargar:
+            response = client.get(url)
+        cargar.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        ids = [cafe["id"] for cafe in response.json()]
+        self.assertEqual(len(ids), 3)
+        self.assertNotIn(self.palermo[0].id, ids)
+        provisorios = relacionados.vecinos_provisorios(self.palermo[0].id)
+        self.assertEqual(
+            sorted(provisorios[:2]),
+            [(self.palermo[1].id, relacionados.PESO_ZONA), (self.palermo[2].id, relacionados.PESO_ZONA)],
+        )
+        self.assertEqual(
+            list(Job.objects.filter(name="reviews.related_cafes").values_list("payload", flat=True)),
+            [{"cafe_id": self.palermo[0].id}],
+        )
+
+        Job.objects.get(name="reviews.related_cafes").delete()
+        actualizar_vecinos(self.palermo[0].id)
+        ids = [cafe["id"] for cafe in client.get(url).json()]
+        self.assertEqual(len(ids), 3)
+        self.assertNotIn(self.palermo[0].id, ids)
+
+        response = client.get(reverse("mobile-related-cafes", args=[999999]))
+        self.assertEqual(response.status_code, 404)
@@ -1,5 +1,15 @@
+from unittest import mock
+
 from django.test import TestCase
-from reviews.utils.geo import haversine_distance
+from django.contrib.auth import get_user_model
+from reviews.models import Cafe
+from reviews.utils.geo import (
+    cafes_en_radio,
+    cafes_mas_cercanos,
+    geohash_encode,
+    haversine_distance,
+)
+from reviews.utils import geo_index
 
 class UtilsTestCase(TestCase):
     def test_haversine_distance_zero(self):
@@ -15,3 +25,83 @@ class UtilsTestCase(TestCase):
         lat2, lon2 = -31.4201, -64.1888
         distance = haversine_distance(lat1, lon1, lat2, lon2)
         self.assertTrue(640 <= distance <= 660)
+
+    def test_geohash_encode(self):
+        # Valor de referencia del algoritmo original
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geohash_encode(-34.6037, -58.3816, 5), '69y7p')
+
+
+class ProximityTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(username='duenio', password='1234')
+        puntos = [
+            ('Obelisco', -34.6037, -58.3816),
+            ('Congreso', -34.6096, -58.3924),
+            ('Palermo', -34.5889, -58.4306),
+            ('La Plata', -34.9215, -57.9545),
+            ('Córdoba', -31.4201, -64.1888),
+        ]
+        for nombre, lat, lon in puntos:
+            Cafe.objects.create(
+                name=nombre, address='-', location=nombre,
+                latitude=lat, longitude=lon, owner=owner,
+            )
+        Cafe.objects.create(name='Sin coordenadas', address='-', location='-', owner=owner)
+
+    def test_geohash_se_calcula_al_guardar(self):
+        cafe = Cafe.objects.get(name='Obelisco')
+        self.assertEqual(cafe.geohash, geohash_encode(-34.6037, -58.3816))
+
+        cafe.latitude, cafe.longitude = -31.4201, -64.1888
+        cafe.save(update_fields=['latitude', 'longitude'])
+        cafe.refresh_from_db()
+        self.assertEqual(cafe.geohash, geohash_encode(-31.4201, -64.1888))
+
+    def test_cafes_en_radio(self):
+        cerca = cafes_en_radio(Cafe.objects.all(), -34.6037, -58.3816, 5)
+        self.assertEqual([c.name for c, _ in cerca], ['Obelisco', 'Congreso', 'Palermo'])
+        self.assertTrue(all(d <= 5 for _, d in cerca))
+
+    def test_cafes_mas_cercanos_agranda_el_radio(self):
+        todos = list(Cafe.objects.filter(latitude__isnull=False))
+        esperado = sorted(
+            todos, key=lambda c: haversine_distance(-34.6037, -58.3816, c.latitude, c.longitude)
+        )[:4]
+
+        cercanos = cafes_mas_cercanos(Cafe.objects.all(), -34.6037, -58.3816, 4)
+        self.assertEqual([c for c, _ in cercanos], esperado)
+        self.assertEqual(len(cafes_mas_cercanos(Cafe.objects.all(), 0, 0, 50)), 5)
+
+    def test_indice_geo_coincide_con_haversine(self):
+        punto = (-34.6037, -58.3816)
+        esperado = {
+            c.id: haversine_distance(*punto, c.latitude, c.longitude)
+            for c in Cafe.objects.filter(latitude__isnull=False)
+        }
+
+        en_radio = geo_index.distancias_en_radio(*punto, 5)
+        self.assertEqual(set(en_radio), {i for i, d in esperado.items() if d <= 5})
+        for cafe_id, dist in en_radio.items():
+            self.assertAlmostEqual(dist, esperado[cafe_id], places=6)
+
+        cercanos = geo_index.mas_cercanos(*punto, 4)
+        self.assertEqual(
+            [cafe_id for cafe_id, _ in cercanos],
+            sorted(esperado, key=esperado.get)[:4],
+        )
+
+    def test_indice_geo_se_invalida_al_guardar(self):
+        geo_index.get_indice()
+        cafe = Cafe.objects.get(name='Córdoba')
+        cafe.latitude, cafe.longitude = -34.6040, -58.3820
+        cafe.save()
+
+        self.assertIn(cafe.id, geo_index.distancias_en_radio(-34.6037, -58.3816, 1))
+
+    def test_indice_geo_sin_numpy(self):
+        with mock.patch.object(geo_index, 'HAS_NUMPY', False):
+            sin_numpy = geo_index.mas_cercanos(-34.6037, -58.3816, 3)
+        con_numpy = geo_index.mas_cercanos(-34.6037, -58.3816, 3)
+
+        self.assertEqual([i for i, _ in sin_numpy], [i for i, _ in con_numpy])
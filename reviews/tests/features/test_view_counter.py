@@ -0,0 +1,107 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from reviews.models import Cafe, CafeStat
+from reviews.utils import view_counter
+from reviews.utils.view_counter import registrar_vista, volcar_vistas
+
+User = get_user_model()
+
+NAVEGADOR = "Mozilla/5.0 (X11; Linux x86_64) Firefox/128.0"
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.cafe = Cafe.objects.create(
+            name="Café Central", address="Calle 1", location="Palermo", owner=self.owner,
+        )
+        self.factory = RequestFactory()
+
+    def _request(self, user_agent=NAVEGADOR, ip="10.0.0.1", user=None):
+        request = self.factory.get("/", HTTP_USER_AGENT=user_agent, REMOTE_ADDR=ip)
+        request.user = user or AnonymousUser()
+        return request
+
+    def _vistas(self):
+        stat = CafeStat.objects.filter(cafe=self.cafe, date=timezone.localdate()).first()
+        return stat.views if stat else 0
+
+    def test_acumula_en_cache_y_vuelca(self):
+        self.assertTrue(registrar_vista(self._request(ip="10.0.0.1"), self.cafe))
+        self.assertTrue(registrar_vista(self._request(ip="10.0.0.2"), self.cafe))
+        self.assertFalse(CafeStat.objects.exists())
+
+        self.assertEqual(volcar_vistas(), 2)
+        self.assertEqual(self._vistas(), 2)
+
+        # Lo ya volcado no se vuelve a sumar; lo nuevo se suma a lo que había
+        self.assertEqual(volcar_vistas(), 0)
+        registrar_vista(self._request(ip="10.0.0.3"), self.cafe)
+        self.assertEqual(volcar_vistas(), 1)
+        self.assertEqual(self._vistas(), 3)
+
+    def test_repetidas_bots_y_dueno_no_cuentan(self):
+        self.assertTrue(registrar_vista(self._request(), self.cafe))
+        self.assertFalse(registrar_vista(self._request(), self.cafe))
+        self.assertFalse(registrar_vista(self._request(user_agent="Googlebot/2.1", ip="10.0.0.9"), self.cafe))
+        self.assertFalse(registrar_vista(self._request(user_agent="", ip="10.0.0.8"), self.cafe))
+        self.assertFalse(registrar_vista(self._request(ip="10.0.0.7", user=self.owner), self.cafe))
+
+        volcar_vistas()
+        self.assertEqual(self._vistas(), 1)
+
+    def test_anonimo_con_sesion_nueva_cuenta_una_vez(self):
+        self.assertTrue(registrar_vista(self._request(), self.cafe))
+
+        # La segunda visita ya trae la sesión que se creó en la primera
+        request = self._request()
+        request.session = SessionStore()
+        request.session.create()
+        self.assertFalse(registrar_vista(request, self.cafe))
+
+    def test_vuelca_solo_los_contadores_pendientes(self):
+        otros = [
+            Cafe.objects.create(name=f"Otro {i}", address=f"Calle {i}", location="Centro", owner=self.owner)
+            for i in range(5)
+        ]
+        registrar_vista(self._request(), self.cafe)
+        registrar_vista(self._request(), otros[0])
+        registrar_vista(self._request(ip="10.0.0.2"), otros[1])
+        otros[1].delete()
+
+        espia = mock.Mock(wraps=cache)
+        with mock.patch.object(view_counter, "cache", espia):
+            self.assertEqual(volcar_vistas(), 2)
+        pedidas = {key for llamada in espia.get_many.call_args_list for key in llamada.args[0]}
+        self.assertFalse(any(key.endswith(f":{otros[2].id}") for key in pedidas))
+        self.assertEqual(self._vistas(), 1)
+
+        # Ya volcado: nada pendiente
+        self.assertEqual(volcar_vistas(), 0)
+
+    @override_settings(STORAGES=STORAGES_TEST)
+    def test_detalle_registra_la_vista(self):
+        visitante = User.objects.create_user(username="ana", password="test1234")
+        self.client.force_login(visitante)
+        url = reverse("reviews:cafe_detail", args=[self.cafe.id])
+
+        self.client.get(url, HTTP_USER_AGENT=NAVEGADOR)
+        self.client.get(url, HTTP_USER_AGENT=NAVEGADOR)
+
+        volcar_vistas()
+        self.assertEqual(self._vistas(), 1)
+
@@ -0,0 +1,74 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from reviews.models import Cafe, Review
+from reviews.utils.aggregates import recalcular_agregados
+
+
+class CafeAggregatesTestCase(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(username=f'usuario{i}', password='testpass123')
+            for i in range(3)
+        ]
+        self.cafe = Cafe.objects.create(name='Café Central', address='Calle 1', location='Centro')
+        self.otro = Cafe.objects.create(name='Café Norte', address='Calle 2', location='Norte')
+
+    def _agregados(self, cafe):
+        cafe.refresh_from_db()
+        return (
+            cafe.rating_sum,
+            cafe.review_count,
+            cafe.positive_review_count,
+            cafe.avg_rating,
+            cafe.avg_capuccino_price,
+        )
+
+    def test_alta_modificacion_y_baja_de_resenas(self):
+        primera = Review.objects.create(
+            cafe=self.cafe, user=self.users[0], rating=5, comment='ok', precio_capuccino=3000,
+        )
+        Review.objects.create(cafe=self.cafe, user=self.users[1], rating=2, comment='meh')
+        self.assertEqual(self._agregados(self.cafe), (7, 2, 1, 3.5, 3000.0))
+
+        editada = Review.objects.get(pk=primera.pk)
+        editada.rating = 3
+        editada.precio_capuccino = None
+        editada.save()
+        self.assertEqual(self._agregados(self.cafe), (5, 2, 0, 2.5, None))
+
+        editada.cafe = self.otro
+        editada.save()
+        self.assertEqual(self._agregados(self.cafe), (2, 1, 0, 2.0, None))
+        self.assertEqual(self._agregados(self.otro), (3, 1, 0, 3.0, None))
+
+        Review.objects.filter(cafe=self.cafe).delete()
+        self.assertEqual(self._agregados(self.cafe), (0, 0, 0, None, None))
+
+    def test_guardar_un_cafe_viejo_no_pisa_los_agregados(self):
+        # Cargado antes de la reseña (como un formulario de edición)
+        viejo = Cafe.objects.get(pk=self.cafe.pk)
+        Review.objects.create(cafe=self.cafe, user=self.users[0], rating=5, comment='ok')
+
+        viejo.description = 'Nueva descripción'
+        viejo.save()
+        self.assertEqual(self._agregados(self.cafe), (5, 1, 1, 5.0, None))
+        self.assertEqual(self.cafe.description, 'Nueva descripción')
+
+        # Con update_fields explícito sí se escriben
+        viejo.review_count = 7
+        viejo.save(update_fields=['review_count'])
+        self.cafe.refresh_from_db()
+        self.assertEqual(self.cafe.review_count, 7)
+
+    def test_recalcular_corrige_desvios(self):
+        Review.objects.create(cafe=self.cafe, user=self.users[0], rating=4, comment='ok')
+        Review.objects.create(cafe=self.cafe, user=self.users[1], rating=5, comment='ok')
+        # Un update masivo no dispara señales: los agregados quedan viejos
+        Review.objects.filter(cafe=self.cafe).update(rating=1)
+        Cafe.objects.filter(pk=self.otro.pk).update(review_count=7)
+
+        self.assertEqual(recalcular_agregados(), 2)
+        self.assertEqual(self._agregados(self.cafe), (2, 2, 0, 1.0, None))
+        self.assertEqual(self._agregados(self.otro), (0, 0, 0, None, None))
+        self.assertEqual(recalcular_agregados(), 0)
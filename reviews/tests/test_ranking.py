@@ -152,3 +152,208 @@ def test_cercania_aumenta_score(django_user_model):
     )
 
     assert score_cerca > score_lejos
+
+
+@pytest.mark.django_db
+def test_scores_en_lote_coinciden_con_version_por_cafe(
+    django_user_model, django_assert_num_queries
+):
+    from datetime import timedelta
+
+    from django.db.models import Avg, Count
+    from django.utils import timezone
+
+    from reviews.models import CafeRelationship, Review
+    from reviews.utils.ranking import calcular_scores_cafes
+
+    owner = django_user_model.objects.create_user(username="owner", password="1234")
+    usuarios = [
+        django_user_model.objects.create_user(username=f"u{i}", password="1234")
+        for i in range(4)
+    ]
+
+    cafes = [
+        Cafe.objects.create(
+            name="Cafe Activo",
+            address="Calle 1",
+            location="Palermo",
+            visibility_level=2,
+            has_wifi=True,
+            is_pet_friendly=True,
+            photo1="cafes/activo.jpg",
+            latitude=-34.58,
+            longitude=-58.42,
+            owner=owner,
+        ),
+        Cafe.objects.create(
+            name="Cafe Tranquilo",
+            address="Calle 2",
+            location="Palermo",
+            visibility_level=1,
+            serves_breakfast=True,
+            latitude=-34.59,
+            longitude=-58.43,
+            owner=owner,
+        ),
+        Cafe.objects.create(
+            name="Cafe Vacio",
+            address="Calle 3",
+            location="Centro",
+            owner=owner,
+        ),
+    ]
+    activo, tranquilo, _ = cafes
+
+    for i, u in enumerate(usuarios):
+        Review.objects.create(
+            cafe=activo, user=u, rating=5 - (i % 2), comment="ok",
+            owner_reply="¡Gracias!" if i == 0 else None,
+        )
+        CafeRelationship.objects.create(
+            cafe=activo, user=u, status=CafeRelationship.WANT_TO_GO
+        )
+
+    viejas = Review.objects.create(cafe=tranquilo, user=usuarios[0], rating=3, comment="meh")
+    Review.objects.filter(pk=viejas.pk).update(
+        created_at=timezone.now() - timedelta(days=30)
+    )
+    CafeRelationship.objects.create(
+        cafe=tranquilo, user=usuarios[1], status=CafeRelationship.VISITED
+    )
+
+    qs = Cafe.objects.annotate(
+        average_rating=Avg("reviews__rating"),
+        total_reviews=Count("reviews"),
+    )
+    kwargs = dict(
+        user=owner,
+        user_lat=-34.58,
+        user_lon=-58.42,
+        cafes_vistos_ids=[tranquilo.id],
+    )
+
+    esperado = {cafe.id: calcular_score_cafe(cafe, **kwargs) for cafe in qs}
+
+    cafes_anotados = list(qs)
+    with django_assert_num_queries(2):
+        obtenido = calcular_scores_cafes(cafes_anotados, **kwargs)
+
+    assert obtenido == esperado
+
+
+@pytest.mark.django_db
+def test_snapshot_mas_parte_personal_coincide_con_version_por_cafe(django_user_model):
+    from django.db.models import Avg, Count
+
+    from reviews.models import CafeRelationship, Review
+    from reviews.utils.ranking import (
+        aplicar_personalizacion,
+        proyeccion_snapshot,
+        refrescar_ranking,
+    )
+
+    owner = django_user_model.objects.create_user(username="owner", password="1234")
+    otro = django_user_model.objects.create_user(username="otro", password="1234")
+
+    cafe = Cafe.objects.create(
+        name="Cafe Snapshot",
+        address="Calle 1",
+        location="Palermo",
+        visibility_level=1,
+        has_wifi=True,
+        photo1="cafes/snapshot.jpg",
+        latitude=-34.58,
+        longitude=-58.42,
+        owner=owner,
+    )
+    Cafe.objects.create(name="Cafe Sin Nada", address="Calle 2", location="Centro", owner=owner)
+
+    Review.objects.create(cafe=cafe, user=otro, rating=4, comment="rico", owner_reply="¡Gracias!")
+    CafeRelationship.objects.create(cafe=cafe, user=otro, status=CafeRelationship.VISITED)
+
+    refrescar_ranking()
+
+    kwargs = dict(user_lat=-34.58, user_lon=-58.42, cafes_vistos_ids=[cafe.id])
+    qs = Cafe.objects.annotate(
+        average_rating=Avg("reviews__rating"),
+        total_reviews=Count("reviews"),
+    )
+    esperado = {c.id: calcular_score_cafe(c, **kwargs) for c in qs}
+
+    obtenido = aplicar_personalizacion(proyeccion_snapshot(Cafe.objects.all()), **kwargs)
+
+    assert obtenido == esperado
+
+
+@pytest.mark.django_db
+def test_nueva_resena_refresca_snapshot(django_user_model, django_capture_on_commit_callbacks):
+    from django.core.cache import cache
+
+    from reviews.models import CafeRankingSnapshot, Review
+
+    # Los tests anteriores encolan el refresco sin confirmar: su dedupe_key
+    # (mismo id de café) puede seguir en el cache
+    cache.clear()
+    owner = django_user_model.objects.create_user(username="owner", password="1234")
+    otro = django_user_model.objects.create_user(username="otro", password="1234")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        cafe = Cafe.objects.create(name="Cafe", address="Calle 1", location="Centro", owner=owner)
+    antes = CafeRankingSnapshot.objects.get(cafe=cafe).base_score
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Review.objects.create(cafe=cafe, user=otro, rating=5, comment="excelente")
+
+    assert CafeRankingSnapshot.objects.get(cafe=cafe).base_score > antes
+
+
+@pytest.mark.django_db
+def test_escrituras_encolan_un_solo_refresco(django_user_model, settings):
+    from core.jobs import run_pending
+    from core.models import Job
+    from reviews.models import CafeRankingSnapshot, Review
+
+    settings.JOBS_EAGER = False
+    owner = django_user_model.objects.create_user(username="owner", password="1234")
+    otro = django_user_model.objects.create_user(username="otro", password="1234")
+
+    cafe = Cafe.objects.create(name="Cafe", address="Calle 1", location="Centro", owner=owner)
+    Review.objects.create(cafe=cafe, user=otro, rating=5, comment="excelente")
+    Review.objects.create(cafe=cafe, user=owner, rating=4, comment="bien")
+
+    # Nada se recalcula en el request; una sola tarea por café
+    assert not CafeRankingSnapshot.objects.filter(cafe=cafe).exists()
+    assert Job.objects.filter(name="reviews.refresh_ranking", payload={"cafe_id": cafe.id}).count() == 1
+
+    run_pending()
+    assert CafeRankingSnapshot.objects.filter(cafe=cafe).exists()
+
+
+@pytest.mark.django_db
+def test_boost_vencido_baja_sin_escrituras(django_user_model, settings):
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from core.models import Job
+    from reviews.jobs import decay_ranking
+    from reviews.models import CafeRankingSnapshot, Review
+    from reviews.utils.ranking import refrescar_ranking
+
+    settings.JOBS_EAGER = False
+    owner = django_user_model.objects.create_user(username="owner", password="1234")
+    otro = django_user_model.objects.create_user(username="otro", password="1234")
+    cafe = Cafe.objects.create(name="Cafe", address="Calle 1", location="Centro", owner=owner)
+    review = Review.objects.create(cafe=cafe, user=otro, rating=5, comment="excelente")
+
+    # Snapshot tomado cuando la reseña todavía era reciente
+    refrescar_ranking([cafe.id])
+    con_boost = CafeRankingSnapshot.objects.get(cafe=cafe).base_score
+
+    # Pasa el tiempo: la reseña sale de la ventana de 14 días
+    Review.objects.filter(pk=review.pk).update(created_at=timezone.now() - timedelta(days=14, minutes=30))
+    Job.objects.all().delete()
+    decay_ranking()
+
+    assert CafeRankingSnapshot.objects.get(cafe=cafe).base_score < con_boost
+    assert Job.objects.filter(name="reviews.decay_ranking", status=Job.PENDING).count() == 1
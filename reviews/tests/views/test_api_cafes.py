@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from reviews.models import Cafe, Review, Tag
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+@override_settings(STORAGES=STORAGES_TEST)
+class CafeApiTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.cafes = [
+            Cafe.objects.create(
+                name=f"Café {i:02d}", address=f"Calle {i}", location="Palermo",
+                latitude=-34.58 - i / 100, longitude=-58.43, owner=self.owner,
+            )
+            for i in range(5)
+        ]
+        self.client = APIClient()
+
+    def test_paginacion_con_cursor(self):
+        vistos = []
+        url = "/api/cafes/?page_size=2"
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data["results"]), 2)
+            vistos.extend(cafe["name"] for cafe in data["results"])
+            url = data["next"]
+
+        self.assertEqual(vistos, [cafe.name for cafe in self.cafes])
+
+    def test_cursor_no_saltea_ni_repite_con_ordering(self):
+        # Con promedios empatados (orden no único) el cursor salteaba cafés
+        # en Postgres: `?ordering` ya no cambia el orden, siempre por nombre
+        for i in range(5, 10):
+            Cafe.objects.create(name=f"Café {i:02d}", address=f"Calle {i}", location="Palermo", owner=self.owner)
+        for cafe, promedio in zip(Cafe.objects.order_by("name"), [4, 4, 4, 3, 3, 3, 3, 5, 5, 0]):
+            Cafe.objects.filter(pk=cafe.pk).update(avg_rating=promedio)
+
+        vistos = []
+        url = "/api/cafes/?ordering=-average_rating&page_size=3"
+        while url:
+            data = self.client.get(url).json()
+            vistos.extend(cafe["id"] for cafe in data["results"])
+            url = data["next"]
+
+        self.assertEqual(vistos, list(Cafe.objects.order_by("name").values_list("id", flat=True)))
+
+    def test_solo_los_campos_pedidos(self):
+        with self.assertNumQueries(1):
+            data = self.client.get("/api/cafes/", {"fields": "id,name,latitude,longitude,nada"}).json()
+
+        primero = data["results"][0]
+        self.assertEqual(set(primero), {"id", "name", "latitude", "longitude"})
+        self.assertEqual(primero["latitude"], -34.58)
+
+        data = self.client.get("/api/cafes/", {"fields": "id,average_rating,top_tags"}).json()
+        self.assertEqual(set(data["results"][0]), {"id", "average_rating", "top_tags"})
+
+    def test_get_condicional(self):
+        response = self.client.get("/api/cafes/")
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/cafes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Otros campos: otra representación, otro ETag
+        response = self.client.get("/api/cafes/", {"fields": "id"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # Una reseña con tags cambia lo que muestra la lista
+        autor = User.objects.create_user(username="autor", password="test1234")
+        review = Review.objects.create(cafe=self.cafes[0], user=autor, rating=5, comment="rico")
+        Cafe.objects.filter(pk=self.cafes[0].pk).update(updated_at=timezone.now() - timedelta(days=1))
+        response = self.client.get("/api/cafes/")
+        etag = response["ETag"]
+
+        review.tags.add(Tag.objects.create(name="Luminoso", category="ambiente"))
+        response = self.client.get("/api/cafes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["top_tags"], ["Luminoso"])
+
+    def test_detalle_condicional(self):
+        url = f"/api/cafes/{self.cafes[0].id}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.cafes[0].address = "Otra 1"
+        self.cafes[0].save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from reviews.models import Cafe, Review, Tag
+from reviews.utils.relacionados import recalcular_vecinos
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# cafés, tags del café (prefetch) y top tags de todos los cafés
+QUERIES_LISTA = 3
+
+# vecinos guardados + las mismas tres de la lista
+QUERIES_RELACIONADOS = 4
+
+
+@override_settings(STORAGES=STORAGES_TEST)
+class CafeApiQueriesTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.autor = User.objects.create_user(username="autor", password="test1234")
+        self.tags = [
+            Tag.objects.create(name=nombre, category="ambiente")
+            for nombre in ("Luminoso", "Tranquilo", "Ruidoso")
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def _crear_cafes(self, cantidad):
+        inicio = Cafe.objects.count()
+        cafes = []
+        for i in range(inicio, inicio + cantidad):
+            cafe = Cafe.objects.create(
+                name=f"Café {i:03d}", address=f"Calle {i}", location="Palermo",
+                province="CABA", owner=self.owner,
+            )
+            cafe.tags.add(self.tags[i % 3])
+            review = Review.objects.create(cafe=cafe, user=self.autor, rating=4, comment="ok")
+            review.tags.add(*self.tags[: 1 + i % 3])
+            cafes.append(cafe)
+        return cafes
+
+    def test_lista_en_consultas_fijas(self):
+        total = 0
+        for cantidad in (1, 10, 100):
+            self._crear_cafes(cantidad - total)
+            total = cantidad
+            with self.assertNumQueries(QUERIES_LISTA):
+                response = self.client.get("/api/cafes/", {"page_size": 100})
+            self.assertEqual(len(response.json()["results"]), cantidad)
+
+    def test_relacionados_en_consultas_fijas(self):
+        cafe = self._crear_cafes(1)[0]
+        total = 0
+        # Cantidad de otros cafés además del actual
+        for cantidad in (1, 10, 100):
+            self._crear_cafes(cantidad - total)
+            total = cantidad
+            recalcular_vecinos()
+            with self.assertNumQueries(QUERIES_RELACIONADOS):
+                response = self.client.get(reverse("mobile-related-cafes", args=[cafe.id]))
+            self.assertEqual(len(response.json()), min(cantidad, 3))
+            self.assertNotIn(cafe.id, [c["id"] for c in response.json()])
+
+    def test_top_tags_iguales_que_por_cafe(self):
+        cafe = self._crear_cafes(3)[2]
+        otra = Review.objects.create(
+            cafe=cafe, user=self.owner, rating=5, comment="muy bueno",
+        )
+        otra.tags.add(self.tags[2])
+
+        data = {c["id"]: c for c in self.client.get("/api/cafes/").json()["results"]}
+        # Ruidoso en dos reseñas; el resto empata y va por nombre
+        self.assertEqual(data[cafe.id]["top_tags"], ["Ruidoso", "Luminoso", "Tranquilo"])
+
+        detalle = self.client.get(f"/api/cafes/{cafe.id}/").json()
+        self.assertEqual(detalle["top_tags"], data[cafe.id]["top_tags"])
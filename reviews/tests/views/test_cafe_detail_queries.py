@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from reviews.models import Cafe, CafeRelationship, Review, Tag
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# cafe + estadísticas, mejor reseña, tags, página de reseñas (+ sus tags),
+# recomendados, susurros; sesión y usuario; likes, reseña propia y relación
+# del usuario; guardado de la sesión (savepoint, update, release)
+QUERIES_DETALLE = 15
+
+# Con la parte pública en cache solo queda lo del usuario
+QUERIES_DETALLE_CACHEADO = 8
+
+
+@override_settings(STORAGES=STORAGES_TEST)
+class CafeDetailQueriesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.cafe = Cafe.objects.create(
+            name="Café Central", address="Calle 1", location="Palermo", owner=self.owner,
+        )
+        self.tag = Tag.objects.create(name="Huele a café recién molido", category="ambiente")
+
+    def _agregar_resenas(self, cantidad):
+        for i in range(cantidad):
+            user = User.objects.create_user(username=f"user{i}", password="test1234")
+            review = Review.objects.create(
+                cafe=self.cafe, user=user, rating=1 + i % 5, comment="ok",
+                precio_capuccino=3000 + i,
+            )
+            review.tags.add(self.tag)
+            CafeRelationship.objects.create(
+                cafe=self.cafe, user=user, status=CafeRelationship.VISITED,
+            )
+
+    def _get_detalle(self):
+        self.client.force_login(self.owner)
+        with self.assertNumQueries(QUERIES_DETALLE):
+            response = self.client.get(reverse("reviews:cafe_detail", args=[self.cafe.id]))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_consultas_con_una_resena(self):
+        self._agregar_resenas(1)
+        response = self._get_detalle()
+        self.assertEqual(response.context["total_reviews"], 1)
+        self.assertEqual(response.context["visited_count"], 1)
+
+    def test_consultas_no_crecen_con_las_resenas(self):
+        self._agregar_resenas(10)
+        response = self._get_detalle()
+        self.assertEqual(response.context["total_reviews"], 10)
+        self.assertEqual(response.context["average_rating"], 3.0)
+        self.assertEqual(response.context["positive_pct"], 40)
+        self.assertEqual(response.context["visited_count"], 10)
+        self.assertEqual(response.context["want_to_go_count"], 0)
+        self.assertEqual([t.num for t in response.context["top_tags"]], [10])
+        self.assertEqual(response.context["page_obj"].paginator.num_pages, 2)
+
+    def test_parte_publica_cacheada_e_invalidada(self):
+        self._agregar_resenas(3)
+        self._get_detalle()
+
+        with self.assertNumQueries(QUERIES_DETALLE_CACHEADO):
+            response = self.client.get(reverse("reviews:cafe_detail", args=[self.cafe.id]))
+        self.assertEqual(response.context["total_reviews"], 3)
+
+        otro = User.objects.create_user(username="nuevo", password="test1234")
+        Review.objects.create(cafe=self.cafe, user=otro, rating=5, comment="muy rico")
+
+        response = self.client.get(reverse("reviews:cafe_detail", args=[self.cafe.id]))
+        self.assertEqual(response.context["total_reviews"], 4)
+        self.assertContains(response, "muy rico")
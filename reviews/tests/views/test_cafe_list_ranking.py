@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from reviews.models import Cafe, Review
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+@override_settings(STORAGES=STORAGES_TEST)
+class CafeListRankingTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.reviewer = User.objects.create_user(username="reviewer", password="test1234")
+
+    def _crear_cafes(self, desde, hasta):
+        for i in range(desde, hasta):
+            cafe = Cafe.objects.create(
+                name=f"Café {i}",
+                address=f"Calle {i}",
+                location="Palermo",
+                has_wifi=bool(i % 2),
+                owner=self.owner,
+            )
+            Review.objects.create(
+                cafe=cafe, user=self.reviewer, rating=1 + i % 5, comment="ok"
+            )
+
+    def _queries_pagina_1(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("reviews:cafe_list"))
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_pagina_ordenada_por_score(self):
+        self._crear_cafes(0, 20)
+
+        response, _ = self._queries_pagina_1()
+        cafes = list(response.context["cafes"])
+
+        self.assertEqual(len(cafes), 12)
+        scores = [cafe.score for cafe in cafes]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(response.context["paginator"].count, 20)
+
+    def test_consultas_no_crecen_con_el_catalogo(self):
+        self._crear_cafes(0, 15)
+        _, chico = self._queries_pagina_1()
+
+        self._crear_cafes(15, 60)
+        _, grande = self._queries_pagina_1()
+
+        self.assertEqual(chico, grande)
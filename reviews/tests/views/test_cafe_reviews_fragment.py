@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from reviews.models import Cafe, Review, ReviewLike
+from reviews.utils.cache import bump_version
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+@override_settings(STORAGES=STORAGES_TEST)
+class CafeReviewsFragmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.ana = User.objects.create_user(username="ana", password="test1234")
+        self.beto = User.objects.create_user(username="beto", password="test1234")
+        self.cafe = Cafe.objects.create(
+            name="Café Central", address="Calle 1", location="Palermo", owner=self.owner,
+        )
+        self.review = Review.objects.create(
+            cafe=self.cafe, user=self.owner, rating=4, comment="primera reseña",
+        )
+        self.url = reverse("reviews:cafe_detail", args=[self.cafe.id])
+
+    def _get_como(self, user):
+        self.client.force_login(user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def _lista_de_resenas(self, response):
+        html = response.content.decode()
+        return html[html.index('id="review-container"'):html.index('id="liked-review-ids"')]
+
+    def test_fragmento_compartido_entre_usuarios(self):
+        self._get_como(self.ana)
+
+        # Cambio sin señales (y sin la versión de reseñas): si el fragmento se
+        # comparte, beto ve la lista cacheada por ana
+        Review.objects.filter(pk=self.review.pk).update(comment="editado por atrás")
+        bump_version("cafe_detail", self.cafe.id)
+
+        lista = self._lista_de_resenas(self._get_como(self.beto))
+        self.assertIn("primera reseña", lista)
+        self.assertNotIn("editado por atrás", lista)
+
+    def test_nueva_resena_visible_para_otros_usuarios(self):
+        self._get_como(self.ana)
+        self._get_como(self.beto)
+
+        Review.objects.create(cafe=self.cafe, user=self.ana, rating=5, comment="muy rico")
+
+        self.assertIn("muy rico", self._lista_de_resenas(self._get_como(self.beto)))
+        self.assertIn("muy rico", self._lista_de_resenas(self._get_como(self.ana)))
+
+    def test_like_actualiza_el_contador_para_todos(self):
+        self._get_como(self.beto)
+
+        self.client.force_login(self.ana)
+        self.client.post(reverse("reviews:toggle_review_like", args=[self.review.id]))
+        self.assertTrue(ReviewLike.objects.filter(review=self.review, user=self.ana).exists())
+
+        response = self._get_como(self.beto)
+        self.assertContains(response, f'id="likes-count-{self.review.id}">1<')
+
+    def test_estado_de_like_fuera_del_fragmento(self):
+        ReviewLike.objects.create(review=self.review, user=self.ana)
+
+        response = self._get_como(self.ana)
+        self.assertEqual(response.context["liked_ids"], [self.review.id])
+        self.assertContains(response, f'<script id="liked-review-ids" type="application/json">[{self.review.id}]</script>', html=False)
+
+        response = self._get_como(self.beto)
+        self.assertEqual(response.context["liked_ids"], [])
+        self.assertContains(response, '<script id="liked-review-ids" type="application/json">[]</script>', html=False)
@@ -0,0 +1,155 @@
+import csv
+import io
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from reviews.models import Cafe, CafeRelationship, CafeStat, Review
+from reviews.utils.rollups import recalcular_stats, sumar_stats
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# sesión y usuario; cafés con sus totales, KPIs y serie de visitas
+QUERIES_ANALYTICS = 5
+
+
+@override_settings(STORAGES=STORAGES_TEST)
+class FounderAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.staff = User.objects.create_user(username="staff", password="test1234", is_staff=True)
+        self.cafe = Cafe.objects.create(
+            name="Café Central", address="Calle 1", location="Palermo", owner=self.owner,
+        )
+        self.otro = Cafe.objects.create(
+            name="Café Norte", address="Calle 2", location="Palermo", owner=self.owner,
+        )
+        self.hoy = timezone.localdate()
+        self.url = reverse("reviews:founder_analytics")
+
+    def _stat(self, cafe, fecha=None):
+        return CafeStat.objects.get(cafe=cafe, date=fecha or self.hoy)
+
+    def _resena(self, cafe, username, rating):
+        user = User.objects.create_user(username=username, password="test1234")
+        return Review.objects.create(cafe=cafe, user=user, rating=rating, comment="Rico")
+
+    def test_rollups_siguen_a_resenas_y_favoritos(self):
+        ana = self._resena(self.cafe, "ana", 5)
+        self._resena(self.cafe, "beto", 3)
+        CafeRelationship.objects.create(
+            user=ana.user, cafe=self.cafe, status=CafeRelationship.WANT_TO_GO,
+        )
+
+        stat = self._stat(self.cafe)
+        self.assertEqual((stat.reviews, stat.rating_sum, stat.favorites), (2, 8, 1))
+
+        ana.rating = 4
+        ana.save()
+        self.assertEqual(self._stat(self.cafe).rating_sum, 7)
+
+        # Moverla de café la resta de uno y la suma al otro
+        ana.cafe = self.otro
+        ana.save()
+        self.assertEqual((self._stat(self.cafe).reviews, self._stat(self.otro).reviews), (1, 1))
+
+        ana.delete()
+        CafeRelationship.objects.all().delete()
+        stat = self._stat(self.cafe)
+        self.assertEqual((stat.reviews, stat.rating_sum, stat.favorites), (1, 3, 0))
+        self.assertEqual(self._stat(self.otro).reviews, 0)
+
+    def test_borrar_cafe_no_revive_sus_stats(self):
+        self._resena(self.cafe, "ana", 5)
+        self.cafe.delete()
+        self.assertFalse(CafeStat.objects.filter(cafe_id=self.cafe.pk).exists())
+
+    def test_recalcular_corrige_desvios(self):
+        self._resena(self.cafe, "ana", 5)
+        CafeStat.objects.update(reviews=40, rating_sum=0, views=7)
+
+        recalcular_stats()
+
+        stat = self._stat(self.cafe)
+        self.assertEqual((stat.reviews, stat.rating_sum, stat.views), (1, 5, 7))
+
+    def test_dashboard_lee_solo_los_rollups(self):
+        hace_10 = self.hoy - timedelta(days=10)
+        sumar_stats([
+            (self.cafe.pk, self.hoy, {"views": 5, "reviews": 1, "rating_sum": 4}),
+            (self.cafe.pk, hace_10, {"views": 20, "reviews": 1, "rating_sum": 2, "favorites": 3}),
+            (self.otro.pk, self.hoy, {"views": 9}),
+        ])
+        # El rating es el promedio de los promedios de cada café, sin rango
+        Cafe.objects.filter(pk=self.cafe.pk).update(avg_rating=4.5)
+        Cafe.objects.filter(pk=self.otro.pk).update(avg_rating=3.0)
+        self.client.force_login(self.staff)
+
+        with self.assertNumQueries(QUERIES_ANALYTICS):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context["totals"], {
+            "views": 34, "reviews": 2, "favorites": 3, "avg_rating": 3.75,
+        })
+        self.assertEqual([c.pk for c in response.context["top_cafes"]], [self.cafe.pk, self.otro.pk])
+        # Sin rango la serie sigue siendo diaria
+        self.assertEqual(
+            response.context["labels"], [hace_10.strftime("%d/%m"), self.hoy.strftime("%d/%m")]
+        )
+        self.assertEqual(response.context["values"], [20, 14])
+
+        with self.assertNumQueries(QUERIES_ANALYTICS):
+            response = self.client.get(self.url, {"range": "7"})
+        self.assertEqual(response.context["totals"], {
+            "views": 14, "reviews": 1, "favorites": 0, "avg_rating": 3.75,
+        })
+        self.assertEqual(response.context["values"], [14])
+        cafes = {c.pk: c for c in response.context["cafes"]}
+        self.assertEqual(
+            (cafes[self.cafe.pk].total_views, cafes[self.cafe.pk].total_reviews), (5, 1)
+        )
+
+    def _exportar(self, formato, **params):
+        self.client.force_login(self.staff)
+        return self.client.get(self.url, {"export": formato, **params})
+
+    def test_export_csv_en_streaming_y_cafe_sin_dueno(self):
+        sumar_stats([
+            (self.cafe.pk, self.hoy, {"views": 5, "reviews": 1, "rating_sum": 4}),
+            (self.cafe.pk, self.hoy - timedelta(days=40), {"views": 20}),
+        ])
+        Cafe.objects.filter(pk=self.otro.pk).update(owner=None)
+
+        response = self._exportar("csv", range="30")
+
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment;", response["Content-Disposition"])
+        contenido = b"".join(response.streaming_content).decode("utf-8-sig")
+        filas = list(csv.reader(io.StringIO(contenido)))
+        self.assertEqual(filas[0][0], "Café")
+        por_nombre = {fila[0]: fila for fila in filas[1:]}
+        # Solo lo del rango
+        self.assertEqual(por_nombre["Café Central"][5:7], ["5", "1"])
+        self.assertEqual(por_nombre["Café Norte"][1:3], ["", ""])
+
+    def test_export_xlsx_write_only(self):
+        sumar_stats([(self.cafe.pk, self.hoy, {"views": 5, "favorites": 2})])
+
+        response = self._exportar("excel")
+
+        self.assertTrue(response.streaming)
+        libro = load_workbook(io.BytesIO(b"".join(response.streaming_content)))
+        filas = list(libro.active.iter_rows(values_only=True))
+        self.assertEqual(len(filas), 3)
+        self.assertEqual(filas[1][0], "Café Central")
+        self.assertEqual((filas[1][5], filas[1][7]), (5, 2))
@@ -0,0 +1,117 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from reviews.mobile_api import FEATURES_DETALLE
+from reviews.models import Cafe, Review, Tag
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# Con el detalle público en cache: sesión/usuario, my_review y sus tags
+MAX_QUERIES_CACHEADO = 3
+
+
+@override_settings(STORAGES=STORAGES_TEST)
+class MobileCafeDetailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.ana = User.objects.create_user(username="ana", password="test1234", first_name="Ana")
+        self.beto = User.objects.create_user(username="beto", password="test1234")
+        self.cafe = Cafe.objects.create(
+            name="Café Uno", address="Calle 1", location="Palermo",
+            owner=self.owner, has_wifi=True, is_pet_friendly=True,
+        )
+        self.tag = Tag.objects.create(name="Tranquilo", category="ambiente")
+        self.cafe.tags.add(self.tag)
+        self.review = Review.objects.create(cafe=self.cafe, user=self.ana, rating=4, comment="Rico")
+        self.review.tags.add(self.tag)
+        self.url = reverse("mobile-cafe-detail", args=[self.cafe.id])
+
+    def _client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_detalle_publico_y_my_review(self):
+        data = self._client(self.ana).get(self.url).json()
+
+        self.assertEqual(data["name"], "Café Uno")
+        self.assertEqual(data["tags"], ["Tranquilo"])
+        self.assertEqual(data["reviews_count"], 1)
+        self.assertEqual(data["reviews"][0]["user"], "Ana")
+        self.assertTrue(data["has_wifi"])
+        self.assertFalse(data["has_parking"])
+        self.assertEqual(data["my_review"]["id"], self.review.id)
+        self.assertEqual(data["my_review"]["tags"], [self.tag.id])
+
+        # Mismo cache público, distinta reseña propia
+        data = self._client(self.beto).get(self.url).json()
+        self.assertEqual(data["name"], "Café Uno")
+        self.assertIsNone(data["my_review"])
+
+    def test_segunda_vez_sale_del_cache(self):
+        client = self._client(self.ana)
+        client.get(self.url)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx.captured_queries), MAX_QUERIES_CACHEADO)
+        self.assertFalse(any('"reviews_cafe"' in q["sql"] for q in ctx.captured_queries))
+
+    def test_etag_y_304(self):
+        client = self._client(self.ana)
+        response = client.get(self.url)
+        etag = response["ETag"]
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        # Otro usuario: otro my_review, otro ETag
+        response = self._client(self.beto).get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # Cambia el café: el ETag viejo ya no sirve
+        Review.objects.create(cafe=self.cafe, user=self.beto, rating=2)
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["reviews_count"], 2)
+
+    def test_features_compactas(self):
+        data = self._client(self.ana).get(self.url, {"features": "compact"}).json()
+
+        self.assertEqual(data["features"], ["has_wifi", "is_pet_friendly"])
+        self.assertFalse(any(campo in data for campo in FEATURES_DETALLE))
+        self.assertEqual(data["my_review"]["id"], self.review.id)
+
+    def test_tags_del_cafe_invalidan(self):
+        client = self._client(self.ana)
+        client.get(self.url)
+
+        self.cafe.tags.add(Tag.objects.create(name="Luminoso", category="ambiente"))
+        data = client.get(self.url).json()
+        self.assertEqual(sorted(data["tags"]), ["Luminoso", "Tranquilo"])
+
+    def test_cambio_de_nombre_del_autor_invalida(self):
+        client = self._client(self.beto)
+        client.get(self.url)
+
+        self.ana.first_name = "Anita"
+        self.ana.save()
+        self.assertEqual(client.get(self.url).json()["reviews"][0]["user"], "Anita")
+
+    def test_cafe_inexistente(self):
+        response = self._client(self.ana).get(reverse("mobile-cafe-detail", args=[999999]))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,161 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from reviews.models import Cafe, CafeRelationship, CafeRelationshipTombstone
+from reviews.utils import sync_mapa
+from reviews.utils.sync_mapa import RETENCION_TOMBSTONES, SOLAPE, purgar_tombstones
+
+User = get_user_model()
+
+STORAGES_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+@override_settings(STORAGES=STORAGES_TEST)
+class MyMapSyncTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.user = User.objects.create_user(username="ana", password="test1234")
+        self.cafes = [
+            Cafe.objects.create(name=f"Café {i}", address=f"Calle {i}", location="Palermo", owner=self.owner)
+            for i in range(4)
+        ]
+        for cafe in self.cafes[:3]:
+            CafeRelationship.objects.create(user=self.user, cafe=cafe, status=CafeRelationship.WANT_TO_GO)
+        self.url = reverse("mobile-my-map-sync")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _envejecer(self):
+        """Lleva todo lo existente a antes de la ventana de solape."""
+        antes = timezone.now() - SOLAPE * 4
+        CafeRelationship.objects.update(updated_at=antes)
+        Cafe.objects.update(updated_at=antes)
+        CafeRelationshipTombstone.objects.update(deleted_at=antes)
+        return (antes + SOLAPE * 2).isoformat()
+
+    def test_sync_completa(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(self.url).json()
+
+        self.assertTrue(data["full"])
+        self.assertEqual(len(data["changed"]), 3)
+        self.assertEqual(data["changed"][0]["cafe_name"], "Café 0")
+        self.assertEqual(data["deleted"], [])
+        # Relaciones con su café en un solo JOIN
+        self.assertEqual(sum('"reviews_cafe"' in q["sql"] for q in ctx.captured_queries), 1)
+
+    def test_delta_con_tombstones(self):
+        since = self._envejecer()
+
+        rel = CafeRelationship.objects.get(user=self.user, cafe=self.cafes[0])
+        rel.status = CafeRelationship.VISITED
+        rel.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            CafeRelationship.objects.get(user=self.user, cafe=self.cafes[1]).delete()
+
+        data = self.client.get(self.url, {"since": since}).json()
+        self.assertFalse(data["full"])
+        self.assertEqual([r["cafe_id"] for r in data["changed"]], [self.cafes[0].id])
+        self.assertEqual(data["changed"][0]["status"], CafeRelationship.VISITED)
+        self.assertEqual(data["deleted"], [self.cafes[1].id])
+
+        # Nada nuevo con el token que devolvió
+        since = self._envejecer()
+        data = self.client.get(self.url, {"since": since}).json()
+        self.assertEqual((data["changed"], data["deleted"]), ([], []))
+
+    def test_cambio_del_cafe_entra_en_el_delta(self):
+        since = self._envejecer()
+        cafe = self.cafes[2]
+        cafe.name = "Café Renombrado"
+        cafe.save()
+
+        data = self.client.get(self.url, {"since": since}).json()
+        self.assertEqual([r["cafe_name"] for r in data["changed"]], ["Café Renombrado"])
+
+    def test_mutaciones_en_lote(self):
+        since = self._envejecer()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.url,
+                {
+                    "since": since,
+                    "mutations": [
+                        {"cafe_id": self.cafes[3].id, "status": CafeRelationship.VISITED},
+                        {"cafe_id": self.cafes[3].id, "collection": "work", "private_note": "  Mesa al fondo "},
+                        {"cafe_id": self.cafes[0].id, "status": None},
+                        {"cafe_id": self.cafes[1].id, "private_note": "Volver"},
+                    ],
+                },
+                format="json",
+            )
+        data = response.json()
+        self.assertEqual(data["applied"], 4)
+        cambiados = {r["cafe_id"]: r for r in data["changed"]}
+        self.assertEqual(set(cambiados), {self.cafes[1].id, self.cafes[3].id})
+        self.assertEqual(cambiados[self.cafes[3].id]["collection"], "work")
+        self.assertEqual(cambiados[self.cafes[3].id]["private_note"], "Mesa al fondo")
+
+        # En el test la tombstone se crea al salir del bloque (on_commit)
+        data = self.client.get(self.url, {"since": since}).json()
+        self.assertEqual(data["deleted"], [self.cafes[0].id])
+
+    def test_alta_simultanea_desde_otro_dispositivo(self):
+        # Otro dispositivo crea la relación después de que este leyó las existentes
+        CafeRelationship.objects.create(user=self.user, cafe=self.cafes[3], status=CafeRelationship.WANT_TO_GO)
+        with mock.patch.object(sync_mapa, "_bloquear_relaciones", return_value={}):
+            response = self.client.post(
+                self.url,
+                {"mutations": [{"cafe_id": self.cafes[3].id, "status": CafeRelationship.VISITED}]},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        relacion = CafeRelationship.objects.get(user=self.user, cafe=self.cafes[3])
+        self.assertEqual(relacion.status, CafeRelationship.VISITED)
+
+    def test_mutacion_invalida_no_guarda_nada(self):
+        response = self.client.post(
+            self.url,
+            {
+                "mutations": [
+                    {"cafe_id": self.cafes[0].id, "status": None},
+                    {"cafe_id": self.cafes[3].id, "collection": "work"},
+                ],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "relationship_not_found")
+        self.assertEqual(response.json()["index"], 1)
+        self.assertTrue(CafeRelationship.objects.filter(user=self.user, cafe=self.cafes[0]).exists())
+
+    def test_since_invalido_o_vencido(self):
+        self.assertEqual(self.client.get(self.url, {"since": "ayer"}).status_code, 400)
+
+        viejo = (timezone.now() - RETENCION_TOMBSTONES - timedelta(days=1)).isoformat()
+        data = self.client.get(self.url, {"since": viejo}).json()
+        self.assertTrue(data["full"])
+
+    def test_purga_y_borrado_de_usuario(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            CafeRelationship.objects.filter(user=self.user, cafe=self.cafes[0]).delete()
+        CafeRelationshipTombstone.objects.update(deleted_at=timezone.now() - RETENCION_TOMBSTONES * 2)
+        self.assertEqual(purgar_tombstones(), 1)
+
+        # El borrado en cascada del usuario no deja tombstones huérfanas
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(CafeRelationshipTombstone.objects.exists())
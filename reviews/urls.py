@@ -44,6 +44,7 @@ urlpatterns = [
 
     # Mapa
     path('mapa/', views.mapa_cafes, name='mapa_cafes'),
+    path('mapa/datos/', views.mapa_datos, name='mapa_datos'),
 
     # Claim
     path("cafes/<int:cafe_id>/claim/", views_claims.claim_start, name="claim_start"),
@@ -58,4 +59,6 @@ urlpatterns = [
     path('planes/checkout/<int:cafe_id>/<int:nivel>/', views.plan_checkout_redirect, name='plan_checkout_redirect'),
 
     path("admin/descargar-qrs/", views.descargar_todos_qr, name="descargar_qrs"),
+    path("admin/generar-qrs/", views.generar_todos_qr, name="generar_qrs"),
+    path("admin/generar-qrs/<str:token>/", views.estado_todos_qr, name="estado_qrs"),
 ]
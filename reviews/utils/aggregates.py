@@ -0,0 +1,176 @@
+"""
+Agregados de reseñas guardados en `Cafe` (suma y cantidad de ratings,
+promedios, reseñas positivas y precio del capuccino).
+
+Las señales de `Review` aplican solo la diferencia con un UPDATE atómico
+(F-expressions), así dos reseñas simultáneas no se pisan. Si algo se
+desincroniza (updates masivos, cargas a mano), `recalcular_agregados`
+los vuelve a calcular desde las reseñas.
+
+La misma diferencia se suma al rollup diario de `CafeStat` (ver
+`reviews.utils.rollups`).
+"""
+
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Now, NullIf
+
+from reviews.models import Cafe, Review
+from reviews.utils.rollups import aporte_resena, recalcular_stats, sumar_stats
+
+# Desde qué rating una reseña cuenta como positiva
+RATING_POSITIVO = 4
+
+
+def _es_positiva(rating):
+    return 1 if rating is not None and rating >= RATING_POSITIVO else 0
+
+
+def _promedio(suma, cantidad):
+    return Cast(suma, FloatField()) / NullIf(cantidad, Value(0))
+
+
+def aplicar_delta(cafe_id, *, rating=0, reviews=0, positivas=0, precio=0, precios=0):
+    """
+    Suma (o resta, con valores negativos) al café en un único UPDATE.
+    Los promedios se recalculan en la misma sentencia con los valores nuevos.
+    """
+    if not cafe_id or not any((rating, reviews, positivas, precio, precios)):
+        return
+
+    rating_sum = F("rating_sum") + rating
+    review_count = F("review_count") + reviews
+    price_sum = F("capuccino_price_sum") + precio
+    price_count = F("capuccino_price_count") + precios
+
+    Cafe.objects.filter(pk=cafe_id).update(
+        rating_sum=rating_sum,
+        review_count=review_count,
+        positive_review_count=F("positive_review_count") + positivas,
+        capuccino_price_sum=price_sum,
+        capuccino_price_count=price_count,
+        avg_rating=_promedio(rating_sum, review_count),
+        avg_capuccino_price=_promedio(price_sum, price_count),
+        updated_at=Now(),
+    )
+
+
+def _aporte(valores, signo):
+    cafe_id, rating, precio = valores
+    return cafe_id, dict(
+        rating=signo * (rating or 0),
+        reviews=signo,
+        positivas=signo * _es_positiva(rating),
+        precio=signo * (precio or 0),
+        precios=signo if precio is not None else 0,
+    )
+
+
+def _creada(review):
+    # Sin leer de la base: en post_delete la fila ya no existe
+    return review.__dict__.get("created_at")
+
+
+def resena_agregada(review):
+    valores = review.valores_agregados()
+    cafe_id, delta = _aporte(valores, 1)
+    aplicar_delta(cafe_id, **delta)
+    sumar_stats([aporte_resena(cafe_id, _creada(review), valores[1], 1)])
+    review._agregados_originales = valores
+
+
+def resena_eliminada(review):
+    valores = getattr(review, "_agregados_originales", None) or review.valores_agregados()
+    if valores is None or _creada(review) is None:
+        recalcular_agregados([review.cafe_id])
+        recalcular_stats([review.cafe_id])
+        return
+    cafe_id, delta = _aporte(valores, -1)
+    aplicar_delta(cafe_id, **delta)
+    sumar_stats([aporte_resena(cafe_id, _creada(review), valores[1], -1)])
+
+
+def resena_modificada(review):
+    """
+    Aplica la diferencia entre lo que había en la base y lo que se guardó.
+    Si la instancia no vino de la base (o tenía campos diferidos) no hay
+    con qué comparar, así que se recalcula el café entero.
+    """
+    antes = getattr(review, "_agregados_originales", None)
+    ahora = review.valores_agregados()
+
+    if antes is None or ahora is None or _creada(review) is None:
+        cafe_ids = {review.cafe_id, antes[0] if antes else None} - {None}
+        recalcular_agregados(cafe_ids)
+        recalcular_stats(cafe_ids)
+    elif antes != ahora:
+        cafe_antes, resta = _aporte(antes, -1)
+        cafe_ahora, suma = _aporte(ahora, 1)
+        if cafe_antes == cafe_ahora:
+            aplicar_delta(cafe_ahora, **{k: resta[k] + suma[k] for k in suma})
+        else:
+            aplicar_delta(cafe_antes, **resta)
+            aplicar_delta(cafe_ahora, **suma)
+        sumar_stats([
+            aporte_resena(cafe_antes, _creada(review), antes[1], -1),
+            aporte_resena(cafe_ahora, _creada(review), ahora[1], 1),
+        ])
+
+    review._agregados_originales = ahora
+
+
+def recalcular_agregados(cafe_ids=None):
+    """
+    Recalcula desde las reseñas los agregados de los cafés pedidos
+    (o de todos). Solo escribe los que cambiaron y devuelve cuántos fueron.
+    """
+    reviews = Review.objects.all()
+    cafes = Cafe.objects.only(
+        "id",
+        "rating_sum",
+        "review_count",
+        "positive_review_count",
+        "avg_rating",
+        "capuccino_price_sum",
+        "capuccino_price_count",
+        "avg_capuccino_price",
+    )
+    if cafe_ids is not None:
+        reviews = reviews.filter(cafe_id__in=cafe_ids)
+        cafes = cafes.filter(id__in=cafe_ids)
+
+    por_cafe = {
+        fila["cafe_id"]: fila
+        for fila in reviews.values("cafe_id").annotate(
+            suma=Coalesce(Sum("rating"), 0),
+            cantidad=Count("id"),
+            positivas=Count("id", filter=Q(rating__gte=RATING_POSITIVO)),
+            suma_precios=Coalesce(Sum("precio_capuccino"), 0),
+            cantidad_precios=Count("precio_capuccino"),
+        )
+    }
+
+    campos = Cafe.CAMPOS_AGREGADOS
+    cambiados = []
+    for cafe in cafes:
+        fila = por_cafe.get(cafe.id, {})
+        suma = fila.get("suma", 0)
+        cantidad = fila.get("cantidad", 0)
+        suma_precios = fila.get("suma_precios", 0)
+        cantidad_precios = fila.get("cantidad_precios", 0)
+
+        nuevos = (
+            suma,
+            cantidad,
+            fila.get("positivas", 0),
+            suma / cantidad if cantidad else None,
+            suma_precios,
+            cantidad_precios,
+            suma_precios / cantidad_precios if cantidad_precios else None,
+        )
+        if nuevos != tuple(getattr(cafe, campo) for campo in campos):
+            for campo, valor in zip(campos, nuevos):
+                setattr(cafe, campo, valor)
+            cambiados.append(cafe)
+
+    Cafe.objects.bulk_update(cambiados, campos, batch_size=500)
+    return len(cambiados)
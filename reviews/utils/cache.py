@@ -0,0 +1,36 @@
+"""
+Contadores de versión en el cache para invalidar en O(1).
+
+En vez de borrar cada key derivada (que muchas veces ni se conocen), las
+keys incluyen la versión vigente de su espacio (`cafe_detail`, `geo_index`,
+...) y para invalidar alcanza con subirla: lo viejo queda huérfano y
+expira solo.
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+def _version_key(namespace, obj_id=None):
+    if obj_id is None:
+        return f"{namespace}:version"
+    return f"{namespace}:version:{obj_id}"
+
+
+def get_version(namespace, obj_id=None):
+    key = _version_key(namespace, obj_id)
+    version = cache.get(key)
+    if version is None:
+        # Arranca en un valor que no se repite entre reinicios del cache
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, obj_id=None):
+    key = _version_key(namespace, obj_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
@@ -1,12 +1,165 @@
-def haversine_distance(lat1, lon1, lat2, lon2):
-    import math
-    R = 6371  # radio de la Tierra en km
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-
-    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-    return R * c
+import math
+
+from django.db.models import Q
+
+R_TIERRA_KM = 6371  # radio de la Tierra en km
+
+# 7 caracteres ≈ celdas de 150 m: alcanza para cualquier radio que usamos
+GEOHASH_PRECISION = 7
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    R = R_TIERRA_KM
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return R * c
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohash estándar (base32) de un punto."""
+    lat_rango = [-90.0, 90.0]
+    lon_rango = [-180.0, 180.0]
+    resultado = []
+    bits = 0
+    valor = 0
+    es_lon = True
+
+    while len(resultado) < precision:
+        rango, coord = (lon_rango, lon) if es_lon else (lat_rango, lat)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if coord >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        es_lon = not es_lon
+
+        bits += 1
+        if bits == 5:
+            resultado.append(_GEOHASH_BASE32[valor])
+            bits = 0
+            valor = 0
+
+    return "".join(resultado)
+
+
+def _celda_geohash(precision):
+    """Alto y ancho (en grados) de una celda de geohash de esa precisión."""
+    total = 5 * precision
+    bits_lon = (total + 1) // 2
+    bits_lat = total // 2
+    return 180.0 / (2 ** bits_lat), 360.0 / (2 ** bits_lon)
+
+
+def bounding_box(lat, lon, radio_km):
+    """
+    Caja (lat_min, lat_max, lon_min, lon_max) que contiene el círculo de
+    `radio_km` alrededor del punto. Los longitudes son None si la caja da
+    la vuelta al antimeridiano o toca un polo (ahí no conviene filtrar).
+    """
+    delta_lat = math.degrees(radio_km / R_TIERRA_KM)
+    lat_min = max(lat - delta_lat, -90.0)
+    lat_max = min(lat + delta_lat, 90.0)
+
+    cos_lat = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+    if cos_lat <= 1e-9:
+        return lat_min, lat_max, None, None
+
+    delta_lon = math.degrees(radio_km / (R_TIERRA_KM * cos_lat))
+    if delta_lon >= 180 or lon - delta_lon < -180 or lon + delta_lon > 180:
+        return lat_min, lat_max, None, None
+
+    return lat_min, lat_max, lon - delta_lon, lon + delta_lon
+
+
+def _prefijos_geohash(lat, lon, lat_min, lat_max, lon_min, lon_max):
+    """
+    Prefijos de geohash (la celda del punto y sus vecinas) que cubren la
+    caja. Devuelve None si la caja es más grande que cualquier celda.
+    """
+    alto = lat_max - lat_min
+    ancho = lon_max - lon_min
+
+    precision = GEOHASH_PRECISION
+    while precision > 0:
+        alto_celda, ancho_celda = _celda_geohash(precision)
+        if alto_celda >= alto / 2 and ancho_celda >= ancho / 2:
+            break
+        precision -= 1
+    else:
+        return None
+
+    prefijos = set()
+    for d_lat in (-alto_celda, 0, alto_celda):
+        for d_lon in (-ancho_celda, 0, ancho_celda):
+            vecino_lat = min(max(lat + d_lat, -90.0), 90.0)
+            vecino_lon = (lon + d_lon + 180.0) % 360.0 - 180.0
+            prefijos.add(geohash_encode(vecino_lat, vecino_lon, precision))
+    return prefijos
+
+
+def prefiltrar_radio(queryset, lat, lon, radio_km):
+    """
+    Acota un queryset de cafés a los candidatos que pueden estar a menos
+    de `radio_km`: celdas de geohash vecinas más la caja lat/lon, ambas
+    indexadas. La distancia exacta se sigue chequeando con haversine.
+    Solo la usa `reviews.utils.geo_index` cuando no hay NumPy.
+    """
+    lat_min, lat_max, lon_min, lon_max = bounding_box(lat, lon, radio_km)
+    queryset = queryset.filter(latitude__range=(lat_min, lat_max))
+
+    if lon_min is None:
+        return queryset.filter(longitude__isnull=False)
+
+    queryset = queryset.filter(longitude__range=(lon_min, lon_max))
+
+    prefijos = _prefijos_geohash(lat, lon, lat_min, lat_max, lon_min, lon_max)
+    if prefijos:
+        filtro = Q()
+        for prefijo in prefijos:
+            filtro |= Q(geohash__startswith=prefijo)
+        queryset = queryset.filter(filtro)
+
+    return queryset
+
+
+def cafes_en_radio(queryset, lat, lon, radio_km):
+    """Lista de (cafe, distancia_km) a menos de `radio_km`, de más cerca a más lejos."""
+    encontrados = []
+    for cafe in prefiltrar_radio(queryset, lat, lon, radio_km):
+        distancia = haversine_distance(lat, lon, cafe.latitude, cafe.longitude)
+        if distancia <= radio_km:
+            encontrados.append((cafe, distancia))
+
+    encontrados.sort(key=lambda par: par[1])
+    return encontrados
+
+
+def cafes_mas_cercanos(queryset, lat, lon, k, radio_inicial_km=1):
+    """
+    Los `k` cafés más cercanos como (cafe, distancia_km). Arranca con un
+    radio chico y lo duplica hasta juntar `k`: todo lo que está dentro del
+    radio ya se encontró, así que esos `k` son los más cercanos.
+    """
+    radio = radio_inicial_km
+    while radio < math.pi * R_TIERRA_KM:
+        encontrados = cafes_en_radio(queryset, lat, lon, radio)
+        if len(encontrados) >= k:
+            return encontrados[:k]
+        radio *= 2
+
+    # Radio más grande que media vuelta al mundo: entra todo
+    encontrados = [
+        (cafe, haversine_distance(lat, lon, cafe.latitude, cafe.longitude))
+        for cafe in queryset.filter(latitude__isnull=False, longitude__isnull=False)
+    ]
+    encontrados.sort(key=lambda par: par[1])
+    return encontrados[:k]
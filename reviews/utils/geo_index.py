@@ -0,0 +1,145 @@
+"""
+Índice en memoria de las coordenadas de todos los cafés geolocalizados.
+
+Con NumPy, las distancias a todo el catálogo se calculan en una sola
+operación sobre arrays (id, lat, lon) que cada proceso guarda en memoria.
+El índice se reconstruye cuando cambia la versión guardada en el cache
+(la suben las señales al guardar o borrar un `Cafe`).
+
+Sin NumPy se cae a la búsqueda por celda de geohash + caja de
+`reviews.utils.geo`. NumPy está en requirements.txt: ese camino queda solo
+para entornos donde no se puede instalar.
+"""
+
+import math
+import threading
+
+from reviews.models import Cafe
+from reviews.utils.cache import bump_version, get_version
+from reviews.utils.geo import (
+    R_TIERRA_KM,
+    cafes_en_radio,
+    cafes_mas_cercanos,
+    haversine_distance,
+)
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except Exception:
+    HAS_NUMPY = False
+
+
+_lock = threading.Lock()
+_indice = None
+_version = None
+
+
+def _haversine_np(lat, lon, lats, lons):
+    """Misma fórmula que `haversine_distance`, sobre arrays en radianes."""
+    phi1 = math.radians(lat)
+    delta_phi = lats - phi1
+    delta_lambda = lons - math.radians(lon)
+
+    a = np.sin(delta_phi / 2) ** 2 + math.cos(phi1) * np.cos(lats) * np.sin(delta_lambda / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return R_TIERRA_KM * c
+
+
+class IndiceGeo:
+    def __init__(self, filas):
+        filas = list(filas)
+        self.ids = np.fromiter((f[0] for f in filas), dtype=np.int64, count=len(filas))
+        self.lats = np.radians(np.fromiter((f[1] for f in filas), dtype=np.float64, count=len(filas)))
+        self.lons = np.radians(np.fromiter((f[2] for f in filas), dtype=np.float64, count=len(filas)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distancias(self, lat, lon):
+        return _haversine_np(lat, lon, self.lats, self.lons)
+
+    def en_radio(self, lat, lon, radio_km):
+        distancias = self.distancias(lat, lon)
+        dentro = np.flatnonzero(distancias <= radio_km)
+        return dict(zip(self.ids[dentro].tolist(), distancias[dentro].tolist()))
+
+    def mas_cercanos(self, lat, lon, k):
+        if k <= 0 or not len(self):
+            return []
+
+        distancias = self.distancias(lat, lon)
+        if k < len(distancias):
+            candidatos = np.argpartition(distancias, k - 1)[:k]
+        else:
+            candidatos = np.arange(len(distancias))
+        orden = candidatos[np.argsort(distancias[candidatos], kind="stable")]
+        return list(zip(self.ids[orden].tolist(), distancias[orden].tolist()))
+
+
+def invalidar():
+    """Marca el índice como viejo en todos los procesos que compartan el cache."""
+    bump_version("geo_index")
+
+
+def get_indice():
+    """Índice vigente; lo reconstruye si la versión del cache cambió."""
+    global _indice, _version
+
+    version = get_version("geo_index")
+    if _indice is not None and _version == version:
+        return _indice
+
+    with _lock:
+        if _indice is None or _version != version:
+            filas = (
+                Cafe.objects
+                .filter(latitude__isnull=False, longitude__isnull=False)
+                .values_list("id", "latitude", "longitude")
+            )
+            _indice = IndiceGeo(filas)
+            _version = version
+    return _indice
+
+
+def distancias_en_radio(lat, lon, radio_km):
+    """{cafe_id: distancia_km} de los cafés a menos de `radio_km`."""
+    if HAS_NUMPY:
+        return get_indice().en_radio(lat, lon, radio_km)
+
+    cafes = Cafe.objects.only("id", "latitude", "longitude")
+    return {cafe.id: dist for cafe, dist in cafes_en_radio(cafes, lat, lon, radio_km)}
+
+
+def mas_cercanos(lat, lon, k):
+    """[(cafe_id, distancia_km)] de los `k` cafés más cercanos, en orden."""
+    if HAS_NUMPY:
+        return get_indice().mas_cercanos(lat, lon, k)
+
+    cafes = Cafe.objects.only("id", "latitude", "longitude")
+    return [(cafe.id, dist) for cafe, dist in cafes_mas_cercanos(cafes, lat, lon, k)]
+
+
+def distancias_desde(lat, lon, objetos):
+    """
+    {id: distancia_km} desde el punto a cada objeto con coordenadas
+    (cafés o filas de una proyección), calculadas de una sola vez.
+    """
+    con_coords = [
+        obj for obj in objetos
+        if obj.latitude is not None and obj.longitude is not None
+    ]
+    if not con_coords:
+        return {}
+
+    if not HAS_NUMPY:
+        return {
+            obj.id: haversine_distance(lat, lon, obj.latitude, obj.longitude)
+            for obj in con_coords
+        }
+
+    lats = np.radians(np.fromiter((o.latitude for o in con_coords), dtype=np.float64, count=len(con_coords)))
+    lons = np.radians(np.fromiter((o.longitude for o in con_coords), dtype=np.float64, count=len(con_coords)))
+    distancias = _haversine_np(lat, lon, lats, lons)
+    return {obj.id: dist for obj, dist in zip(con_coords, distancias.tolist())}
@@ -1,22 +1,167 @@
-from io import BytesIO
-from django.core.files.base import ContentFile
-from PIL import Image
-
-def resize_and_compress(image_field, max_side=1600, quality=80):
-    if not image_field or not hasattr(image_field, 'file'):
-        return
-    img = Image.open(image_field)
-    if img.mode in ("RGBA", "P"):
-        img = img.convert("RGB")
-
-    # Redimensiona manteniendo proporción
-    img.thumbnail((max_side, max_side), Image.LANCZOS)
-
-    buf = BytesIO()
-    img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
-    buf.seek(0)
-
-    # Reescribe el archivo original con .jpg
-    base_name = image_field.name.rsplit('.', 1)[0]
-    new_name = f"{base_name}.jpg"
-    image_field.save(new_name, ContentFile(buf.read()), save=False)
+"""
+Imágenes subidas (fotos de cafés, avatares) y sus derivados.
+
+Por cada imagen se generan, una sola vez y fuera del request (tarea
+`reviews.image_derivatives`), versiones de varios anchos en WebP y JPEG.
+Las URLs y medidas quedan en el JSON `image_variants` del modelo:
+
+    {"photo1": {"source": "cafes/x.jpg",
+                "sizes": {"card": {"width": 640, "height": 480,
+                                   "webp": "https://...", "jpeg": "https://..."}, ...}}}
+
+`source` es el archivo del que salieron: si el campo cambió, los
+derivados quedan viejos y `url_derivado` devuelve la original hasta que
+se regeneren.
+"""
+
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image
+
+from core.uploads import decodificar
+
+# Ancho máximo de cada tamaño
+TAMANOS = {
+    "thumb": 320,
+    "card": 640,
+    "detail": 1280,
+}
+FORMATOS = {
+    "webp": {"format": "WEBP", "quality": 78, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 80, "optimize": True, "progressive": True},
+}
+CARPETA = "derivados"
+
+# Campos con imagen de cada modelo (por `_meta.label_lower`)
+CAMPOS_CON_IMAGEN = {
+    "reviews.cafe": ("photo1", "photo2", "photo3"),
+    "accounts.customuser": ("avatar",),
+}
+
+
+def resize_and_compress(image_field, max_side=1600, quality=80):
+    if not image_field or not hasattr(image_field, 'file'):
+        return
+    # Decodificación acotada: en JPEG no se arma el bitmap completo
+    img = decodificar(image_field, max_side)
+
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+    buf.seek(0)
+
+    # Reescribe el archivo original con .jpg
+    base_name = image_field.name.rsplit('.', 1)[0]
+    new_name = f"{base_name}.jpg"
+    image_field.save(new_name, ContentFile(buf.read()), save=False)
+
+
+# ---------------------------------
+# Derivados
+# ---------------------------------
+def _variantes(instance):
+    return getattr(instance, "image_variants", None) or {}
+
+
+def derivados_vigentes(instance, campo):
+    """Los derivados del campo si corresponden al archivo actual, si no None."""
+    archivo = getattr(instance, campo, None)
+    datos = _variantes(instance).get(campo)
+    if not archivo or not datos or datos.get("source") != archivo.name:
+        return None
+    return datos["sizes"]
+
+
+def campos_pendientes(instance, campos):
+    """Campos con imagen cuyos derivados faltan o quedaron viejos."""
+    return [
+        campo for campo in campos
+        if getattr(instance, campo, None) and derivados_vigentes(instance, campo) is None
+    ]
+
+
+def url_derivado(instance, campo, tamano="card", formato="jpeg"):
+    """
+    URL del tamaño pedido (o de la original si todavía no hay derivados).
+    None si el campo no tiene imagen.
+    """
+    sizes = derivados_vigentes(instance, campo)
+    if sizes and tamano in sizes:
+        return sizes[tamano][formato]
+
+    archivo = getattr(instance, campo, None)
+    if not archivo:
+        return None
+    try:
+        return archivo.url
+    except ValueError:
+        return None
+
+
+def srcset(instance, campo, formato="jpeg"):
+    """"url 320w, url 640w, ..." para <img srcset> / <source srcset>, o ""."""
+    sizes = derivados_vigentes(instance, campo) or {}
+    return ", ".join(
+        f"{datos[formato]} {datos['width']}w"
+        for _, datos in sorted(sizes.items(), key=lambda item: item[1]["width"])
+    )
+
+
+def generar_derivados(archivo):
+    """
+    Decodifica la imagen una vez y guarda cada tamaño en WebP y JPEG en el
+    mismo storage. Devuelve la entrada para `image_variants`.
+    """
+    storage = archivo.storage
+    base = os.path.splitext(archivo.name)[0]
+
+    with archivo.open("rb") as f:
+        img = decodificar(f, max(TAMANOS.values()))
+
+    sizes = {}
+    # Del más grande al más chico: cada uno se achica desde el anterior
+    actual = img
+    for tamano, ancho in sorted(TAMANOS.items(), key=lambda item: -item[1]):
+        if actual.width > ancho:
+            alto = max(1, round(actual.height * ancho / actual.width))
+            actual = actual.resize((ancho, alto), Image.LANCZOS)
+
+        datos = {"width": actual.width, "height": actual.height}
+        for formato, opciones in FORMATOS.items():
+            buffer = BytesIO()
+            actual.save(buffer, **opciones)
+            extension = "jpg" if formato == "jpeg" else formato
+            nombre = storage.save(
+                f"{CARPETA}/{base}-{tamano}.{extension}", ContentFile(buffer.getvalue())
+            )
+            datos[formato] = storage.url(nombre)
+        sizes[tamano] = datos
+
+    return {"source": archivo.name, "sizes": sizes}
+
+
+def procesar_derivados(instance, campos, forzar=False):
+    """
+    Genera los derivados que falten (o todos, con `forzar`) y los guarda en
+    `image_variants` sin pasar por `save()`. Devuelve los campos procesados.
+    """
+    pendientes = list(campos) if forzar else campos_pendientes(instance, campos)
+    pendientes = [campo for campo in pendientes if getattr(instance, campo, None)]
+
+    variantes = {
+        campo: datos for campo, datos in _variantes(instance).items()
+        if getattr(instance, campo, None)
+    }
+    for campo in pendientes:
+        variantes[campo] = generar_derivados(getattr(instance, campo))
+
+    if pendientes or variantes != _variantes(instance):
+        instance.image_variants = variantes
+        campos = {"image_variants": variantes}
+        if any(f.name == "updated_at" for f in instance._meta.concrete_fields):
+            # Cambian las URLs que muestra la API (ETag / Last-Modified)
+            campos["updated_at"] = timezone.now()
+        type(instance).objects.filter(pk=instance.pk).update(**campos)
+    return pendientes
@@ -0,0 +1,265 @@
+"""
+Datos del mapa de cafés por viewport (bbox + zoom).
+
+El viewport se cubre con tiles del mismo esquema que usa Leaflet
+(z/x/y). Cada tile se arma una vez y queda en el cache con key
+(versión "mapa", modo, zoom, x, y, máscara de filtros):
+
+  - con zoom bajo (< `ZOOM_PUNTOS`) cada tile se parte en una grilla de
+    `GRILLA` x `GRILLA` y se devuelve un cluster por celda (centro y
+    cantidad), agrupado en la base; las celdas con un solo café van como
+    punto.
+  - desde `ZOOM_PUNTOS` van los cafés sueltos (siempre en tiles de ese
+    zoom: los puntos no cambian al acercarse más).
+
+Las 14 características (wifi, pet friendly, ...) viajan como una máscara
+de bits (`FEATURES[i]` = bit i) en vez de 14 booleanos por café, y el
+filtro `f` usa la misma máscara. Las señales de `Cafe` suben la versión
+cuando cambia algo que se ve en el mapa.
+"""
+
+import math
+
+from django.core.cache import cache
+from django.db.models import Avg, Case, Count, F, FloatField, Min, Q, Value, When
+from django.db.models.functions import Floor, Greatest, Least
+
+from reviews.models import Cafe
+from reviews.utils.cache import get_version
+
+# El orden define el bit: agregar siempre al final
+FEATURES = (
+    "is_pet_friendly",
+    "has_wifi",
+    "has_outdoor_seating",
+    "is_vegan_friendly",
+    "has_parking",
+    "is_accessible",
+    "has_vegetarian_options",
+    "serves_breakfast",
+    "serves_alcohol",
+    "has_books_or_games",
+    "has_air_conditioning",
+    "has_gluten_free_options",
+    "has_specialty_coffee",
+    "has_artisanal_pastries",
+)
+BITS = {campo: 1 << i for i, campo in enumerate(FEATURES)}
+TODAS = (1 << len(FEATURES)) - 1
+
+# Campos de Cafe que cambian lo que devuelve el mapa
+CAMPOS_MAPA = {"name", "address", "latitude", "longitude", *FEATURES}
+
+ZOOM_MAX = 20
+# Desde este zoom se mandan cafés sueltos en vez de clusters
+ZOOM_PUNTOS = 14
+# Celdas por lado de cada tile al agrupar (tiles de 256 px → 64 px)
+GRILLA = 4
+# Si el viewport pide más tiles, se usan tiles de un zoom menor
+MAX_TILES = 48
+CACHE_TTL = 6 * 60 * 60
+# Límite de latitud de los tiles (Web Mercator)
+LAT_MAX = 85.05112878
+
+_CAMPOS_PUNTO = ("id", "name", "address", "latitude", "longitude", *FEATURES)
+
+
+# ---------------------------------
+# Máscara de características
+# ---------------------------------
+def mascara(fila):
+    """Máscara de un dict (o café) con las características."""
+    if isinstance(fila, dict):
+        return sum(bit for campo, bit in BITS.items() if fila.get(campo))
+    return sum(bit for campo, bit in BITS.items() if getattr(fila, campo, False))
+
+
+def filtro_mascara(valor):
+    """Q con los cafés que tienen todas las características de la máscara."""
+    return Q(**{campo: True for campo, bit in BITS.items() if valor & bit})
+
+
+# ---------------------------------
+# Tiles (esquema z/x/y de OSM)
+# ---------------------------------
+def tile_de(lat, lon, zoom):
+    n = 2 ** zoom
+    lat = min(max(lat, -LAT_MAX), LAT_MAX)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def limites_tile(zoom, x, y):
+    """(sur, oeste, norte, este) del tile, en grados."""
+    n = 2 ** zoom
+
+    def lat(fila):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * fila / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def _rango_tiles(oeste, sur, este, norte, zoom):
+    x_min, y_min = tile_de(norte, oeste, zoom)
+    x_max, y_max = tile_de(sur, este, zoom)
+    return range(x_min, x_max + 1), range(y_min, y_max + 1)
+
+
+def tiles_en_bbox(oeste, sur, este, norte, zoom, max_tiles=MAX_TILES):
+    """
+    (zoom, tiles) que cubren el bbox. Si hacen falta más de `max_tiles`
+    baja el zoom de los tiles (se cuentan antes de armar la lista).
+    """
+    xs, ys = _rango_tiles(oeste, sur, este, norte, zoom)
+    while len(xs) * len(ys) > max_tiles and zoom > 0:
+        zoom -= 1
+        xs, ys = _rango_tiles(oeste, sur, este, norte, zoom)
+    return zoom, [(x, y) for x in xs for y in ys]
+
+
+def _en_tiles(queryset, zoom, xs, ys):
+    """
+    Filtra al rectángulo de tiles `xs` x `ys`. Los bordes este y sur son
+    abiertos (salvo en el último tile) para que un café caiga en un solo
+    tile.
+    """
+    n = 2 ** zoom
+    sur, oeste, _, _ = limites_tile(zoom, xs[0], ys[-1])
+    _, _, norte, este = limites_tile(zoom, xs[-1], ys[0])
+    lon = Q(longitude__gte=oeste) & (Q(longitude__lte=este) if xs[-1] == n - 1 else Q(longitude__lt=este))
+    lat = Q(latitude__lte=norte) & (Q(latitude__gte=sur) if ys[-1] == n - 1 else Q(latitude__gt=sur))
+    return queryset.filter(lon & lat)
+
+
+# ---------------------------------
+# Armado de tiles
+# ---------------------------------
+def _base(valor):
+    return Cafe.objects.filter(
+        filtro_mascara(valor), latitude__isnull=False, longitude__isnull=False,
+    )
+
+
+def _punto(fila):
+    """[id, nombre, dirección, lat, lon, máscara] (~1 m de precisión)."""
+    datos = dict(zip(_CAMPOS_PUNTO, fila))
+    return [
+        datos["id"],
+        datos["name"],
+        datos["address"],
+        round(datos["latitude"], 5),
+        round(datos["longitude"], 5),
+        mascara(datos),
+    ]
+
+
+def _armar_puntos(zoom, tiles, valor):
+    """Cafés sueltos de los tiles, con una sola consulta para todos."""
+    datos = {tile: {"clusters": [], "cafes": []} for tile in tiles}
+
+    sur, oeste, _, _ = limites_tile(zoom, min(x for x, _ in tiles), max(y for _, y in tiles))
+    _, _, norte, este = limites_tile(zoom, max(x for x, _ in tiles), min(y for _, y in tiles))
+    filas = _base(valor).filter(
+        latitude__range=(sur, norte), longitude__range=(oeste, este),
+    ).values_list(*_CAMPOS_PUNTO)
+
+    for fila in filas:
+        tile = tile_de(fila[3], fila[4], zoom)
+        if tile in datos:
+            datos[tile]["cafes"].append(_punto(fila))
+    return datos
+
+
+def _armar_clusters(zoom, tiles, valor):
+    """
+    Un cluster por celda de la grilla de cada tile, con un solo GROUP BY
+    sobre el bbox de todos los tiles: la columna de celda (`gx`) es lineal
+    en la longitud y la fila (`gy`) sale de un CASE por fila de tiles
+    (Mercator no es lineal en la latitud). Cada celda se reparte a su
+    tile en Python. Los cafés solos en su celda se traen juntos en una
+    consulta más.
+    """
+    n = 2 ** zoom
+    xs = range(min(x for x, _ in tiles), max(x for x, _ in tiles) + 1)
+    ys = range(min(y for _, y in tiles), max(y for _, y in tiles) + 1)
+    ultima = float(GRILLA - 1)
+
+    # Las celdas en el borde de un tile quedan del lado del filtro
+    gx = Floor((F("longitude") + 180.0) / (360.0 / (n * GRILLA)))
+    gx = Greatest(Least(gx, Value(float(xs[-1] * GRILLA) + ultima)), Value(float(xs[0] * GRILLA)))
+    filas = []
+    for y in ys:
+        sur, _, norte, _ = limites_tile(zoom, 0, y)
+        celda = Least(Floor((F("latitude") - sur) / ((norte - sur) / GRILLA)), Value(ultima))
+        filas.append((sur, celda + float(y * GRILLA)))
+    # De norte a sur: la primera fila con el café al norte de su borde sur
+    gy = Case(
+        *(When(latitude__gt=sur, then=celda) for sur, celda in filas[:-1]),
+        default=filas[-1][1],
+        output_field=FloatField(),
+    )
+
+    celdas = (
+        _en_tiles(_base(valor), zoom, xs, ys)
+        .annotate(gx=gx, gy=gy)
+        .values("gx", "gy")
+        .annotate(n=Count("id"), lat=Avg("latitude"), lon=Avg("longitude"), primero=Min("id"))
+        .order_by()
+    )
+
+    datos = {tile: {"clusters": [], "cafes": []} for tile in tiles}
+    solos = {}
+    for celda in celdas:
+        tile = (int(celda["gx"]) // GRILLA, int(celda["gy"]) // GRILLA)
+        if tile not in datos:
+            continue
+        if celda["n"] == 1:
+            solos[celda["primero"]] = tile
+        else:
+            datos[tile]["clusters"].append([round(celda["lat"], 5), round(celda["lon"], 5), celda["n"]])
+
+    if solos:
+        for fila in Cafe.objects.filter(id__in=solos).values_list(*_CAMPOS_PUNTO):
+            datos[solos[fila[0]]]["cafes"].append(_punto(fila))
+    return datos
+
+
+def datos_mapa(oeste, sur, este, norte, zoom, valor=0):
+    """
+    Clusters y cafés que cubren el viewport:
+        {"clusters": [[lat, lon, cantidad], ...],
+         "cafes": [[id, nombre, dirección, lat, lon, máscara], ...]}
+    Puede traer algo de afuera del bbox (los tiles de los bordes).
+    """
+    zoom = min(max(int(zoom), 0), ZOOM_MAX)
+    valor = int(valor) & TODAS
+    sur, norte = sorted((max(sur, -LAT_MAX), min(norte, LAT_MAX)))
+    if oeste > este:
+        # Cruza el antimeridiano: se toma todo el ancho
+        oeste, este = -180.0, 180.0
+    oeste, este = max(oeste, -180.0), min(este, 180.0)
+
+    modo = "p" if zoom >= ZOOM_PUNTOS else "c"
+    zoom_tiles = ZOOM_PUNTOS if modo == "p" else zoom
+    zoom_tiles, tiles = tiles_en_bbox(oeste, sur, este, norte, zoom_tiles)
+
+    version = get_version("mapa")
+    keys = {
+        tile: f"mapa:{version}:{modo}:{zoom_tiles}:{tile[0]}:{tile[1]}:{valor}"
+        for tile in tiles
+    }
+    en_cache = cache.get_many(keys.values())
+
+    faltan = [tile for tile, key in keys.items() if key not in en_cache]
+    if faltan:
+        armar = _armar_puntos if modo == "p" else _armar_clusters
+        nuevos = armar(zoom_tiles, faltan, valor)
+        cache.set_many({keys[tile]: datos for tile, datos in nuevos.items()}, CACHE_TTL)
+        en_cache.update({keys[tile]: datos for tile, datos in nuevos.items()})
+
+    resultado = {"clusters": [], "cafes": []}
+    for key in keys.values():
+        resultado["clusters"].extend(en_cache[key]["clusters"])
+        resultado["cafes"].extend(en_cache[key]["cafes"])
+    return resultado
@@ -0,0 +1,206 @@
+"""
+Carteles con el QR para dejar reseña en cada café (PNG de 1000x1400).
+
+- El logo y la fuente se cargan una sola vez por proceso.
+- Con `workers` > 1 los carteles se renderizan en un pool de procesos
+  (cada worker carga los recursos en su `initializer`) y se devuelven a
+  medida que terminan. Solo lo usa la tarea `generate_qr_archive`: dentro
+  de un request web se renderiza en serie, sin forkear el worker de
+  gunicorn.
+- Cada cartel queda en un cache en disco con key (café, nombre, URL de
+  reseña): volver a generar los de cafés que no cambiaron no cuesta nada.
+- `zip_en_streaming` arma el ZIP sobre la marcha, sin tenerlo entero en
+  memoria.
+
+Los carteles se arman a partir de tuplas (cafe_id, nombre, review_url)
+(ver `datos_cafes`), así los workers no tocan la base.
+"""
+
+import hashlib
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+import qrcode
+from django.conf import settings
+from django.urls import reverse
+from PIL import Image, ImageDraw, ImageFont
+
+ANCHO = 1000
+ALTO = 1400
+LADO_QR = 900
+LADO_LOGO = 350
+# Subir si cambia el diseño, para no servir carteles viejos del cache
+VERSION_DISENO = 1
+# Con pocos carteles no vale la pena levantar procesos
+MINIMO_PARA_POOL = 4
+
+_recursos = None
+
+
+def _inicializar():
+    """Carga logo y fuente en el proceso actual (initializer del pool)."""
+    global _recursos
+    logo_path = os.path.join(settings.BASE_DIR, "static/images/gota-og.png")
+    try:
+        logo = Image.open(logo_path).convert("RGBA")
+        logo.thumbnail((LADO_LOGO, LADO_LOGO))
+        logo.load()
+    except Exception:
+        logo = None
+
+    try:
+        font = ImageFont.truetype("DejaVuSans-Bold.ttf", 60)
+    except Exception:
+        font = ImageFont.load_default()
+
+    _recursos = (logo, font)
+
+
+def render_poster(nombre, review_url):
+    """PNG del cartel de un café."""
+    if _recursos is None:
+        _inicializar()
+    logo, font = _recursos
+
+    qr = qrcode.make(review_url).convert("RGB").resize((LADO_QR, LADO_QR))
+
+    img = Image.new("RGB", (ANCHO, ALTO), "white")
+    draw = ImageDraw.Draw(img)
+
+    if logo is not None:
+        img.paste(logo, ((ANCHO - logo.width) // 2, 40), logo)
+        top_after_logo = 40 + logo.height + 40
+    else:
+        top_after_logo = 120
+
+    img.paste(qr, ((ANCHO - qr.width) // 2, top_after_logo))
+
+    bbox = draw.textbbox((0, 0), nombre, font=font)
+    text_x = (ANCHO - (bbox[2] - bbox[0])) // 2
+    text_y = top_after_logo + qr.height + 40
+    draw.text((text_x, text_y), nombre, fill="black", font=font)
+
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _render_en_worker(cafe):
+    return cafe, render_poster(cafe[1], cafe[2])
+
+
+# ---------------------------------
+# Cache en disco
+# ---------------------------------
+def _ruta_cache(cafe):
+    cafe_id, nombre, review_url = cafe
+    clave = f"{VERSION_DISENO}|{cafe_id}|{nombre}|{review_url}"
+    digest = hashlib.sha1(clave.encode()).hexdigest()
+    return os.path.join(settings.QR_POSTER_CACHE_DIR, digest[:2], f"{digest}.png")
+
+
+def _leer_cache(cafe):
+    try:
+        with open(_ruta_cache(cafe), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _guardar_cache(cafe, png):
+    ruta = _ruta_cache(cafe)
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Escritura atómica: otro proceso nunca lee un PNG a medias
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(png)
+        os.replace(temporal, ruta)
+    except OSError:
+        pass
+
+
+# ---------------------------------
+# Generación
+# ---------------------------------
+def datos_cafes(cafes, base_url):
+    """Tuplas (cafe_id, nombre, review_url) de un queryset de cafés."""
+    base_url = base_url.rstrip("/")
+    return [
+        (cafe_id, nombre, base_url + reverse("reviews:create_review", args=[cafe_id]))
+        for cafe_id, nombre in cafes.values_list("id", "name")
+    ]
+
+
+def nombre_archivo(cafe):
+    cafe_id, nombre, _ = cafe
+    safe_name = "".join(c for c in nombre if c.isalnum() or c in (" ", "_", "-")).strip()
+    return f"{safe_name.replace(' ', '_').lower()}-{cafe_id}.png"
+
+
+def carteles(cafes, workers=1):
+    """
+    Genera (cafe, png) para cada tupla (cafe_id, nombre, review_url): primero
+    los que ya están en el cache y después los demás, en serie o (con
+    `workers` > 1) a medida que el pool los termina.
+    """
+    faltan = []
+    for cafe in cafes:
+        png = _leer_cache(cafe)
+        if png is None:
+            faltan.append(cafe)
+        else:
+            yield cafe, png
+
+    if not faltan:
+        return
+
+    if workers <= 1 or len(faltan) < MINIMO_PARA_POOL:
+        for cafe in faltan:
+            png = render_poster(cafe[1], cafe[2])
+            _guardar_cache(cafe, png)
+            yield cafe, png
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_inicializar)
+    try:
+        futuros = [pool.submit(_render_en_worker, cafe) for cafe in faltan]
+        for futuro in as_completed(futuros):
+            cafe, png = futuro.result()
+            _guardar_cache(cafe, png)
+            yield cafe, png
+    finally:
+        # Si se corta la descarga no se siguen renderizando los pendientes
+        pool.shutdown(cancel_futures=True)
+
+
+class _Salida:
+    """Destino sin seek para `ZipFile`: junta lo escrito hasta que se lee."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, data):
+        self._partes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        data = b"".join(self._partes)
+        self._partes = []
+        return data
+
+
+def zip_en_streaming(cafes, workers=1):
+    """Bytes del ZIP con un PNG por café, a medida que se generan."""
+    salida = _Salida()
+    # Los PNG ya vienen comprimidos: guardarlos tal cual
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_STORED) as archivo:
+        for cafe, png in carteles(cafes, workers=workers):
+            archivo.writestr(nombre_archivo(cafe), png)
+            yield salida.vaciar()
+    yield salida.vaciar()
@@ -1,5 +1,10 @@
+from django.db.models import Count, F, Q
 from django.utils import timezone
 from datetime import timedelta
+from types import SimpleNamespace
+
+from reviews.models import Cafe, CafeRankingSnapshot, CafeRelationship, Review
+from reviews.utils.geo_index import distancias_desde
 
 
 def calcular_score_cafe(
@@ -114,3 +119,386 @@ def calcular_score_cafe(
         score += min(affinity, 2.0)
 
     return round(score, 2)
+
+
+def _score_base(cafe, *, relaciones, reviews_recientes, respuesta_reciente):
+    """Parte del score que no depende de quién mira (A–F)."""
+    score = 0.0
+
+    rating = getattr(cafe, "average_rating", 0) or 0
+    reviews = getattr(cafe, "total_reviews", 0) or 0
+
+    score += rating * 3.2
+    score += min(reviews, 20) * 0.45
+
+    score += min(relaciones, 30) * 0.4
+
+    fotos = sum(bool(getattr(cafe, f"photo{i}", None)) for i in (1, 2, 3))
+    score += fotos * 1.2
+
+    features = [
+        cafe.is_vegan_friendly,
+        cafe.is_pet_friendly,
+        cafe.has_wifi,
+        cafe.has_outdoor_seating,
+        cafe.has_parking,
+        cafe.is_accessible,
+        cafe.has_vegetarian_options,
+        cafe.serves_breakfast,
+        cafe.serves_alcohol,
+        cafe.has_books_or_games,
+        cafe.has_air_conditioning,
+    ]
+    score += sum(features) * 0.3
+
+    boost = min(reviews_recientes, 2) * 1.0
+    if respuesta_reciente:
+        boost += 1.2
+    if fotos:
+        boost += 0.6
+    score += min(boost, 3.0)
+
+    if cafe.visibility_level == 1:
+        score *= 1.10
+    elif cafe.visibility_level == 2:
+        score *= 1.25
+
+    return score
+
+
+def _score_personal(score, cafe, *, recent_vistos, user_lat, user_lon, favoritos, distancias):
+    """
+    Ajustes por usuario (G–I) sobre el score base. `distancias` trae la
+    distancia al usuario de cada café, calculada de una vez para todo el lote.
+    """
+    if cafe.id in recent_vistos:
+        score *= 0.82
+    else:
+        score *= 1.08
+
+    distance_boost = 0.0
+    dist = distancias.get(cafe.id)
+    if user_lat and user_lon and cafe.latitude and cafe.longitude and dist is not None:
+        if dist <= 0.5:
+            distance_boost = 3.5
+        elif dist <= 1:
+            distance_boost = 2.5
+        elif dist <= 2:
+            distance_boost = 1.5
+        elif dist <= 3:
+            distance_boost = 0.8
+
+    score += min(distance_boost, 3.0)
+
+    if favoritos:
+        affinity = 0.0
+
+        for fav in favoritos:
+            if cafe.is_pet_friendly and fav.is_pet_friendly:
+                affinity += 0.4
+            if cafe.is_vegan_friendly and fav.is_vegan_friendly:
+                affinity += 0.4
+            if cafe.has_wifi and fav.has_wifi:
+                affinity += 0.3
+            if cafe.has_outdoor_seating and fav.has_outdoor_seating:
+                affinity += 0.3
+            if cafe.has_books_or_games and fav.has_books_or_games:
+                affinity += 0.2
+
+        score += min(affinity, 2.0)
+
+    return round(score, 2)
+
+
+def _actividad_por_cafe(ids=None):
+    """
+    Popularidad, reseñas de los últimos 14 días y respuestas recientes del
+    dueño para muchos cafés a la vez (dos consultas agrupadas).
+    Con `ids=None` se calcula para todo el catálogo.
+    """
+    relaciones_qs = CafeRelationship.objects.all()
+    hace_14_dias = timezone.now() - timedelta(days=14)
+    reviews_qs = Review.objects.filter(created_at__gte=hace_14_dias)
+
+    if ids is not None:
+        relaciones_qs = relaciones_qs.filter(cafe_id__in=ids)
+        reviews_qs = reviews_qs.filter(cafe_id__in=ids)
+
+    relaciones = dict(
+        relaciones_qs
+        .values("cafe_id")
+        .annotate(n=Count("id"))
+        .values_list("cafe_id", "n")
+    )
+
+    actividad = {
+        row["cafe_id"]: row
+        for row in (
+            reviews_qs
+            .values("cafe_id")
+            .annotate(
+                recientes=Count("id"),
+                respondidas=Count("id", filter=Q(owner_reply__isnull=False)),
+            )
+        )
+    }
+
+    return relaciones, actividad
+
+
+def _scores_base_de(filas, ids=None):
+    relaciones, actividad = _actividad_por_cafe(ids)
+
+    scores = {}
+    for fila in filas:
+        recientes = actividad.get(fila.id, {})
+        scores[fila.id] = _score_base(
+            fila,
+            relaciones=relaciones.get(fila.id, 0),
+            reviews_recientes=recientes.get("recientes", 0),
+            respuesta_reciente=recientes.get("respondidas", 0) > 0,
+        )
+    return scores
+
+
+def _distancias(cafes, user_lat, user_lon):
+    if user_lat and user_lon:
+        return distancias_desde(user_lat, user_lon, cafes)
+    return {}
+
+
+def _favoritos(user):
+    if user and hasattr(user, "favorite_cafes"):
+        return list(user.favorite_cafes.all()[:5])
+    return []
+
+
+def calcular_scores_cafes(
+    cafes,
+    *,
+    user=None,
+    user_lat=None,
+    user_lon=None,
+    cafes_vistos_ids=None,
+):
+    """
+    Versión en lote de `calcular_score_cafe` para un listado completo.
+
+    Recibe los cafés (anotados con `average_rating` y `total_reviews`, igual
+    que la versión por café) y devuelve {cafe_id: score}. Popularidad,
+    actividad reciente y respuestas del dueño se resuelven con dos consultas
+    agrupadas en vez de 3–4 consultas por café.
+    """
+    cafes = list(cafes)
+    if not cafes:
+        return {}
+
+    bases = _scores_base_de(cafes, [cafe.id for cafe in cafes])
+
+    favoritos = _favoritos(user)
+    recent_vistos = set((cafes_vistos_ids or [])[-10:])
+    distancias = _distancias(cafes, user_lat, user_lon)
+
+    return {
+        cafe.id: _score_personal(
+            bases[cafe.id],
+            cafe,
+            recent_vistos=recent_vistos,
+            user_lat=user_lat,
+            user_lon=user_lon,
+            favoritos=favoritos,
+            distancias=distancias,
+        )
+        for cafe in cafes
+    }
+
+
+# Columnas que lee el score; alcanza con esto para ordenar todo el catálogo.
+CAMPOS_RANKING = (
+    "id",
+    "latitude",
+    "longitude",
+    "photo1",
+    "photo2",
+    "photo3",
+    "visibility_level",
+    "is_vegan_friendly",
+    "is_pet_friendly",
+    "has_wifi",
+    "has_outdoor_seating",
+    "has_parking",
+    "is_accessible",
+    "has_vegetarian_options",
+    "serves_breakfast",
+    "serves_alcohol",
+    "has_books_or_games",
+    "has_air_conditioning",
+)
+
+# Lo único que hace falta en el request cuando el score base ya está guardado.
+CAMPOS_PERSONALES = (
+    "id",
+    "latitude",
+    "longitude",
+    "is_pet_friendly",
+    "is_vegan_friendly",
+    "has_wifi",
+    "has_outdoor_seating",
+    "has_books_or_games",
+)
+
+
+def proyeccion_ranking(queryset):
+    """
+    Trae solo las columnas que usa el score (con `average_rating` y
+    `total_reviews` tomados de los agregados guardados en el café) como
+    objetos livianos, sin instanciar `Cafe`.
+    """
+    filas = queryset.values(
+        *CAMPOS_RANKING,
+        average_rating=F("avg_rating"),
+        total_reviews=F("review_count"),
+    )
+    return [SimpleNamespace(**fila) for fila in filas]
+
+
+def calcular_scores_base(cafe_ids=None):
+    """
+    Score base (calidad, popularidad, fotos, características, actividad y
+    plan) de los cafés pedidos, o de todo el catálogo con `cafe_ids=None`.
+    Es la parte del score que es igual para cualquier visitante.
+    """
+    cafes = Cafe.objects.all()
+    if cafe_ids is not None:
+        cafes = cafes.filter(id__in=cafe_ids)
+
+    return _scores_base_de(proyeccion_ranking(cafes), cafe_ids)
+
+
+def refrescar_ranking(cafe_ids=None):
+    """
+    Recalcula y guarda `CafeRankingSnapshot` para los cafés pedidos (o todos).
+    Devuelve cuántos snapshots se escribieron.
+    """
+    bases = calcular_scores_base(cafe_ids)
+    ahora = timezone.now()
+
+    CafeRankingSnapshot.objects.bulk_create(
+        [
+            CafeRankingSnapshot(cafe_id=cafe_id, base_score=score, computed_at=ahora)
+            for cafe_id, score in bases.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["cafe"],
+        update_fields=["base_score", "computed_at"],
+    )
+    return len(bases)
+
+
+def cafes_con_actividad_vencida(margen):
+    """
+    Cafés con alguna reseña que salió de la ventana de 14 días en el último
+    `margen`: su boost de actividad bajó solo por el paso del tiempo, sin
+    ninguna escritura que dispare la señal.
+    """
+    hace_14_dias = timezone.now() - timedelta(days=14)
+    return list(
+        Review.objects
+        .filter(created_at__range=(hace_14_dias - margen, hace_14_dias))
+        .values_list("cafe_id", flat=True)
+        .distinct()
+    )
+
+
+def proyeccion_snapshot(queryset):
+    """
+    Columnas para la parte personal del score más el `base_score` guardado.
+    Los cafés que todavía no tienen snapshot se calculan en el momento
+    (sin guardarlos; eso queda para la señal o el comando).
+    """
+    filas = [
+        SimpleNamespace(**fila)
+        for fila in queryset.values(
+            *CAMPOS_PERSONALES,
+            base_score=F("ranking__base_score"),
+        )
+    ]
+
+    faltantes = [fila.id for fila in filas if fila.base_score is None]
+    if faltantes:
+        bases = calcular_scores_base(faltantes)
+        for fila in filas:
+            if fila.base_score is None:
+                fila.base_score = bases.get(fila.id, 0.0)
+
+    return filas
+
+
+def aplicar_personalizacion(
+    filas,
+    *,
+    user=None,
+    user_lat=None,
+    user_lon=None,
+    cafes_vistos_ids=None,
+    distancias=None,
+):
+    """
+    Score final a partir del `base_score` de cada fila: solo diversidad,
+    cercanía y afinidad se calculan por request. Devuelve {cafe_id: score}.
+
+    Si ya se tienen las distancias al usuario (por ejemplo, del filtro por
+    radio) se pasan en `distancias` y no se vuelven a calcular.
+    """
+    favoritos = _favoritos(user)
+    recent_vistos = set((cafes_vistos_ids or [])[-10:])
+    if distancias is None:
+        distancias = _distancias(filas, user_lat, user_lon)
+
+    return {
+        fila.id: _score_personal(
+            fila.base_score,
+            fila,
+            recent_vistos=recent_vistos,
+            user_lat=user_lat,
+            user_lon=user_lon,
+            favoritos=favoritos,
+            distancias=distancias,
+        )
+        for fila in filas
+    }
+
+
+class CafesRankeados:
+    """
+    Secuencia de cafés ya ordenada por score.
+
+    Guarda solo los ids; al cortarla (lo que hace el Paginator con la página
+    pedida) trae los `Cafe` completos de ese tramo desde `queryset` y les
+    deja el `score` calculado.
+    """
+
+    def __init__(self, ids, scores, queryset):
+        self.ids = list(ids)
+        self.scores = scores
+        self.queryset = queryset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1 or None][0]
+
+        ids = self.ids[index]
+        por_id = self.queryset.in_bulk(ids)
+
+        cafes = []
+        for cafe_id in ids:
+            cafe = por_id.get(cafe_id)
+            if cafe is None:
+                continue
+            cafe.score = self.scores[cafe_id]
+            cafes.append(cafe)
+
+        return cafes
@@ -0,0 +1,201 @@
+"""
+Cafés relacionados precalculados (`CafeNeighbor`).
+
+Cada café guarda sus `VECINOS_POR_CAFE` mejores vecinos con un score que
+suma misma zona, misma provincia, características en común (Jaccard
+sobre la máscara de `reviews.utils.mapa`) y cercanía. El endpoint de
+relacionados lee esa lista (una búsqueda por índice) y sortea en Python
+con probabilidad proporcional al score, así la respuesta sigue variando
+sin un ORDER BY RANDOM() sobre toda la tabla. Mientras un café no
+tiene lista se sortea entre `vecinos_provisorios` (unos pocos de la
+misma zona o provincia).
+
+Cuando un café cambia (o se borra) `actualizar_vecinos` recalcula solo
+las listas que pueden cambiar: la del café, las que lo tenían y las que
+ahora lo aceptarían por score; `encolar_vecinos` lo deja como tarea en
+segundo plano. `recalcular_vecinos()` rehace todo. Los datos con que se
+calculó cada café quedan en el cache, así guardar sin tocar nada de eso
+no encola otro cálculo (`hay_cambios`).
+"""
+
+import heapq
+import random
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min
+
+from core.jobs import enqueue
+from reviews.models import Cafe, CafeNeighbor
+from reviews.utils.geo import haversine_distance
+from reviews.utils.mapa import BITS, FEATURES, mascara
+
+VECINOS_POR_CAFE = 20
+
+PESO_ZONA = 3.0
+PESO_PROVINCIA = 1.5
+PESO_CARACTERISTICAS = 2.0
+PESO_CERCANIA = 2.0
+# Más lejos que esto la cercanía ya no suma
+RADIO_CERCANIA_KM = 10
+# Para que un vecino con score 0 también pueda salir en el sorteo
+PESO_MINIMO = 0.1
+
+# Sin lista guardada todavía: cuántos candidatos baratos se sortean
+CANDIDATOS_PROVISORIOS = 12
+
+# Campos de Cafe que cambian el score
+CAMPOS_RELACIONADOS = {"location", "province", "latitude", "longitude", *FEATURES}
+CACHE_TTL = 30 * 24 * 60 * 60
+
+
+def _cargar():
+    """{id: (zona, provincia, lat, lon, máscara)} de todos los cafés."""
+    datos = {}
+    for fila in Cafe.objects.values_list("id", "location", "province", "latitude", "longitude", *FEATURES):
+        cafe_id, zona, provincia, lat, lon = fila[:5]
+        mascara = sum(bit for bit, activa in zip(BITS.values(), fila[5:]) if activa)
+        datos[cafe_id] = (zona, provincia, lat, lon, mascara)
+    return datos
+
+
+def _cache_key(cafe_id):
+    return f"vecinos:datos:{cafe_id}"
+
+
+def hay_cambios(cafe):
+    """False si el café tiene los mismos datos con que se calculó su lista."""
+    valores = (cafe.location, cafe.province, cafe.latitude, cafe.longitude, mascara(cafe))
+    return cache.get(_cache_key(cafe.pk)) != valores
+
+
+def similitud(a, b):
+    """Score entre dos cafés (tuplas de `_cargar`); simétrico."""
+    total = 0.0
+    if a[0] and a[0] == b[0]:
+        total += PESO_ZONA
+    if a[1] and a[1] == b[1]:
+        total += PESO_PROVINCIA
+
+    union = a[4] | b[4]
+    if union:
+        total += PESO_CARACTERISTICAS * (a[4] & b[4]).bit_count() / union.bit_count()
+
+    if None not in (a[2], a[3], b[2], b[3]):
+        km = haversine_distance(a[2], a[3], b[2], b[3])
+        total += PESO_CERCANIA * max(0.0, 1 - km / RADIO_CERCANIA_KM)
+    return total
+
+
+def mejores_vecinos(cafe_id, datos=None):
+    """[(neighbor_id, score), ...] de mayor a menor score; None si el café no existe."""
+    datos = _cargar() if datos is None else datos
+    propio = datos.get(cafe_id)
+    if propio is None:
+        return None
+    return heapq.nlargest(
+        VECINOS_POR_CAFE,
+        ((otro, similitud(propio, valores)) for otro, valores in datos.items() if otro != cafe_id),
+        key=lambda par: (par[1], -par[0]),
+    )
+
+
+def vecinos_provisorios(cafe_id):
+    """
+    Para un café sin lista guardada (nuevo, o antes de que corra su
+    tarea): unos pocos de la misma zona, después de la misma provincia y
+    si faltan cualquiera, cada grupo con LIMIT y sin recorrer el catálogo.
+    Mismo formato que `mejores_vecinos`; None si el café no existe.
+    """
+    propio = Cafe.objects.filter(id=cafe_id).values("location", "province").first()
+    if propio is None:
+        return None
+
+    vecinos = []
+    grupos = (
+        ({"location": propio["location"]} if propio["location"] else None, PESO_ZONA),
+        ({"province": propio["province"]} if propio["province"] else None, PESO_PROVINCIA),
+        ({}, 0.0),
+    )
+    for filtro, score in grupos:
+        faltan = CANDIDATOS_PROVISORIOS - len(vecinos)
+        if filtro is None or faltan <= 0:
+            continue
+        ids = (
+            Cafe.objects
+            .filter(**filtro)
+            .exclude(id__in=[cafe_id, *(vecino for vecino, _ in vecinos)])
+            .values_list("id", flat=True)[:faltan]
+        )
+        vecinos.extend((vecino, score) for vecino in ids)
+    return vecinos
+
+
+def recalcular_vecinos(cafe_ids=None, datos=None):
+    """
+    Rehace la lista de los cafés pedidos (o de todos). Devuelve cuántas
+    listas se escribieron.
+    """
+    datos = _cargar() if datos is None else datos
+    cafe_ids = [cafe_id for cafe_id in (datos if cafe_ids is None else cafe_ids) if cafe_id in datos]
+    if not cafe_ids:
+        return 0
+
+    filas = [
+        CafeNeighbor(cafe_id=cafe_id, neighbor_id=vecino, score=score)
+        for cafe_id in cafe_ids
+        for vecino, score in mejores_vecinos(cafe_id, datos)
+    ]
+    with transaction.atomic():
+        CafeNeighbor.objects.filter(cafe_id__in=cafe_ids).delete()
+        CafeNeighbor.objects.bulk_create(filas, batch_size=1000)
+    cache.set_many({_cache_key(cafe_id): datos[cafe_id] for cafe_id in cafe_ids}, CACHE_TTL)
+    return len(cafe_ids)
+
+
+def actualizar_vecinos(cafe_id):
+    """
+    Después de guardar o borrar `cafe_id`: recalcula su lista, las que lo
+    tenían y las que ahora lo incluirían; también las que quedaron cortas
+    (cafés nuevos, o vecinos borrados).
+    """
+    datos = _cargar()
+    limite = min(VECINOS_POR_CAFE, len(datos) - 1)
+    resumen = {
+        fila["cafe_id"]: (fila["n"], fila["minimo"])
+        for fila in CafeNeighbor.objects.values("cafe_id").annotate(n=Count("id"), minimo=Min("score")).order_by()
+    }
+
+    afectados = {otro for otro in datos if resumen.get(otro, (0, None))[0] < limite}
+    if cafe_id in datos:
+        afectados.add(cafe_id)
+        afectados.update(CafeNeighbor.objects.filter(neighbor_id=cafe_id).values_list("cafe_id", flat=True))
+        propio = datos[cafe_id]
+        afectados.update(
+            otro for otro, valores in datos.items()
+            if otro not in afectados and similitud(propio, valores) > resumen[otro][1]
+        )
+    return recalcular_vecinos(afectados, datos)
+
+
+def encolar_vecinos(cafe_id):
+    """Encola `actualizar_vecinos(cafe_id)`, una sola vez mientras esté pendiente."""
+    enqueue(
+        "reviews.related_cafes",
+        {"cafe_id": cafe_id},
+        dedupe_key=f"related_cafes:{cafe_id}",
+    )
+
+
+def sortear(vecinos, cantidad):
+    """
+    `cantidad` ids distintos de [(neighbor_id, score), ...], con
+    probabilidad proporcional al score (muestreo ponderado sin
+    reposición de Efraimidis-Spirakis), ordenados por score.
+    """
+    claves = [
+        (random.random() ** (1 / (score + PESO_MINIMO)), vecino, score)
+        for vecino, score in vecinos
+    ]
+    elegidos = heapq.nlargest(cantidad, claves)
+    return [vecino for _, vecino, _ in sorted(elegidos, key=lambda clave: -clave[2])]
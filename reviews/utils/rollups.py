@@ -0,0 +1,126 @@
+"""
+Rollups diarios por café en `CafeStat`: vistas, reseñas, favoritos y
+suma de ratings de cada (café, día).
+
+Se mantienen sumando diferencias con un INSERT ... ON CONFLICT DO UPDATE
+(col = col + n), así no hace falta leer la fila antes ni se pisan dos
+escrituras simultáneas. Las reseñas y favoritos cuentan en el día en que
+se crearon: al borrarlos se resta de ese mismo día, y la suma de todos
+los días da el total vigente.
+
+`recalcular_stats` rehace reseñas/favoritos/ratings desde las tablas
+originales si algo se desincroniza (las vistas no se tocan).
+"""
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from reviews.models import CafeRelationship, CafeStat, Review
+
+COLUMNAS = ("views", "reviews", "favorites", "rating_sum")
+
+
+def sumar_stats(filas):
+    """
+    Suma a CafeStat en una sola sentencia. Cada fila es
+    (cafe_id, fecha, {"views": n, "reviews": n, ...}); lo que falta es 0.
+    """
+    # Una sola fila por (café, día): Postgres no deja tocar dos veces la
+    # misma fila en un ON CONFLICT
+    por_clave = {}
+    for cafe_id, fecha, deltas in filas:
+        if not cafe_id:
+            continue
+        acumulado = por_clave.setdefault((cafe_id, fecha), [0] * len(COLUMNAS))
+        for i, col in enumerate(COLUMNAS):
+            acumulado[i] += deltas.get(col, 0)
+
+    filas = []
+    for (cafe_id, fecha), deltas in por_clave.items():
+        if any(d > 0 for d in deltas):
+            filas.append((cafe_id, fecha, deltas))
+        elif any(deltas):
+            _restar(cafe_id, fecha, deltas)
+    if not filas:
+        return
+
+    qn = connection.ops.quote_name
+    meta = CafeStat._meta
+    tabla = qn(meta.db_table)
+    cafe_col = qn(meta.get_field("cafe").column)
+    fecha_col = qn(meta.get_field("date").column)
+    columnas = [qn(meta.get_field(col).column) for col in COLUMNAS]
+
+    valores = ", ".join(["(%s)" % ", ".join(["%s"] * (len(COLUMNAS) + 2))] * len(filas))
+    params = [valor for cafe_id, fecha, deltas in filas for valor in (cafe_id, fecha, *deltas)]
+    sumas = ", ".join(f"{col} = {tabla}.{col} + EXCLUDED.{col}" for col in columnas)
+    sql = (
+        f"INSERT INTO {tabla} ({cafe_col}, {fecha_col}, {', '.join(columnas)}) "
+        f"VALUES {valores} "
+        f"ON CONFLICT ({cafe_col}, {fecha_col}) DO UPDATE SET {sumas}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _restar(cafe_id, fecha, deltas):
+    # Una resta nunca crea la fila: lo que se resta se sumó antes. Además,
+    # al borrar un café en cascada sus stats ya no están y no hay que
+    # revivirlas.
+    CafeStat.objects.filter(cafe_id=cafe_id, date=fecha).update(**{
+        col: F(col) + delta for col, delta in zip(COLUMNAS, deltas) if delta
+    })
+
+
+def _fecha(momento):
+    return timezone.localdate(momento) if momento else timezone.localdate()
+
+
+def aporte_resena(cafe_id, creada, rating, signo):
+    """Fila de `sumar_stats` con lo que una reseña suma (o resta) a su día."""
+    return cafe_id, _fecha(creada), {"reviews": signo, "rating_sum": signo * (rating or 0)}
+
+
+def favorito(relacion, signo):
+    # Sin leer de la base: en post_delete la fila ya no existe
+    creada = relacion.__dict__.get("created_at")
+    if creada is None:
+        recalcular_stats([relacion.cafe_id])
+        return
+    sumar_stats([(relacion.cafe_id, _fecha(creada), {"favorites": signo})])
+
+
+def recalcular_stats(cafe_ids=None):
+    """Rehace reseñas, favoritos y ratings por día desde las tablas originales."""
+    stats = CafeStat.objects.all()
+    reviews = Review.objects.all()
+    relaciones = CafeRelationship.objects.all()
+    if cafe_ids is not None:
+        stats = stats.filter(cafe_id__in=cafe_ids)
+        reviews = reviews.filter(cafe_id__in=cafe_ids)
+        relaciones = relaciones.filter(cafe_id__in=cafe_ids)
+
+    filas = [
+        (fila["cafe_id"], fila["dia"], {"reviews": fila["cantidad"], "rating_sum": fila["suma"] or 0})
+        for fila in (
+            reviews.annotate(dia=TruncDate("created_at"))
+            .values("cafe_id", "dia")
+            .annotate(cantidad=Count("id"), suma=Sum("rating"))
+        )
+    ]
+    filas += [
+        (fila["cafe_id"], fila["dia"], {"favorites": fila["cantidad"]})
+        for fila in (
+            relaciones.annotate(dia=TruncDate("created_at"))
+            .values("cafe_id", "dia")
+            .annotate(cantidad=Count("id"))
+        )
+    ]
+
+    with transaction.atomic():
+        stats.update(reviews=0, favorites=0, rating_sum=0)
+        for inicio in range(0, len(filas), 500):
+            sumar_stats(filas[inicio:inicio + 500])
+    return len(filas)
@@ -0,0 +1,210 @@
+"""
+Sincronización incremental del mapa del usuario (app mobile).
+
+La app guarda el `sync_token` de la última respuesta y pide solo lo que
+cambió desde ahí:
+
+  - `changed`: relaciones creadas o modificadas, o cuyo café cambió
+    (nombre, foto, promedio), con el resumen del café en el mismo JOIN.
+  - `deleted`: ids de cafés que salieron del mapa, desde las
+    `CafeRelationshipTombstone` que deja cada borrado.
+
+El token es el momento (ISO 8601) en que se leyó. Al volver se repasa
+`SOLAPE` hacia atrás para no perder escrituras que confirmaron tarde:
+algo puede llegar repetido, pero la app lo aplica como upsert. Sin token,
+o con uno más viejo que `RETENCION_TOMBSTONES`, se manda el mapa entero
+(`full`), y la app reemplaza lo que tenía.
+
+`aplicar_mutaciones` aplica en una transacción varios cambios de estado,
+colección y nota: o entran todos o ninguno.
+"""
+
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from reviews.models import Cafe, CafeRelationship, CafeRelationshipTombstone
+
+ESTADOS = (
+    CafeRelationship.WANT_TO_GO,
+    CafeRelationship.WANT_TO_RETURN,
+    CafeRelationship.VISITED,
+)
+COLECCIONES = ("read", "work", "slow", "rain", "talk")
+MAX_NOTA = 500
+
+# Máximo de cambios por POST
+MAX_MUTACIONES = 100
+# Se relee este margen antes del token (transacciones que confirman tarde)
+SOLAPE = timedelta(seconds=30)
+# Las tombstones más viejas se purgan: un token anterior pide sync completa
+RETENCION_TOMBSTONES = timedelta(days=90)
+
+_CAMPOS = (
+    "id", "cafe_id", "status", "collection", "private_note",
+    "second_impression", "updated_at",
+    "cafe__id", "cafe__name", "cafe__location", "cafe__address",
+    "cafe__photo1", "cafe__image_variants", "cafe__avg_rating",
+)
+
+
+class MutacionInvalida(Exception):
+    def __init__(self, indice, error, mensaje):
+        super().__init__(mensaje)
+        self.indice = indice
+        self.error = error
+        self.mensaje = mensaje
+
+
+# ---------------------------------
+# Lectura
+# ---------------------------------
+def leer_token(valor):
+    """
+    datetime del token (o de un timestamp ISO), None si no vino.
+    ValueError si no se puede leer.
+    """
+    if valor in (None, ""):
+        return None
+    momento = parse_datetime(valor) if isinstance(valor, str) else None
+    if momento is None:
+        raise ValueError(valor)
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento, dt_timezone.utc)
+    return momento
+
+
+def cambios_desde(user, desde=None):
+    """
+    (token, full, relaciones, ids borrados). `relaciones` trae el café
+    cargado (select_related) con solo los campos del resumen.
+    """
+    ahora = timezone.now()
+    relaciones = (
+        CafeRelationship.objects
+        .filter(user=user)
+        .select_related("cafe")
+        .only(*_CAMPOS)
+        .order_by("updated_at", "id")
+    )
+
+    full = desde is None or desde < ahora - RETENCION_TOMBSTONES
+    if full:
+        return ahora.isoformat(), True, list(relaciones), []
+
+    desde = desde - SOLAPE
+    relaciones = list(
+        relaciones.filter(Q(updated_at__gte=desde) | Q(cafe__updated_at__gte=desde))
+    )
+    # Si se volvió a agregar después de borrarlo, va solo en `changed`
+    borrados = list(
+        CafeRelationshipTombstone.objects
+        .filter(user=user, deleted_at__gte=desde)
+        .exclude(cafe_id__in=CafeRelationship.objects.filter(user=user).values("cafe_id"))
+        .values_list("cafe_id", flat=True)
+        .distinct()
+    )
+    return ahora.isoformat(), False, relaciones, sorted(borrados)
+
+
+# ---------------------------------
+# Escritura en lote
+# ---------------------------------
+def _validar(mutaciones):
+    """Forma y valores, antes de tocar la base."""
+    if not isinstance(mutaciones, list) or not mutaciones:
+        raise MutacionInvalida(None, "invalid_mutations", "No se enviaron cambios.")
+    if len(mutaciones) > MAX_MUTACIONES:
+        raise MutacionInvalida(
+            None, "too_many_mutations", f"Como mucho {MAX_MUTACIONES} cambios por envío.",
+        )
+
+    for i, mutacion in enumerate(mutaciones):
+        cafe_id = mutacion.get("cafe_id") if isinstance(mutacion, dict) else None
+        if not isinstance(cafe_id, int) or isinstance(cafe_id, bool):
+            raise MutacionInvalida(i, "invalid_mutation", "Falta el café.")
+        if not {"status", "collection", "private_note"} & set(mutacion):
+            raise MutacionInvalida(i, "invalid_mutation", "No hay nada para cambiar.")
+        if "status" in mutacion and mutacion["status"] not in (None, *ESTADOS):
+            raise MutacionInvalida(i, "invalid_status", "El estado enviado no es válido.")
+        if "collection" in mutacion and mutacion["collection"] not in (None, *COLECCIONES):
+            raise MutacionInvalida(i, "invalid_collection", "La colección enviada no es válida.")
+        if "private_note" in mutacion and not isinstance(mutacion["private_note"], str):
+            raise MutacionInvalida(i, "invalid_note", "La nota enviada no es válida.")
+
+
+def _bloquear_relaciones(user, cafe_ids):
+    """{cafe_id: relación} de las que ya existen, bloqueadas hasta el commit."""
+    return {
+        rel.cafe_id: rel
+        for rel in CafeRelationship.objects.select_for_update().filter(user=user, cafe_id__in=cafe_ids)
+    }
+
+
+def aplicar_mutaciones(user, mutaciones):
+    """
+    Aplica, en orden, cambios del tipo
+        {"cafe_id": 3, "status": "visited" | null, "collection": "work" | null,
+         "private_note": "..."}
+    (cada clave es opcional; `status: null` saca el café del mapa).
+    Lanza `MutacionInvalida` y no guarda nada si alguno falla.
+    """
+    _validar(mutaciones)
+
+    cafe_ids = {mutacion["cafe_id"] for mutacion in mutaciones}
+    existentes = set(Cafe.objects.filter(id__in=cafe_ids).values_list("id", flat=True))
+
+    with transaction.atomic():
+        relaciones = _bloquear_relaciones(user, cafe_ids)
+
+        for i, mutacion in enumerate(mutaciones):
+            cafe_id = mutacion["cafe_id"]
+            if cafe_id not in existentes:
+                raise MutacionInvalida(i, "cafe_not_found", "El café no existe.")
+            relacion = relaciones.get(cafe_id)
+
+            if "status" in mutacion:
+                estado = mutacion["status"]
+                if estado is None:
+                    if relacion is not None:
+                        relacion.delete()
+                        relaciones.pop(cafe_id)
+                    relacion = None
+                elif relacion is None:
+                    # select_for_update no bloquea una fila que todavía no
+                    # existe: si otro dispositivo la crea a la vez,
+                    # get_or_create toma la suya en vez de fallar el INSERT
+                    relacion, _ = CafeRelationship.objects.select_for_update().get_or_create(
+                        user=user, cafe_id=cafe_id, defaults={"status": estado},
+                    )
+                    relacion.status = estado
+                    relaciones[cafe_id] = relacion
+                else:
+                    relacion.status = estado
+
+            cambios = {campo for campo in ("collection", "private_note") if campo in mutacion}
+            if cambios and relacion is None:
+                raise MutacionInvalida(i, "relationship_not_found", "Primero agregá el café a tu mapa.")
+            if "collection" in mutacion:
+                relacion.collection = mutacion["collection"]
+            if "private_note" in mutacion:
+                relacion.private_note = mutacion["private_note"].strip()[:MAX_NOTA]
+
+            if relacion is not None:
+                # Un save() completo: también actualiza `updated_at`
+                relacion.save()
+
+    return len(mutaciones)
+
+
+# ---------------------------------
+# Mantenimiento
+# ---------------------------------
+def purgar_tombstones():
+    """Borra las tombstones más viejas que la retención. Devuelve cuántas."""
+    limite = timezone.now() - RETENCION_TOMBSTONES
+    borradas, _ = CafeRelationshipTombstone.objects.filter(deleted_at__lt=limite).delete()
+    return borradas
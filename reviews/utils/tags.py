@@ -1,6 +1,12 @@
 from collections import defaultdict
+
+from django.db.models import Count
+
 from reviews.models import Tag
 
+TOP_TAGS = 5
+
+
 def get_tags_grouped_by_cafe(cafes):
     grouped = defaultdict(lambda: defaultdict(list))
 
@@ -13,3 +19,26 @@ def get_tags_grouped_by_cafe(cafes):
             grouped[cafe_id][tag.category].append(tag)
 
     return grouped
+
+
+def top_tags_por_cafe(cafe_ids, limite=TOP_TAGS):
+    """
+    {cafe_id: [nombres]} con los tags más usados en las reseñas de cada
+    café (más usados primero, empate por nombre), en una sola consulta
+    agrupada por (café, tag) para todos los cafés.
+    """
+    top = {cafe_id: [] for cafe_id in cafe_ids}
+    if not top:
+        return top
+
+    filas = (
+        Tag.objects
+        .filter(reviews__cafe_id__in=top)
+        .values_list("reviews__cafe_id", "name")
+        .annotate(num=Count("id"))
+        .order_by("reviews__cafe_id", "-num", "name")
+    )
+    for cafe_id, nombre, _ in filas:
+        if len(top[cafe_id]) < limite:
+            top[cafe_id].append(nombre)
+    return top
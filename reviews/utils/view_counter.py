@@ -0,0 +1,154 @@
+"""
+Vistas del detalle de cada café (CafeStat) sin escribir en la base por
+cada visita.
+
+Cada vista suma con `cache.incr` en un contador por (día, café). La
+primera vista que ensucia un contador anota su key en una lista de
+pendientes (casilleros numerados con `cache.incr`), y cada tanto
+`volcar_vistas` lee solo esos contadores, los pasa a la tabla con un solo
+INSERT ... ON CONFLICT DO UPDATE (views = views + n) y les resta lo que
+volcó, así no se pierden las vistas que llegan mientras tanto.
+
+No cuentan los bots, el dueño mirando su propio café ni el mismo
+visitante (usuario, o IP + navegador si es anónimo) volviendo al mismo
+café dentro de `VENTANA_REPETIDAS`.
+"""
+
+import hashlib
+import re
+from datetime import date
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from core.jobs import enqueue
+from core.rate_limit import client_ip
+from reviews.models import Cafe
+from reviews.utils.rollups import sumar_stats
+
+# Un mismo visitante cuenta una vista por café cada 30 minutos
+VENTANA_REPETIDAS = 30 * 60
+# Volcado a la base como mucho cada 5 minutos
+INTERVALO_VOLCADO = 5 * 60
+# Los contadores sobreviven unos días por si el volcado se atrasa
+TTL_CONTADOR = 3 * 24 * 60 * 60
+
+# Lista de contadores pendientes: "vistas:pendiente:<n>" con n de 1 a
+# "vistas:pendientes"; "vistas:volcados" es hasta dónde ya se leyó
+ULTIMO_PENDIENTE = "vistas:pendientes"
+ULTIMO_VOLCADO = "vistas:volcados"
+
+_BOTS = re.compile(
+    r"bot|crawl|spider|slurp|archiver|facebookexternalhit|preview|"
+    r"headless|lighthouse|pingdom|monitor|curl|wget|python-requests|httpclient",
+    re.IGNORECASE,
+)
+
+
+def es_bot(request):
+    user_agent = request.META.get("HTTP_USER_AGENT", "")
+    return not user_agent or bool(_BOTS.search(user_agent))
+
+
+def _visitante(request):
+    # Siempre la misma identidad para el mismo visitante: la sesión de un
+    # anónimo recién existe después de la primera respuesta y lo contaría dos veces
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"u{user.pk}"
+    crudo = f"{client_ip(request)}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return "c" + hashlib.sha1(crudo.encode()).hexdigest()[:16]
+
+
+def _key(fecha, cafe_id):
+    return f"vistas:{fecha.isoformat()}:{cafe_id}"
+
+
+def _incr(key, ttl):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, ttl)
+        return cache.incr(key)
+
+
+def _marcar_pendiente(key):
+    """Anota `key` en la lista de pendientes si todavía no está."""
+    if cache.add(f"vistas:sucio:{key}", True, TTL_CONTADOR):
+        n = _incr(ULTIMO_PENDIENTE, None)
+        cache.set(f"vistas:pendiente:{n}", key, TTL_CONTADOR)
+
+
+def registrar_vista(request, cafe):
+    """Suma una vista al café si corresponde. Devuelve si se contó."""
+    if es_bot(request):
+        return False
+
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated and user.pk == cafe.owner_id:
+        return False
+
+    if not cache.add(f"vistas:vista:{_visitante(request)}:{cafe.pk}", True, VENTANA_REPETIDAS):
+        return False
+
+    key = _key(timezone.localdate(), cafe.pk)
+    _incr(key, TTL_CONTADOR)
+    _marcar_pendiente(key)
+
+    # Un solo volcado programado por intervalo, sin tocar la base por vista
+    if cache.add("vistas:volcado_programado", True, INTERVALO_VOLCADO):
+        enqueue("reviews.flush_cafe_views", delay=INTERVALO_VOLCADO, dedupe_key="flush_cafe_views")
+    return True
+
+
+def volcar_vistas():
+    """
+    Pasa a CafeStat las vistas acumuladas en los contadores pendientes.
+    Devuelve cuántas vistas se volcaron.
+    """
+    ultimo = cache.get(ULTIMO_PENDIENTE) or 0
+    desde = cache.get(ULTIMO_VOLCADO) or 0
+    if desde > ultimo:
+        # Se perdió el contador de la lista: se relee desde el principio
+        desde = 0
+    if desde == ultimo:
+        return 0
+
+    casilleros = [f"vistas:pendiente:{n}" for n in range(desde + 1, ultimo + 1)]
+    keys = set(cache.get_many(casilleros).values())
+    # Se desmarcan antes de leer: una vista que llegue ahora los vuelve a anotar
+    cache.delete_many([f"vistas:sucio:{key}" for key in keys])
+
+    pendientes = {
+        key: n for key, n in cache.get_many(list(keys)).items() if n and n > 0
+    }
+    filas = []
+    if pendientes:
+        destinos = {}
+        for key in pendientes:
+            _, fecha, cafe_id = key.split(":")
+            destinos[key] = (int(cafe_id), date.fromisoformat(fecha))
+        # Las de cafés que ya no existen se descartan
+        existentes = set(
+            Cafe.objects.filter(id__in={cafe_id for cafe_id, _ in destinos.values()})
+            .values_list("id", flat=True)
+        )
+        filas = [
+            (*destinos[key], {"views": n}) for key, n in pendientes.items()
+            if destinos[key][0] in existentes
+        ]
+        with transaction.atomic():
+            sumar_stats(filas)
+
+    # Recién con las vistas guardadas se da la lista por leída
+    cache.delete_many(casilleros)
+    cache.set(ULTIMO_VOLCADO, ultimo, None)
+
+    # Se descuenta lo volcado: lo que entró mientras tanto queda para la próxima
+    for key, n in pendientes.items():
+        try:
+            cache.decr(key, n)
+        except ValueError:
+            pass
+    return sum(deltas["views"] for _, _, deltas in filas)
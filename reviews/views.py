@@ -2,12 +2,13 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Avg, Count, F, Q, Sum
+from django.db.models.functions import Coalesce
 from django.views.generic import ListView, CreateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy, reverse
 from django.core.exceptions import PermissionDenied
 from collections import defaultdict
-from django.core.paginator import Paginator
+from django.core.paginator import Page, Paginator
 from django.http import JsonResponse, HttpResponseForbidden
 from django.core.serializers.json import DjangoJSONEncoder
 from django.templatetags.static import static
@@ -17,22 +18,31 @@ from django.views.decorators.http import require_POST
 from django.conf import settings
 from allauth.account.utils import send_email_confirmation
 import requests
-import qrcode
-from io import BytesIO
-import os, json
+import os, json, math
 from core.mixins import EmailVerifiedRequiredMixin
 from allauth.account.models import EmailAddress
-from core.rate_limit import rate_limit
-from reviews.utils.ranking import calcular_score_cafe
+from core.rate_limit import rate_limit, rate_limited
+from reviews.utils.ranking import (
+    CafesRankeados,
+    aplicar_personalizacion,
+    proyeccion_snapshot,
+)
 from .models import Review, Cafe, ReviewLike, ReviewReport, Tag, CafeStat, CafeRelationship, CafeWhisper
 from .forms import ReviewForm, CafeForm, ReviewReportForm
-from reviews.utils.geo import haversine_distance
+from reviews.utils.cache import get_version
+from reviews.utils.view_counter import registrar_vista
+from reviews.utils.exports import exportar_csv, exportar_xlsx
+from reviews.utils.images import url_derivado
+from reviews.utils.qr_posters import datos_cafes, zip_en_streaming
+from core.jobs import enqueue
+from .jobs import QR_ARCHIVO_TTL, estado_qr_archivo
+from reviews.utils.geo_index import distancias_en_radio, mas_cercanos
+from reviews.utils.mapa import FEATURES as MAPA_FEATURES, datos_mapa
 from core.messages import MESSAGES
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpResponse
-from openpyxl import Workbook
+from django.http import Http404, StreamingHttpResponse
 from datetime import datetime
-import zipfile
+import uuid
 from django.contrib.postgres.search import (
     SearchVector,
     SearchQuery,
@@ -41,24 +51,6 @@ from django.contrib.postgres.search import (
 )
 
 
-# Helper para invalidar el fragment cache de la lista de reseñas
-def _invalidate_reviews_cache(cafe_id, user_id=None):
-    from django.core.cache.utils import make_template_fragment_key
-    from django.core.cache import cache
-
-    # El template usa: {% cache 600 cafe_reviews_list cafe.id user.id %}
-    posibles = [
-        make_template_fragment_key("cafe_reviews_list", [cafe_id, ""]),
-        make_template_fragment_key("cafe_reviews_list", [cafe_id, "None"]),
-    ]
-    if user_id:
-        posibles.append(make_template_fragment_key("cafe_reviews_list", [cafe_id, user_id]))
-
-    for k in posibles:
-        cache.delete(k)
-
-# ✅ cache fragment
-from django.core.cache.utils import make_template_fragment_key
 from django.core.cache import cache
 
 
@@ -207,6 +199,10 @@ class ReviewListView(ListView):
         return context
     
 
+# Radio (km) del listado cuando llega la ubicación del usuario
+RADIO_LISTADO_KM = 3
+
+
 class CafeListView(ListView):
     model = Cafe
     template_name = 'reviews/cafe_list.html'
@@ -224,12 +220,13 @@ class CafeListView(ListView):
 
         cafes = Cafe.objects.only(
             'id', 'name', 'location', 'latitude', 'longitude',
-            'photo1', 'photo2', 'photo3',
+            'photo1', 'photo2', 'photo3', 'image_variants',
             'visibility_level',
             'is_vegan_friendly', 'is_pet_friendly', 'has_wifi',
             'has_outdoor_seating', 'has_parking', 'is_accessible',
             'has_vegetarian_options', 'serves_breakfast', 'serves_alcohol',
-            'has_books_or_games', 'has_air_conditioning'
+            'has_books_or_games', 'has_air_conditioning',
+            'avg_rating',
 )
         if search:
             query = SearchQuery(search)
@@ -250,14 +247,27 @@ class CafeListView(ListView):
             if request.GET.get(field) == "on":
                 cafes = cafes.filter(**{field: True})
 
-        # Alias para que la tarjeta lea avg_rating / num_reviews
+        # Alias sobre los agregados guardados, para que la tarjeta lea
+        # avg_rating / num_reviews / precio_promedio sin joinear reseñas
         cafes = cafes.annotate(
-            average_rating=Avg('reviews__rating'),
-            avg_rating=Avg('reviews__rating'),
-            total_reviews=Count('reviews'),
-            num_reviews=Count('reviews'),
-            precio_promedio=Avg('reviews__precio_capuccino'),
-        ).prefetch_related('relationships')
+            average_rating=F('avg_rating'),
+            total_reviews=F('review_count'),
+            num_reviews=F('review_count'),
+            precio_promedio=F('avg_capuccino_price'),
+        )
+
+        try:
+            user_lat = float(lat) if lat else None
+            user_lon = float(lon) if lon else None
+        except ValueError:
+            user_lat = user_lon = None
+
+        # Filtro por ubicación (3 km): las distancias a todo el catálogo
+        # salen del índice geográfico en memoria, de una sola vez
+        distancias = None
+        if user_lat is not None and user_lon is not None:
+            distancias = distancias_en_radio(user_lat, user_lon, RADIO_LISTADO_KM)
+            cafes = cafes.filter(id__in=list(distancias))
 
         if orden == 'rating':
             cafes = cafes.order_by('-average_rating')
@@ -267,34 +277,27 @@ class CafeListView(ListView):
 
         else:
             # 🔥 ALGORITMO POR DEFECTO
-            cafes = list(cafes)
-
-            cafes_vistos = request.session.get("cafes_vistos", [])
-
-            for cafe in cafes:
-                cafe.score = calcular_score_cafe(
-                    cafe,
-                    user=request.user if request.user.is_authenticated else None,
-                    user_lat=float(lat) if lat else None,
-                    user_lon=float(lon) if lon else None,
-                    cafes_vistos_ids=cafes_vistos,
-                )
-
-            cafes.sort(key=lambda c: c.score, reverse=True)
+            # El score base de cada café ya está guardado (CafeRankingSnapshot);
+            # acá solo se suma la parte personal y se traen los Cafe completos
+            # de la página que se va a mostrar.
+            filas = proyeccion_snapshot(cafes)
+
+            scores = aplicar_personalizacion(
+                filas,
+                user=request.user if request.user.is_authenticated else None,
+                user_lat=user_lat,
+                user_lon=user_lon,
+                cafes_vistos_ids=request.session.get("cafes_vistos", []),
+                distancias=distancias,
+            )
 
+            filas.sort(key=lambda fila: scores[fila.id], reverse=True)
 
-        # Filtro por ubicación (3 km)
-        if lat and lon:
-            try:
-                lat = float(lat)
-                lon = float(lon)
-                cafes = [
-                    cafe for cafe in cafes
-                    if cafe.latitude and cafe.longitude and
-                    haversine_distance(lat, lon, cafe.latitude, cafe.longitude) <= 3
-                ]
-            except ValueError:
-                pass
+            return CafesRankeados(
+                [fila.id for fila in filas],
+                scores,
+                cafes.defer(None).prefetch_related('tags'),
+            )
 
         return cafes
 
@@ -377,11 +380,37 @@ class CafeListView(ListView):
         return context
 
 
-def cafe_detail(request, cafe_id):
-    cafe = get_object_or_404(Cafe, id=cafe_id)
-
-    # ⭐ NUEVO — highlight desde URL (?highlight=ID)
-    highlight_id = request.GET.get("highlight")
+# Minutos que dura el contexto público del detalle; igual se invalida por
+# versión apenas cambia algo del café (ver signals)
+CAFE_DETAIL_CACHE_TIMEOUT = 60 * 10
+
+
+def _cafe_detail_publico(cafe_id, page):
+    """
+    Todo lo del detalle que es igual para cualquier visitante: el café con
+    sus estadísticas, radar, resumen emocional, tags, fotos, recomendados,
+    susurros y la página de reseñas pedida.
+    """
+    # El café y sus estadísticas en una sola consulta: los agregados de
+    # reseñas ya están guardados en el café y las relaciones se cuentan
+    # por estado con agregados condicionales
+    cafe = get_object_or_404(
+        Cafe.objects.annotate(
+            want_to_go_count=Count(
+                "relationships",
+                filter=Q(relationships__status=CafeRelationship.WANT_TO_GO),
+            ),
+            want_to_return_count=Count(
+                "relationships",
+                filter=Q(relationships__status=CafeRelationship.WANT_TO_RETURN),
+            ),
+            visited_count=Count(
+                "relationships",
+                filter=Q(relationships__status=CafeRelationship.VISITED),
+            ),
+        ),
+        id=cafe_id,
+    )
 
     # todas las reseñas de ese café
     reviews_qs = (
@@ -392,20 +421,20 @@ def cafe_detail(request, cafe_id):
         .order_by("-created_at")
     )
 
-    total_reviews = reviews_qs.count()
-    agg = reviews_qs.aggregate(avg=Avg("rating"))
-    average_rating = round(agg["avg"], 1) if agg["avg"] is not None else None
-    best_review = reviews_qs.order_by("-rating", "-created_at").first()
+    total_reviews = cafe.review_count
+    average_rating = round(cafe.avg_rating, 1) if cafe.avg_rating is not None else None
+    best_review = (
+        cafe.reviews
+        .select_related("user")
+        .order_by("-rating", "-created_at")
+        .first()
+    )
 
     # ⭐ promedio de precio del capuccino
-    precio_promedio = cafe.reviews.filter(
-        precio_capuccino__isnull=False
-    ).aggregate(
-        Avg("precio_capuccino")
-    )["precio_capuccino__avg"]
+    precio_promedio = cafe.avg_capuccino_price
 
     # % positivas
-    positives = reviews_qs.filter(rating__gte=4).count()
+    positives = cafe.positive_review_count
     positive_pct = int((positives / total_reviews) * 100) if total_reviews else 0
 
     # === RADAR EMOCIONAL GOTA V2 ===
@@ -437,16 +466,17 @@ def cafe_detail(request, cafe_id):
     }
 
 
-    tag_counts = (
-        Tag.objects
-        .filter(reviews__cafe=cafe)
-        .values("name")
-        .annotate(count=Count("id"))
+    # tags de las reseñas con su cantidad: una sola consulta que alimenta
+    # el radar y las tags más usadas
+    tag_counts = list(
+        Tag.objects.filter(reviews__cafe=cafe)
+        .annotate(num=Count("id"))
+        .order_by("-num", "name")
     )
 
     tag_dict = {
-        row["name"]: row["count"]
-        for row in tag_counts
+        tag.name: tag.num
+        for tag in tag_counts
     }
 
     radar_labels = list(EMOTIONAL_GROUPS.keys())
@@ -488,44 +518,122 @@ def cafe_detail(request, cafe_id):
         emotional_summary = summaries.get(top_emotion)
 
 
-    # paginado
+    # paginado (el total ya lo tenemos, no hace falta contar)
     paginator = Paginator(reviews_qs, 8)
-    page_obj = paginator.get_page(request.GET.get("page") or 1)
+    paginator.count = total_reviews
+    page_obj = paginator.get_page(page)
 
-    # fotos seguras
+    # fotos seguras: miniatura para la grilla, tamaño detalle para el visor
     safe_photos = []
     for idx in (1, 2, 3):
-        photo = getattr(cafe, f"photo{idx}", None)
-        title = getattr(cafe, f"photo{idx}_title", "") or cafe.name
-        if not photo:
-            continue
+        campo = f"photo{idx}"
+        title = getattr(cafe, f"{campo}_title", "") or cafe.name
         try:
-            url = photo.url
+            url = url_derivado(cafe, campo, "detail")
         except Exception:
             continue
-        safe_photos.append({"url": url, "title": title})
+        if not url:
+            continue
+        safe_photos.append({
+            "url": url,
+            "thumb": url_derivado(cafe, campo, "card"),
+            "title": title,
+        })
 
     # tags más usadas
-    tag_counts_qs = (
-        Tag.objects.filter(reviews__cafe=cafe)
-        .annotate(num=Count("id"))
-        .order_by("-num", "name")
-    )
-    top_tags = list(tag_counts_qs[:5])
-    more_tags = list(tag_counts_qs[5:])
+    top_tags = tag_counts[:5]
+    more_tags = tag_counts[5:]
 
     # recomendados
     recommended_cafes = (
-        Cafe.objects.annotate(average_rating=Avg("reviews__rating"))
-        .filter(average_rating__isnull=False)
+        Cafe.objects.filter(avg_rating__isnull=False)
         .exclude(id=cafe.id)
-        .order_by("-average_rating")[:4]
+        .annotate(
+            average_rating=F("avg_rating"),
+            num_reviews=F("review_count"),
+            precio_promedio=F("avg_capuccino_price"),
+        )
+        .order_by("-avg_rating")[:4]
+    )
+
+    whispers = list(
+        CafeWhisper.objects.filter(
+            cafe=cafe,
+            is_hidden=False
+        )[:12]
     )
 
+    # texto de cabecera
+    one_liner = None
+
+    if top_tags:
+        one_liner = f"Ideal: {top_tags[0].name}"
+    elif best_review and best_review.comment:
+        txt = best_review.comment.strip()
+        one_liner = txt[:90] + ("…" if len(txt) > 90 else "")
+
+    return {
+        "cafe": cafe,
+        "reviews": list(page_obj.object_list),
+        "page_number": page_obj.number,
+        "total_reviews": total_reviews,
+        "average_rating": average_rating,
+        "best_review": best_review,
+        "positive_pct": positive_pct,
+        "radar_labels": radar_labels,
+        "radar_values": radar_values,
+        "emotional_summary": emotional_summary,
+        "recommended_cafes": list(recommended_cafes),
+        "top_tags": top_tags,
+        "more_tags": more_tags,
+        "want_to_go_count": cafe.want_to_go_count,
+        "want_to_return_count": cafe.want_to_return_count,
+        "visited_count": cafe.visited_count,
+        "whispers": whispers,
+        "one_liner": one_liner,
+        "photos": safe_photos,
+        "precio_promedio": precio_promedio,
+    }
+
+
+def _numero_de_pagina(valor):
+    try:
+        return max(int(valor), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def cafe_detail(request, cafe_id):
+    # ⭐ NUEVO — highlight desde URL (?highlight=ID)
+    highlight_id = request.GET.get("highlight")
+    page = _numero_de_pagina(request.GET.get("page"))
+
+    # La parte pública se cachea por (café, página, versión): cualquier
+    # cambio en el café, sus reseñas, relaciones o susurros sube la versión
+    version = get_version("cafe_detail", cafe_id)
+    cache_key = f"cafe_detail:{cafe_id}:{version}:{page}"
+    publico = cache.get(cache_key)
+    if publico is None:
+        publico = _cafe_detail_publico(cafe_id, page)
+        # Páginas fuera de rango caen en otra: se guardan con su número real
+        cache.set(
+            f"cafe_detail:{cafe_id}:{version}:{publico['page_number']}",
+            publico,
+            CAFE_DETAIL_CACHE_TIMEOUT,
+        )
+
+    cafe = publico["cafe"]
+    reviews = publico["reviews"]
+
+    paginator = Paginator([], 8)
+    paginator.count = publico["total_reviews"]
+    page_obj = Page(reviews, publico["page_number"], paginator)
+
     # urls absolutas
     full_page_url = request.build_absolute_uri(
         reverse("reviews:cafe_detail", kwargs={"cafe_id": cafe.id})
     )
+    safe_photos = publico["photos"]
     if safe_photos:
         og_image_path = safe_photos[0]["url"]
     else:
@@ -541,31 +649,6 @@ def cafe_detail(request, cafe_id):
     second_impression = None
     collection = None
 
-    # estadísticas públicas (para usuarios logueados o no)
-    want_to_go_count = 0
-    want_to_return_count = 0
-    visited_count = 0
-
-    whispers = CafeWhisper.objects.filter(
-        cafe=cafe,
-        is_hidden=False
-    )[:12]
-    
-    want_to_go_count = CafeRelationship.objects.filter(
-        cafe=cafe,
-        status=CafeRelationship.WANT_TO_GO
-    ).count()
-
-    want_to_return_count = CafeRelationship.objects.filter(
-        cafe=cafe,
-        status=CafeRelationship.WANT_TO_RETURN
-    ).count()
-
-    visited_count = CafeRelationship.objects.filter(
-        cafe=cafe,
-        status=CafeRelationship.VISITED
-    ).count()
-
     if request.user.is_authenticated:
 
         liked_ids = set(
@@ -594,16 +677,9 @@ def cafe_detail(request, cafe_id):
             user_note = relationship.private_note or ""
             second_impression = relationship.second_impression
             collection = relationship.collection
-            
-
-    # texto de cabecera
-    one_liner = None
 
-    if top_tags:
-        one_liner = f"Ideal: {top_tags[0].name}"
-    elif best_review and best_review.comment:
-        txt = best_review.comment.strip()
-        one_liner = txt[:90] + ("…" if len(txt) > 90 else "")
+    # Vistas para las estadísticas del dueño (se acumulan en el cache)
+    registrar_vista(request, cafe)
 
     # === Diversidad: marcar café como visto ===
     vistos = request.session.get("cafes_vistos", [])
@@ -619,37 +695,22 @@ def cafe_detail(request, cafe_id):
         request,
         "reviews/cafe_detail.html",
         {
-            "cafe": cafe,
-            "reviews": page_obj.object_list,
+            **publico,
             "page_obj": page_obj,
-            "total_reviews": total_reviews,
-            "average_rating": average_rating,
-            "best_review": best_review,
-            "positive_pct": positive_pct,
-            "radar_labels": radar_labels,
-            "radar_values": radar_values,
-            "emotional_summary": emotional_summary,
-            "recommended_cafes": recommended_cafes,
-            "top_tags": top_tags,
-            "more_tags": more_tags,
-            "liked_ids": liked_ids,
+            # La lista de reseñas se cachea igual para todos: el estado de
+            # "me gusta" de cada usuario se aplica por JS fuera del fragmento
+            "reviews_version": get_version("cafe_reviews", cafe.id),
+            "liked_ids": sorted(liked_ids),
             "my_review": my_review,
             "user_status": user_status,
             "user_note": user_note,
             "second_impression": second_impression,
             "collection": collection,
-            "want_to_go_count": want_to_go_count,
-            "want_to_return_count": want_to_return_count,
-            "visited_count": visited_count,
-            "whispers": whispers,
-            "one_liner": one_liner,
             "full_page_url": full_page_url,
             "full_image_url": full_image_url,
             "cafe_list_abs": cafe_list_abs,
-            "photos": safe_photos,
 
             # ⭐ NUEVOS
-            "precio_promedio": precio_promedio,
             "highlight_id": int(highlight_id) if highlight_id and highlight_id.isdigit() else None,
 
                     # ✅ SEO
@@ -740,11 +801,6 @@ def create_review(request, cafe_id):
                     Tag.objects.filter(id__in=selected_tag_ids)
                 )
 
-            try:
-                _invalidate_reviews_cache(cafe.id, user_id=request.user.id)
-            except Exception:
-                pass
-
             messages.success(
                 request,
                 "¡Gracias por tu reseña!",
@@ -811,9 +867,6 @@ def edit_review(request, review_id):
             if "tags" in request.POST:
                 review.tags.set(Tag.objects.filter(id__in=selected_tag_ids))
 
-            key = make_template_fragment_key("cafe_reviews_list", [review.cafe_id])
-            cache.delete(key)
-
             messages.success(request, "Reseña actualizada correctamente.")
             return redirect("reviews:cafe_detail", cafe_id=review.cafe_id)
         else:
@@ -853,8 +906,6 @@ def delete_review(request, review_id):
 
     if request.method == 'POST':
         review.delete()
-        key = make_template_fragment_key("cafe_reviews_list", [cafe_id])
-        cache.delete(key)
         messages.success(request, "Reseña eliminada.")
         return redirect("reviews:cafe_detail", cafe_id=cafe_id)
 
@@ -871,8 +922,6 @@ def reply_review(request, review_id):
     if request.method == 'POST':
         review.owner_reply = request.POST.get('reply')
         review.save()
-        key = make_template_fragment_key("cafe_reviews_list", [review.cafe_id])
-        cache.delete(key)
         messages.success(request, "Respuesta guardada con éxito.")
         return redirect('reviews:cafe_detail', cafe_id=review.cafe.id)
 
@@ -897,9 +946,6 @@ class ReviewCreateView(LoginRequiredMixin, CreateView):
         tags = form.cleaned_data.get('tags')
         if tags:
             self.object.tags.set(tags)
-        if getattr(self.object, "cafe_id", None):
-            key = make_template_fragment_key("cafe_reviews_list", [self.object.cafe_id])
-            cache.delete(key)
         return response
 
 
@@ -936,10 +982,9 @@ def owner_reviews(request):
 
     for cafe in cafes:
         reviews = cafe.reviews.select_related('user').order_by('-rating', '-created_at')
-        average_rating = reviews.aggregate(avg=Avg('rating'))['avg']
         reseñas_por_cafe[cafe] = {
             'reviews': reviews,
-            'average_rating': round(average_rating, 1) if average_rating else None
+            'average_rating': round(cafe.avg_rating, 1) if cafe.avg_rating else None
         }
 
     return render(request, 'reviews/owner_reviews.html', {
@@ -1030,10 +1075,6 @@ def favorite_cafes(request):
         CafeRelationship.objects
         .filter(user=request.user)
         .select_related("cafe")
-        .annotate(
-            avg_rating=Avg("cafe__reviews__rating"),
-            num_reviews=Count("cafe__reviews", distinct=True),
-        )
     )
 
     want_to_go = []
@@ -1043,8 +1084,7 @@ def favorite_cafes(request):
     for rel in relationships:
 
         cafe = rel.cafe
-        cafe.avg_rating = rel.avg_rating
-        cafe.num_reviews = rel.num_reviews
+        cafe.num_reviews = cafe.review_count
 
         cafe.user_status = rel.status
         cafe.relationship_date = rel.updated_at
@@ -1107,7 +1147,7 @@ def update_cafe_note(request, cafe_id):
     note = note[:500]
 
     relationship.private_note = note
-    relationship.save(update_fields=["private_note",])
+    relationship.save(update_fields=["private_note", "updated_at"])
 
     if note:
 
@@ -1154,7 +1194,7 @@ def set_collection(request, cafe_id):
         return redirect("reviews:cafe_detail", cafe_id=cafe.id)
 
     relationship.collection = value
-    relationship.save(update_fields=["collection"])
+    relationship.save(update_fields=["collection", "updated_at"])
 
     messages.success(
         request,
@@ -1267,6 +1307,7 @@ def set_second_impression(request, cafe_id):
 
     relationship.save(update_fields=[
         "second_impression",
+        "updated_at",
     ])
 
     messages.success(
@@ -1309,6 +1350,7 @@ def set_cafe_status(request, cafe_id):
         key=f"cafe-status:{request.user.id}",
         limit=20,
         window_seconds=60,
+        request=request,
         ajax=True,
         message="Demasiadas acciones en poco tiempo."
     )
@@ -1403,8 +1445,6 @@ def edit_owner_reply(request, review_id):
     if request.method == 'POST':
         review.owner_reply = request.POST.get('reply')
         review.save()
-        key = make_template_fragment_key("cafe_reviews_list", [review.cafe_id])
-        cache.delete(key)
         messages.success(request, "Respuesta del dueño actualizada correctamente.")
 
     return redirect('reviews:owner_reviews')
@@ -1417,23 +1457,13 @@ def nearby_cafes(request):
     except (TypeError, ValueError):
         return JsonResponse({'error': 'Coordenadas inválidas'}, status=400)
 
-    def haversine(lat1, lon1, lat2, lon2):
-        from math import radians, sin, cos, asin, sqrt
-        R = 6371.0
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-        a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-        c = 2 * asin(sqrt(a))
-        return R * c
-
-    cafes = Cafe.objects.exclude(latitude__isnull=True).exclude(longitude__isnull=True)
-    cafes_con_distancia = []
-
-    for cafe in cafes:
-        distancia = haversine(lat, lon, cafe.latitude, cafe.longitude)
-        cafes_con_distancia.append((cafe, distancia))
-
-    cafes_ordenados = sorted(cafes_con_distancia, key=lambda x: x[1])[:10]
+    cercanos = mas_cercanos(lat, lon, 10)
+    cafes = Cafe.objects.only('id', 'name', 'address', 'location').in_bulk(
+        [cafe_id for cafe_id, _ in cercanos]
+    )
+    cafes_ordenados = [
+        (cafes[cafe_id], dist) for cafe_id, dist in cercanos if cafe_id in cafes
+    ]
 
     data = [
         {
@@ -1538,35 +1568,32 @@ def planes_view(request):
 
 
 def mapa_cafes(request):
-    cafes_qs = Cafe.objects.exclude(latitude__isnull=True, longitude__isnull=True)
+    # Los cafés los pide el mapa a `mapa_datos` según el viewport
+    return render(request, "reviews/mapa_cafes.html", {"mapa_features": list(MAPA_FEATURES)})
 
-    BOOL_FIELDS = [
-        "is_pet_friendly", "has_wifi", "has_outdoor_seating", "is_vegan_friendly",
-        "has_parking", "is_accessible", "has_vegetarian_options", "serves_breakfast",
-        "serves_alcohol", "has_books_or_games", "has_air_conditioning",
-        "has_gluten_free", "has_specialty_coffee", "has_artisanal_pastries",
-    ]
 
-    cafes_data = []
-    for c in cafes_qs:
-        item = {
-            "id": c.id,
-            "name": c.name,
-            "latitude": float(c.latitude) if c.latitude is not None else None,
-            "longitude": float(c.longitude) if c.longitude is not None else None,
-            "address": c.address,
-            "location": c.location,
-            "url": reverse("reviews:cafe_detail", kwargs={"cafe_id": c.id}),
-        }
-        for f in BOOL_FIELDS:
-            item[f] = bool(getattr(c, f, False))
-        cafes_data.append(item)
+def mapa_datos(request):
+    """
+    Clusters o cafés del viewport para Leaflet.
+    GET ?bbox=oeste,sur,este,norte&zoom=12&f=<máscara de características>
+    """
+    try:
+        oeste, sur, este, norte = (float(v) for v in request.GET.get("bbox", "").split(","))
+        zoom = int(request.GET.get("zoom", ""))
+        filtro = int(request.GET.get("f") or 0)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Parámetros inválidos"}, status=400)
+    if not all(math.isfinite(v) for v in (oeste, sur, este, norte)):
+        return JsonResponse({"error": "Parámetros inválidos"}, status=400)
 
-    return render(
-        request,
-        "reviews/mapa_cafes.html",
-        {"cafes_json": json.dumps(cafes_data, cls=DjangoJSONEncoder)},
-    )
+    data = datos_mapa(oeste, sur, este, norte, zoom, filtro)
+    data["features"] = list(MAPA_FEATURES)
+    # Una sola URL armada: el cliente reemplaza {id}
+    data["url"] = reverse("reviews:cafe_detail", kwargs={"cafe_id": 0}).replace("/0/", "/{id}/")
+
+    response = JsonResponse(data)
+    response["Cache-Control"] = "public, max-age=60"
+    return response
 
 
 @login_required
@@ -1620,6 +1647,7 @@ def analytics_dashboard(request):
 
 @require_POST
 @login_required
+@rate_limited(60, 60, message="Demasiados me gusta en poco tiempo.")
 def toggle_review_like(request, review_id):
     review = get_object_or_404(Review, pk=review_id)
 
@@ -1691,49 +1719,55 @@ def founder_analytics(request):
         start_date = None
         end_date = None
 
-    cafes = Cafe.objects.select_related("owner")
-
+    # Todo sale de los rollups diarios de CafeStat: sin joins con reseñas
+    # ni favoritos. Con rango, reseñas y favoritos son los creados en él.
+    en_rango = None
+    stats_qs = CafeStat.objects.all()
     if start_date and end_date:
-        cafes = cafes.annotate(
-            total_views=Sum(
-                "stats__views",
-                filter=Q(stats__date__range=(start_date, end_date))
-            )
-        )
-    else:
-        cafes = cafes.annotate(
-            total_views=Sum("stats__views")
+        en_rango = Q(stats__date__range=(start_date, end_date))
+        stats_qs = stats_qs.filter(date__range=(start_date, end_date))
+
+    cafes_qs = (
+        Cafe.objects.select_related("owner")
+        .annotate(
+            total_views=Coalesce(Sum("stats__views", filter=en_rango), 0),
+            total_reviews=Coalesce(Sum("stats__reviews", filter=en_rango), 0),
+            total_favorites=Coalesce(Sum("stats__favorites", filter=en_rango), 0),
         )
+        .order_by(F("total_views").desc(), "name")
+    )
 
-    cafes = cafes.annotate(
-        total_reviews=Count("reviews", distinct=True),
-        total_favorites=Count("relationships", distinct=True),
-        avg_rating=Avg("reviews__rating"),
-    ).order_by(F("total_views").desc(nulls_last=True))
-    # === TOTALES GLOBALES (KPIs) ===
+    # === EXPORT: mismas columnas y rango, en streaming ===
+    export = request.GET.get("export")
+    if export in ("excel", "csv"):
+        nombre = "gota_founder_analytics"
+        if start_date and end_date:
+            nombre += f"_{start_date.isoformat()}_{end_date.isoformat()}"
+        if export == "csv":
+            return exportar_csv(cafes_qs, nombre)
+        return exportar_xlsx(cafes_qs, nombre)
+
+    cafes = list(cafes_qs)
+
+    # === TOTALES GLOBALES (KPIs): una sola fila ===
+    kpis = stats_qs.aggregate(
+        views=Coalesce(Sum("views"), 0),
+        reviews=Coalesce(Sum("reviews"), 0),
+        favorites=Coalesce(Sum("favorites"), 0),
+    )
+    # Promedio de los promedios de cada café (ya cargados), como siempre
     ratings = [c.avg_rating for c in cafes if c.avg_rating]
-
     totals = {
-        "views": sum(c.total_views or 0 for c in cafes),
-        "reviews": sum(c.total_reviews or 0 for c in cafes),
-        "favorites": sum(c.total_favorites or 0 for c in cafes),
+        "views": kpis["views"],
+        "reviews": kpis["reviews"],
+        "favorites": kpis["favorites"],
         "avg_rating": round(sum(ratings) / len(ratings), 2) if ratings else None,
     }
 
     # === TOP CAFÉS POR VISITAS ===
-    top_cafes = (
-        cafes
-        .filter(total_views__gt=0)
-        .order_by("-total_views")[:5]
-    )
+    top_cafes = [c for c in cafes if c.total_views > 0][:5]
 
     # === EVOLUCIÓN DIARIA DE VISITAS (GLOBAL) ===
-    stats_qs = CafeStat.objects.filter(
-        cafe__in=cafes.values_list("id", flat=True)
-    )
-    if start_date and end_date:
-        stats_qs = stats_qs.filter(date__range=(start_date, end_date))
-
     daily = (
         stats_qs
         .values("date")
@@ -1744,11 +1778,6 @@ def founder_analytics(request):
     labels = [d["date"].strftime("%d/%m") for d in daily]
     values = [d["total"] or 0 for d in daily]
 
-    export = request.GET.get("export")
-
-    if export == "excel":
-        return export_founder_excel(cafes)
-
     return render(
         request,
         "reviews/founder_analytics.html",
@@ -1765,57 +1794,12 @@ def founder_analytics(request):
     )
 
 
-def export_founder_excel(cafes):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Founder Analytics"
-
-    headers = [
-        "Café",
-        "Dueño",
-        "Email dueño",
-        "Zona",
-        "Plan",
-        "Visitas",
-        "Reviews",
-        "Favoritos",
-        "Rating promedio",
-        "Creado",
-    ]
-    ws.append(headers)
-
-    PLAN_MAP = {
-        0: "Gratis",
-        1: "Destacado",
-        2: "Premium",
-    }
-
-    for c in cafes:
-        ws.append([
-            c.name,
-            c.owner.get_full_name() or c.owner.email,
-            c.owner.email,
-            c.location,
-            PLAN_MAP.get(c.visibility_level),
-            c.total_views or 0,
-            c.total_reviews,
-            c.total_favorites,
-            round(c.avg_rating, 1) if c.avg_rating else "",
-            c.created_at.strftime("%Y-%m-%d"),
-        ])
-
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = 'attachment; filename="gota_founder_analytics.xlsx"'
-
-    wb.save(response)
-    return response
-
 @staff_member_required
 def descargar_todos_qr(request):
-    from PIL import Image, ImageDraw, ImageFont
-
+    """
+    Descarga en el momento una tanda de carteles QR (ZIP en streaming).
+    Para todos los cafés de una vez está `generar_todos_qr`, en segundo plano.
+    """
     # parámetros
     try:
         limit = int(request.GET.get("limit", 50))
@@ -1829,7 +1813,8 @@ def descargar_todos_qr(request):
 
     zona = request.GET.get("zona", "").strip()
 
-    # límites de seguridad
+    # límites de seguridad: la tanda se arma dentro del request, en serie
+    # (el pool de procesos queda para la tarea en segundo plano)
     if limit <= 0:
         limit = 50
     if limit > 100:
@@ -1842,66 +1827,32 @@ def descargar_todos_qr(request):
     if zona:
         cafes = cafes.filter(location__icontains=zona)
 
-    cafes = cafes[offset:offset + limit]
+    datos = datos_cafes(cafes[offset:offset + limit], request.build_absolute_uri("/"))
 
-    response = HttpResponse(content_type='application/zip')
+    response = StreamingHttpResponse(zip_en_streaming(datos), content_type="application/zip")
     response['Content-Disposition'] = f'attachment; filename="qr_gota_cafes_{offset}_{offset+limit}.zip"'
+    return response
 
-    zip_buffer = zipfile.ZipFile(response, "w")
-
-    logo_path = os.path.join(settings.BASE_DIR, "static/images/gota-og.png")
-
-    for cafe in cafes:
-        review_url = request.build_absolute_uri(
-            reverse("reviews:create_review", args=[cafe.id])
-        )
-
-        # generar QR
-        qr = qrcode.make(review_url).convert("RGB")
-        qr = qr.resize((900, 900))
-
-        # lienzo final
-        width = 1000
-        height = 1400
-        img = Image.new("RGB", (width, height), "white")
-        draw = ImageDraw.Draw(img)
-
-        # logo
-        try:
-            logo = Image.open(logo_path).convert("RGBA")
-            logo.thumbnail((350, 350))
-            img.paste(logo, ((width - logo.width) // 2, 40), logo)
-            top_after_logo = 40 + logo.height + 40
-        except Exception:
-            top_after_logo = 120
-
-        # pegar QR
-        qr_x = (width - qr.width) // 2
-        img.paste(qr, (qr_x, top_after_logo))
-
-        # nombre del café
-        text = cafe.name
-
-        try:
-            font = ImageFont.truetype("DejaVuSans-Bold.ttf", 60)
-        except Exception:
-            font = ImageFont.load_default()
-
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_w = bbox[2] - bbox[0]
-        text_x = (width - text_w) // 2
-        text_y = top_after_logo + qr.height + 40
-
-        draw.text((text_x, text_y), text, fill="black", font=font)
-
-        # guardar en zip
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
 
-        safe_name = "".join(c for c in cafe.name if c.isalnum() or c in (" ", "_", "-")).strip()
-        filename = f"{safe_name.replace(' ', '_').lower()}.png"
+@staff_member_required
+@require_POST
+def generar_todos_qr(request):
+    """Encola el ZIP con los carteles de todos los cafés (o de una zona)."""
+    token = uuid.uuid4().hex
+    zona = request.POST.get("zona", "").strip()
+
+    cache.set(f"qr_archivo:{token}", {"estado": "pendiente"}, QR_ARCHIVO_TTL)
+    enqueue("reviews.generate_qr_archive", {
+        "token": token,
+        "base_url": request.build_absolute_uri("/"),
+        "zona": zona,
+    })
+    return redirect("reviews:estado_qrs", token=token)
 
-        zip_buffer.writestr(filename, buffer.getvalue())
 
-    zip_buffer.close()
-    return response
\ No newline at end of file
+@staff_member_required
+def estado_todos_qr(request, token):
+    estado = estado_qr_archivo(token)
+    if estado is None:
+        raise Http404("No existe esa descarga.")
+    return render(request, "reviews/qr_archive_status.html", {"estado": estado})
\ No newline at end of file
@@ -3,33 +3,21 @@ from __future__ import annotations
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
 from django.core.mail import send_mail
 from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
+from core.rate_limit import hit
 from reviews.models import Cafe
 from .forms import ClaimStartForm, ClaimVerifyEmailForm, ClaimEvidenceForm
 from .claims import ClaimRequest, ClaimStatus, ClaimMethod, ClaimEvidence
 from reviews.utils.ownership import assign_owner
 
 
-RATE_LIMIT_KEY = "claim_attempts_u{uid}"
 RATE_LIMIT_MAX = 3           # intentos por día
 RATE_LIMIT_TTL = 60 * 60 * 24
 
 
-def _rate_limit(user) -> bool:
-    if not user.is_authenticated:
-        return False
-    key = RATE_LIMIT_KEY.format(uid=user.id)
-    val = cache.get(key, 0)
-    if val >= RATE_LIMIT_MAX:
-        return True
-    cache.set(key, val + 1, RATE_LIMIT_TTL)
-    return False
-
-
 @login_required
 def claim_start(request, cafe_id):
     cafe = get_object_or_404(Cafe, pk=cafe_id)
@@ -39,7 +27,7 @@ def claim_start(request, cafe_id):
         return redirect("reviews:cafe_detail", cafe_id=cafe.id)
 
     if request.method == "POST":
-        if _rate_limit(request.user):
+        if not hit(f"claim-start:u{request.user.id}", RATE_LIMIT_MAX, RATE_LIMIT_TTL, request=request).allowed:
             messages.error(request, "Demasiados intentos hoy. Probá de nuevo mañana.")
             return redirect("reviews:cafe_detail", cafe_id=cafe.id)
 
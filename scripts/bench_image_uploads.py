@@ -0,0 +1,97 @@
+"""
+Pico de memoria al procesar una foto subida: decodificación completa (como
+hacían `resize_and_compress` y `CustomUser.save`) contra `core.uploads`.
+
+Cada medición corre en un proceso aparte y reporta cuánto subió su RSS
+máximo, así los bitmaps de una no ensucian la otra.
+
+    python scripts/bench_image_uploads.py            # 12 y 24 MP
+    python scripts/bench_image_uploads.py 6000x4000  # medidas a elección
+"""
+
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings  # noqa: E402
+
+if not settings.configured:
+    settings.configure()
+
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from core.uploads import MAX_LADO, procesar_subida  # noqa: E402
+
+MEDIDAS_POR_DEFECTO = [(4000, 3000), (6000, 4000)]
+
+
+def _maxrss_mb():
+    # Linux lo da en KB (macOS en bytes)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 if sys.platform != "darwin" else maxrss / (1024 * 1024)
+
+
+def sin_acotar(datos):
+    img = Image.open(BytesIO(datos))
+    img.load()
+    img = img.convert("RGB")
+    img.thumbnail((1600, 1600), Image.LANCZOS)
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=80)
+
+
+def acotado(datos, max_lado=MAX_LADO):
+    procesar_subida(SimpleUploadedFile("foto.jpg", datos, content_type="image/jpeg"), max_lado=max_lado)
+
+
+ESTRATEGIAS = {
+    "decodificación completa": sin_acotar,
+    f"core.uploads ({MAX_LADO}px)": acotado,
+    "core.uploads (avatar 512)": lambda datos: acotado(datos, 512),
+}
+
+
+def _medir(nombre, ruta, cola):
+    with open(ruta, "rb") as f:
+        datos = f.read()
+    antes = _maxrss_mb()
+    inicio = time.perf_counter()
+    ESTRATEGIAS[nombre](datos)
+    cola.put((time.perf_counter() - inicio, _maxrss_mb() - antes))
+
+
+def medir(nombre, ruta):
+    cola = multiprocessing.Queue()
+    proceso = multiprocessing.Process(target=_medir, args=(nombre, ruta, cola))
+    proceso.start()
+    resultado = cola.get()
+    proceso.join()
+    return resultado
+
+
+def main():
+    medidas = [tuple(int(n) for n in arg.split("x")) for arg in sys.argv[1:]] or MEDIDAS_POR_DEFECTO
+
+    for ancho, alto in medidas:
+        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f:
+            Image.effect_noise((ancho, alto), 64).convert("RGB").save(f, format="JPEG", quality=90)
+            ruta = f.name
+        try:
+            peso = os.path.getsize(ruta) / (1024 * 1024)
+            print(f"\n{ancho}x{alto} ({ancho * alto / 1e6:.0f} MP, {peso:.1f} MB en disco)")
+            for nombre in ESTRATEGIAS:
+                segundos, pico = medir(nombre, ruta)
+                print(f"  {nombre:<27} pico +{pico:7.1f} MB   {segundos * 1000:7.0f} ms")
+        finally:
+            os.remove(ruta)
+
+
+if __name__ == "__main__":
+    main()